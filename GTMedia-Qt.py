@@ -1,29 +1,58 @@
+import startup
 import ctypes
+import multiprocessing
 import os
 import sys
-import vlc
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-import requests
-import json
-import pyperclip
-from pypresence import Presence
 import time
+from catalog_cache import CatalogCache, diff_catalogs
+from catalog_loader import CatalogLoader
+from discord_presence import DiscordPresence
+import mosaic
+from playback_supervisor import PlaybackSupervisor
+import stb_client
+from qt_mosaic import MosaicWindow
+from qt_service_model import PREVIEW_SIZE, PreviewIcons, create_service_view
+from qt_workers import WorkerPool
+from recorder import Recorder
+from service_index import ServiceIndex, rows_matching
+import telemetry
+from thumbnails import PreviewPipeline, ThumbnailCache
+import vlc_shared
+from zapper import Zapper
 
 discord_id = "1269853518005665845"
-RPC = Presence(discord_id)
-RPC.connect()
 
 myappid = u'emina-media.gtmedia.sat2ip' # arbitrary string
-ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
+if sys.platform == "win32":
+    ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
+
+# Only needed once the user reaches for a feature; imported in the
+# background after the window is shown, see MainWindow.start_background_services
+PRELOADED_MODULES = ("requests", "signal_monitor", "ts_analyzer", "discovery", "stream_relay", "pyperclip")
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
     base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
     return os.path.join(base_path, relative_path)
 
+MONITORED_FIELDS = {
+    "Signal Intensity": "intensity",
+    "Signal Quality": "quality",
+    "Receive Rate": "rev_rate",
+    "Send Rate": "send_rate"
+}
+
 class MainWindow(QMainWindow):
+    monitor_sample = pyqtSignal(object, object, object)
+    monitor_failed = pyqtSignal(object)
+    audio_tracks_changed = pyqtSignal()
+    analysis_report = pyqtSignal(object)
+    analysis_failed = pyqtSignal(object)
+    playback_changed = pyqtSignal()
+
     def __init__(self, *args, **kwargs):
         super(MainWindow, self).__init__(*args, **kwargs)
         self.setWindowTitle("GTmedia SAT2IP Services")
@@ -67,6 +96,10 @@ class MainWindow(QMainWindow):
         self.get_button = QPushButton("Get Services", self)
         self.get_button.clicked.connect(self.get_services)
         self.layout.addWidget(self.get_button)
+
+        self.discover_button = QPushButton("Discover Receivers", self)
+        self.discover_button.clicked.connect(self.discover_receivers)
+        self.layout.addWidget(self.discover_button)
         
         self.main_frame = QHBoxLayout()
         self.layout.addLayout(self.main_frame)
@@ -74,11 +107,20 @@ class MainWindow(QMainWindow):
         self.services_frame = QVBoxLayout()
         self.main_frame.addLayout(self.services_frame)
         
-        self.services_list = QListWidget(self)
+        self.search_entry = QLineEdit(self)
+        self.search_entry.setMaximumWidth(200)
+        self.search_entry.setPlaceholderText("Search (sat: fq: $ -$)")
+        self.search_entry.setClearButtonEnabled(True)
+        self.search_entry.textChanged.connect(self.apply_search)
+        self.services_frame.addWidget(self.search_entry)
+
+        self.services_list = create_service_view(self)
         self.services_list.setMaximumWidth(200)
         self.services_list.setFont(QFont("Arial", 12))
-        self.services_list.itemClicked.connect(self.on_service_selected)
-        self.services_list.itemDoubleClicked.connect(self.on_service_double_clicked)
+        self.services_list.clicked.connect(self.on_service_selected)
+        self.services_list.doubleClicked.connect(self.on_service_double_clicked)
+        self.services_model = self.services_list.model()
+        self.service_index = ServiceIndex()
         self.services_frame.addWidget(self.services_list)
 
         self.description_frame = QVBoxLayout()
@@ -92,7 +134,7 @@ class MainWindow(QMainWindow):
 
         self.copy_button = QPushButton("Copy URL", self)
         self.copy_button.setEnabled(False)
-        self.copy_button.clicked.connect(lambda: self.copy_to_clipboard(self.get_corrected_url(self.services_list.currentItem().data(Qt.UserRole)['url'], self.current_audio_pid)))
+        self.copy_button.clicked.connect(lambda: self.copy_to_clipboard(self.get_corrected_url(self.current_service()['url'], self.current_audio_pid)))
         self.description_frame.addWidget(self.copy_button)
 
         self.fullscreen_button = QPushButton("Fullscreen", self)
@@ -100,7 +142,67 @@ class MainWindow(QMainWindow):
         self.fullscreen_button.clicked.connect(self.on_fullscreen_button_clicked)
         self.description_frame.addWidget(self.fullscreen_button)
         
+        self.monitor_button = QPushButton("Monitor Signal", self)
+        self.monitor_button.setCheckable(True)
+        self.monitor_button.toggled.connect(self.toggle_monitor)
+        self.description_frame.addWidget(self.monitor_button)
+
+        self.record_button = QPushButton("Record", self)
+        self.record_button.setEnabled(False)
+        self.record_button.clicked.connect(self.toggle_recording)
+        self.description_frame.addWidget(self.record_button)
+
+        self.recordings_label = QLabel("", self)
+        self.recordings_label.setWordWrap(True)
+        self.recordings_label.setVisible(False)
+        self.description_frame.addWidget(self.recordings_label)
+
+        self.relay_button = QPushButton("Play via Relay", self)
+        self.relay_button.setCheckable(True)
+        self.relay_button.setToolTip("Share one receiver stream with other local players")
+        self.relay_button.toggled.connect(self.toggle_relay)
+        self.description_frame.addWidget(self.relay_button)
+
+        self.playback_label = QLabel("", self)
+        self.playback_label.setWordWrap(True)
+        self.playback_label.setToolTip("Network caching chosen for this receiver and automatic reconnects")
+        self.description_frame.addWidget(self.playback_label)
+
+        self.export_history_button = QPushButton("Export Signal History", self)
+        self.export_history_button.setEnabled(False)
+        self.export_history_button.clicked.connect(self.export_signal_history)
+        self.description_frame.addWidget(self.export_history_button)
+
+        self.mosaic_button = QPushButton("Mosaic", self)
+        self.mosaic_button.setToolTip("Play the selected service and its neighbours side by side")
+        self.mosaic_button.clicked.connect(self.open_mosaic)
+        self.description_frame.addWidget(self.mosaic_button)
+        self.mosaic = None
+        # Read by the preview thread, so only ever replaced as a whole
+        self.mosaic_transponders = ()
+
+        self.previews_button = QPushButton("Show Previews", self)
+        self.previews_button.setCheckable(True)
+        self.previews_button.setToolTip("Grab a picture of each free-to-air service in the background")
+        self.previews_button.toggled.connect(self.toggle_previews)
+        self.description_frame.addWidget(self.previews_button)
+        self.previews_label = QLabel("", self)
+        self.previews_label.setWordWrap(True)
+        self.previews_label.setVisible(False)
+        self.description_frame.addWidget(self.previews_label)
+        self.preview_pipeline = None
+        self.preview_icons = None
+        self.previews_timer = QTimer(self)
+        self.previews_timer.setInterval(1000)
+        self.previews_timer.timeout.connect(lambda: self.previews_label.setText(str(self.preview_pipeline.stats)))
+
+        self.stats_button = QPushButton("Performance Stats", self)
+        self.stats_button.clicked.connect(self.show_stats)
+        self.description_frame.addWidget(self.stats_button)
+        self.stats_dialog = None
+
         self.info_labels = {}
+        self.sparklines = {}
         for info in ["Service Name", "Satellite Name", "Frequency", "PID", "Signal Intensity", "Signal Quality", "Receive Rate", "Send Rate"]:
             label = QLabel(info + ":", self)
             self.description_frame.addWidget(label)
@@ -109,26 +211,116 @@ class MainWindow(QMainWindow):
             value_label.setFont(QFont("Arial", 12))
             self.description_frame.addWidget(value_label)
             self.info_labels[info] = value_label
-        
+            if info in MONITORED_FIELDS:
+                sparkline = Sparkline(self)
+                sparkline.setVisible(False)
+                self.description_frame.addWidget(sparkline)
+                self.sparklines[info] = sparkline
+
+        self.analysis_box = QGroupBox("Stream Analysis", self)
+        analysis_layout = QVBoxLayout(self.analysis_box)
+        self.analyze_button = QPushButton("Analyze Stream", self)
+        self.analyze_button.setCheckable(True)
+        self.analyze_button.setEnabled(False)
+        self.analyze_button.toggled.connect(self.toggle_analysis)
+        analysis_layout.addWidget(self.analyze_button)
+        self.analysis_summary = QLabel("", self)
+        self.analysis_summary.setWordWrap(True)
+        analysis_layout.addWidget(self.analysis_summary)
+        self.analysis_table = QTableWidget(0, 4, self)
+        self.analysis_table.setHorizontalHeaderLabels(["PID", "Mbit/s", "CC errors", "TEI"])
+        self.analysis_table.verticalHeader().setVisible(False)
+        self.analysis_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.analysis_table.setMaximumHeight(140)
+        analysis_layout.addWidget(self.analysis_table)
+        self.description_frame.addWidget(self.analysis_box)
+        self.stream_analysis = None
+        self.analysis_service = None
+        self.analysis_report.connect(self.show_analysis)
+        self.analysis_failed.connect(lambda error: self.analysis_summary.setText(f"Analysis failed: {error}"))
+
         self.player_frame = QFrame(self)
         self.player_frame.setMinimumSize(800, 500)
         self.player_frame.setStyleSheet("background-color: black;")
         self.main_frame.addWidget(self.player_frame)
         
-        self.vlc_instance = vlc.Instance("--verbose 0")
-        self.vlc_player = self.vlc_instance.media_player_new()
-        if sys.platform.startswith('linux'):
-            self.vlc_player.set_xwindow(self.player_frame.winId())
-        elif sys.platform == "win32":
-            self.vlc_player.set_hwnd(self.player_frame.winId())
+        # libvlc starts in the background; the zapper plays once it is up
+        self.vlc_instance = None
+        self.vlc_player = None
+        self.zapper = Zapper()
+        # Reconnects dead streams; reports from its own thread, see update_playback_status
+        self.supervisor = PlaybackSupervisor(self.zapper, on_change=self.playback_changed.emit)
+        self.playback_changed.connect(self.update_playback_status)
+        self.stream_relay = None
+        self.recorder = Recorder()
+        self.recordings_timer = QTimer(self)
+        self.recordings_timer.setInterval(1000)
+        self.recordings_timer.timeout.connect(self.update_recordings)
+        self.player_frame.installEventFilter(self)
+        self.hidden_for_fullscreen = None
+        for key in (Qt.Key_Escape, Qt.Key_F11):
+            QShortcut(QKeySequence(key), self, activated=self.leave_fullscreen)
         
         self.current_audio_pid = None
+        self.workers = WorkerPool(parent=self)
+
+        self.signal_monitor = None
+        self.monitor_sample.connect(self.show_signal_sample)
+        self.monitor_failed.connect(lambda error: print(f"Signal monitor: {error}"))
+        self.monitored_service = None
+
+        self.catalog_cache = CatalogCache()
+        self.catalog_ip = None
+        self.audio_tracks_changed.connect(self.populate_audio_tracks)
+        self.presence = DiscordPresence(discord_id)
 
-        self.media_event_manager = self.vlc_player.event_manager()
-        self.media_event_manager.event_attach(vlc.EventType.MediaPlayerMediaChanged, self.on_media_changed)
-        
         self.show()
-        RPC.update(state="Not running any service", details="Idle", large_image="general")
+        # Runs on the first pass of the event loop, before the catalog refresh
+        QTimer.singleShot(0, self.start_background_services)
+        self.show_cached_services()
+
+    def start_background_services(self):
+        startup.interactive("GTMedia-Qt")
+        telemetry.metrics.configure_from_environment()
+        self.workers.submit("vlc", lambda task: vlc_shared.get_instance(),
+                            on_done=self.on_vlc_ready, on_error=self.on_vlc_failed)
+        self.presence.start()
+        self.presence.update(state="Not running any service", details="Idle", large_image="general")
+        startup.preload(*PRELOADED_MODULES)
+
+    def on_vlc_ready(self, instance):
+        import vlc
+
+        self.vlc_instance = instance
+        self.vlc_player = instance.media_player_new()
+        vlc_shared.attach_to_widget(self.vlc_player, int(self.player_frame.winId()))
+        # Let mouse and key events reach Qt so fullscreen can be left from the video
+        self.vlc_player.video_set_mouse_input(False)
+        self.vlc_player.video_set_key_input(False)
+        # libvlc reports elementary streams as the demuxer finds them; its
+        # callbacks run on a libvlc thread, so hop to the GUI thread via a signal
+        self.media_event_manager = self.vlc_player.event_manager()
+        for event_type in (vlc.EventType.MediaPlayerMediaChanged, vlc.EventType.MediaPlayerESAdded,
+                           vlc.EventType.MediaPlayerESDeleted, vlc.EventType.MediaPlayerESSelected):
+            self.media_event_manager.event_attach(event_type, self.on_media_changed)
+        # Before the zapper, which starts the service already asked for
+        self.supervisor.attach(self.vlc_player)
+        self.zapper.attach(instance, self.vlc_player)
+        self.update_playback_status()
+        if self.zapper.current_url:
+            self.set_deinterlace_mode('linear')
+        print(f"libvlc ready after {startup.elapsed() * 1000:.0f} ms (initialized in {vlc_shared.init_time * 1000:.0f} ms)")
+
+    def update_playback_status(self):
+        self.playback_label.setText(self.supervisor.status())
+
+    def on_vlc_failed(self, error):
+        print(f"Video playback unavailable: {error}")
+        message = QLabel(f"Video playback unavailable:\n{error}", self.player_frame)
+        message.setStyleSheet("color: white;")
+        message.setAlignment(Qt.AlignCenter)
+        message.setWordWrap(True)
+        QVBoxLayout(self.player_frame).addWidget(message)
 
     def validate_ip(self, text):
         return text.isdigit() and 0 <= int(text) <= 255
@@ -139,66 +331,193 @@ class MainWindow(QMainWindow):
             return ".".join(ip_parts)
         return None
 
-    def get_services(self):
+    def get_client(self):
         ip_address = self.get_ip_address()
         if not ip_address:
             QMessageBox.critical(self, "Error", "Please enter a valid IP address.")
-            return
+            return None
+        return stb_client.get_client(ip_address)
 
-        count = 100
-        data = None
+    def set_ip_address(self, ip_address):
+        for entry, part in zip([self.ip_entry1, self.ip_entry2, self.ip_entry3, self.ip_entry4], ip_address.split(".")):
+            entry.setText(part)
 
-        while True:
-            full_url = f"http://{ip_address}:81/getallservices?count={count}"
-            try:
-                print(full_url)
-                response = requests.get(full_url)
-                response.raise_for_status()
-                data = response.json()
-            except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
-                QMessageBox.critical(self, "Error", f"Failed to fetch services: {e}")
-                return
+    def discover_receivers(self):
+        import discovery
 
-            if "pagetotal" not in data or "services" not in data:
-                QMessageBox.critical(self, "Error", "Invalid response format.")
-                return
+        network, ok = QInputDialog.getText(self, "Discover Receivers", "Networks to scan (CIDR, space separated):", text=discovery.local_subnet())
+        if not ok or not network.split():
+            return
+        self.discover_button.setEnabled(False)
+        self.discover_button.setText("Scanning...")
+        self.workers.submit("discovery", lambda task: discovery.discover(network.split()),
+                            on_done=self.on_receivers_found,
+                            on_error=self.on_discovery_failed)
+
+    def on_receivers_found(self, receivers):
+        self.discover_button.setEnabled(True)
+        self.discover_button.setText("Discover Receivers")
+        if not receivers:
+            QMessageBox.information(self, "Discover Receivers", "No receivers found.")
+            return
+        choices = [str(receiver) for receiver in receivers]
+        choice, ok = QInputDialog.getItem(self, "Discover Receivers", "Receivers found:", choices, 0, False)
+        if ok:
+            self.set_ip_address(receivers[choices.index(choice)].ip_address)
+            self.get_services()
+
+    def on_discovery_failed(self, error):
+        self.discover_button.setEnabled(True)
+        self.discover_button.setText("Discover Receivers")
+        QMessageBox.critical(self, "Error", f"Discovery failed: {error}")
+
+    def show_cached_services(self):
+        ip_address = self.catalog_cache.last_ip()
+        if not ip_address:
+            return
+        self.set_ip_address(ip_address)
+        started = time.perf_counter()
+        # Loaded on a worker so the window is usable before the list is filled;
+        # a Get Services click in the meantime takes over the slot
+        self.workers.submit("catalog", lambda task: self.catalog_cache.load(ip_address),
+                            on_done=lambda services: self.on_cached_services(ip_address, services, started),
+                            on_error=lambda error: self.get_services())
+
+    def on_cached_services(self, ip_address, services, started):
+        self.display_services(services)
+        self.set_catalog_ip(ip_address)
+        print(f"Showing {len(services)} cached services for {ip_address} after {(time.perf_counter() - started) * 1000:.1f} ms")
+        # Refresh in the background; only the differences are applied to the list
+        QTimer.singleShot(0, self.get_services)
 
-            if data["pagetotal"] <= 1:
-                break
-            count += 100
+    def get_services(self):
+        client = self.get_client()
+        if not client:
+            return
 
-        self.display_services(data["services"])
+        self.get_button.setEnabled(False)
+        loader = CatalogLoader(client)
+        refresh = client.ip_address == self.catalog_ip and len(self.services_model.store) > 0
+        if not refresh:
+            self.display_services([])
+            self.set_catalog_ip(client.ip_address)
+
+        def load(task):
+            services = loader.load(on_page=None if refresh else task.report)
+            self.catalog_cache.save(client.ip_address, services)
+            return services
+
+        self.workers.submit("catalog", load,
+                            on_done=lambda services: self.on_services_loaded(loader, services, refresh),
+                            on_error=self.on_services_failed,
+                            on_progress=self.append_services)
+
+    def set_catalog_ip(self, ip_address):
+        self.catalog_ip = ip_address
+        self.zapper.audio_choices = self.catalog_cache.load_audio_choices(ip_address)
+        if self.preview_pipeline:
+            self.preview_icons.loaded.clear()
+            self.preview_pipeline.set_client(stb_client.get_client(ip_address))
+
+    def on_services_loaded(self, loader, services, refresh):
+        self.get_button.setEnabled(True)
+        print(f"Loaded {loader.stats}")
+        if refresh:
+            diff = diff_catalogs(self.services_model.store, services)
+            self.services_model.apply_diff(diff)
+            self.service_index.apply_diff(diff)
+            if self.search_entry.text():
+                self.apply_search()
+            print(f"Catalog refresh: {diff}")
+
+    def on_services_failed(self, error):
+        self.get_button.setEnabled(True)
+        QMessageBox.critical(self, "Error", f"Failed to fetch services: {error}")
 
     def display_services(self, services):
-        self.services_list.clear()
-        for service in services:
-            item = QListWidgetItem(service["servicename"])
-            item.setData(Qt.UserRole, service)
-            if service["servicename"].startswith('$'):
-                item.setForeground(Qt.red)
-            self.services_list.addItem(item)
-
-    def on_service_selected(self, item):
-        service = item.data(Qt.UserRole)
+        self.services_model.clear()
+        self.service_index.clear()
+        self.append_services(services)
+
+    def append_services(self, services):
+        self.services_model.append_services(services)
+        self.service_index.extend(services)
+        if self.search_entry.text():
+            self.apply_search()
+
+    def apply_search(self):
+        started = time.perf_counter()
+        rows = rows_matching(self.service_index.query(self.search_entry.text()), self.services_model.store)
+        self.services_model.set_filter(rows)
+        if rows is not None:
+            print(f"Search matched {len(rows)} services in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def current_service(self):
+        return self.services_model.service(self.services_list.currentIndex())
+
+    def request_proginfo(self, service, on_done, volatile=True, slot="proginfo"):
+        client = self.get_client()
+        if not client:
+            return
+        # A newer request in the same slot supersedes one still in flight, so
+        # selecting, zapping, recording and analyzing each get their own; the
+        # client's cache answers repeated clicks and merges duplicate lookups.
+        # Callers that only need tuning data pass volatile=False so that stale
+        # signal readings alone do not cost a request
+        self.workers.submit(slot, lambda task: client.cached_proginfo(service['id'], volatile=volatile),
+                            on_done=lambda data: self.on_proginfo(service, data, on_done),
+                            on_error=lambda error: QMessageBox.critical(self, "Error", f"Failed to fetch service info: {error}"))
+
+    def on_proginfo(self, service, data, on_done):
+        # Satellite and frequency become searchable once we have seen them
+        self.service_index.set_proginfo(service['id'], data)
+        on_done(data)
+
+    def on_service_selected(self, index):
+        self.request_proginfo(self.services_model.service(index), self.show_proginfo)
+        if self.monitor_button.isChecked():
+            self.watch_current_service()
+
+    def toggle_monitor(self, checked):
+        for sparkline in self.sparklines.values():
+            sparkline.setVisible(checked)
+        if checked:
+            self.watch_current_service()
+        elif self.signal_monitor:
+            self.signal_monitor.stop()
+
+    def watch_current_service(self):
+        service = self.current_service()
         ip_address = self.get_ip_address()
-        if not ip_address:
-            QMessageBox.critical(self, "Error", "Please enter a valid IP address.")
+        if not service or not ip_address:
             return
-
-        url = f"http://{ip_address}:81/proginfo?id={service['id']}"
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
-            QMessageBox.critical(self, "Error", f"Failed to fetch service info: {e}")
+        self.monitored_service = service['id']
+        if self.signal_monitor is None:
+            from signal_monitor import SignalMonitor
+            self.signal_monitor = SignalMonitor(on_sample=self.monitor_sample.emit, on_error=self.monitor_failed.emit)
+        self.signal_monitor.watch(stb_client.get_client(ip_address), self.monitored_service)
+
+    def show_signal_sample(self, service_id, data, history):
+        if not self.monitor_button.isChecked() or service_id != self.monitored_service:
             return
-
-        required_keys = {"servicename", "satname", "FQ", "PID", "intensity", "quality", "rev_rate", "send_rate"}
-        if not all(key in data for key in required_keys):
-            QMessageBox.critical(self, "Error", "Invalid response format.")
+        for info, key in MONITORED_FIELDS.items():
+            text = str(data[key])
+            summary = history.summary(key)
+            if summary:
+                text += "    min {:g} / avg {:.1f} / max {:g}".format(*summary)
+            self.info_labels[info].setText(text)
+            self.sparklines[info].set_values(history.series(key))
+        self.export_history_button.setEnabled(True)
+
+    def export_signal_history(self):
+        history = self.signal_monitor.histories.get(self.monitored_service)
+        if history is None:
             return
+        path, _ = QFileDialog.getSaveFileName(self, "Export Signal History", f"signal-{self.monitored_service}.csv", "CSV files (*.csv)")
+        if path:
+            history.to_csv(path)
 
+    def show_proginfo(self, data):
         service_info = {
             "Service Name": data['servicename'],
             "Satellite Name": data['satname'],
@@ -213,77 +532,75 @@ class MainWindow(QMainWindow):
         for key, value in service_info.items():
             self.info_labels[key].setText(value)
 
-        # Extract the correct audio PID
-        self.current_audio_pid = data['PID'].split('/')[1]
+        # The audio PID picked earlier for this service wins over the broadcast one
+        service = self.current_service()
+        self.current_audio_pid = self.zapper.audio_pid(service['id'], data) if service else stb_client.audio_pid_of(data)
 
         self.audio_tracks_combobox.setEnabled(True)
         self.copy_button.setEnabled(True)
         self.fullscreen_button.setEnabled(True)
-
-    def on_service_double_clicked(self, item):
-        service = item.data(Qt.UserRole)
-        corrected_url = self.get_corrected_url(service['url'], self.current_audio_pid)
-        self.play_stream(corrected_url)
-
-        # Fetch additional details from the proginfo endpoint
-        ip_address = self.get_ip_address()
-        if not ip_address:
-            QMessageBox.critical(self, "Error", "Please enter a valid IP address.")
+        self.record_button.setEnabled(True)
+        self.analyze_button.setEnabled(True)
+        self.update_recordings()
+
+    def on_service_double_clicked(self, index):
+        service = self.services_model.service(index)
+        client = self.get_client()
+        if not service or not client:
             return
+        # The main player would need a tuner of its own
+        self.close_mosaic()
+        self.zapper.start(service)
+        # Tuning data rarely changes, so a cached PID is enough to start playing;
+        # the details and the Discord status follow when /proginfo answers
+        info = client.proginfo_cache.peek(service['id'], max_age=client.proginfo_cache.static_ttl)
+        if info or self.zapper.can_play(service['id']):
+            self.start_playback(service, info)
+        self.request_proginfo(service, lambda data: self.start_service(service, data), slot="zap")
+        nearby = self.services_model.neighbours(index)
+        self.zapper.prefetch(client, self.zapper.prefetch_targets(nearby, self.services_model.store.by_id))
+
+    def start_playback(self, service, data):
+        self.zapper.play(service, data)
+        self.set_deinterlace_mode('linear')
 
-        url = f"http://{ip_address}:81/proginfo?id={service['id']}"
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
-            QMessageBox.critical(self, "Error", f"Failed to fetch service info: {e}")
-            return
-
-        required_keys = {"FQ"}
-        if not all(key in data for key in required_keys):
-            QMessageBox.critical(self, "Error", "Invalid response format from proginfo.")
-            return
+    def start_service(self, service, data):
+        self.show_proginfo(data)
+        if self.zapper.current_url != self.get_corrected_url(service['url'], self.current_audio_pid):
+            self.start_playback(service, data)
 
         fq = data.get('FQ', 'Unknown Frequency')
         service_name = data.get('servicename', 'Unknown Service')
 
         if service['servicename'].startswith('$'):
-            RPC.update(state=f"Scrambled - {fq}", details=f'{service_name}', large_text="Running service:", large_image="scramble", start=int(time.time()), buttons=[{"label": fq, "url": f"https://landing.quangminh.name.vn"}])
+            self.presence.update(state=f"Scrambled - {fq}", details=f'{service_name}', large_text="Running service:", large_image="scramble", start=int(time.time()), buttons=[{"label": fq, "url": f"https://landing.quangminh.name.vn"}])
         else:
-            RPC.update(state=f"FTA - {fq}", details=f'{service_name}', large_text="Running service:", large_image="fta", start=int(time.time()), buttons=[{"label": fq, "url": f"https://landing.quangminh.name.vn"}])
+            self.presence.update(state=f"FTA - {fq}", details=f'{service_name}', large_text="Running service:", large_image="fta", start=int(time.time()), buttons=[{"label": fq, "url": f"https://landing.quangminh.name.vn"}])
 
     def set_deinterlace_mode(self, mode):
-        self.vlc_player.video_set_deinterlace(mode.encode('utf-8'))
-
-    def play_stream(self, url):
-        media = self.vlc_instance.media_new(url)
-        self.vlc_player.set_media(media)
-        self.set_deinterlace_mode('linear')
-        self.vlc_player.play()
+        if self.vlc_player:
+            self.vlc_player.video_set_deinterlace(mode.encode('utf-8'))
 
     def get_corrected_url(self, url, correct_audio_pid):
-        parts = url.split('_')
-        parts[-4] = correct_audio_pid
-        return '_'.join(parts)
+        return stb_client.corrected_stream_url(url, correct_audio_pid)
 
     def populate_audio_tracks(self):
+        # Rebuilding the list must not count as the user picking a track
+        self.audio_tracks_combobox.blockSignals(True)
         self.audio_tracks_combobox.clear()
-        track_count = self.vlc_player.audio_get_track_count()
-        print("Track count:", track_count)
-        if track_count > 0:
-            tracks = self.vlc_player.audio_get_track_description()
-            for track in tracks:
-                track_id, track_description = track
-                # Decode the description if it's in bytes
-                if isinstance(track_description, bytes):
-                    track_description = track_description.decode('utf-8')
-                self.audio_tracks_combobox.addItem(track_description, track_id)
-        else:
-            print("No audio tracks found. Refreshing...")
-            self.audio_tracks_combobox.addItem("Refreshing...")
-            # Wait 2 seconds before refreshing
-            QTimer.singleShot(2000, self.populate_audio_tracks)
+        tracks = self.vlc_player.audio_get_track_description() or []
+        # The list starts with "Disable" (-1) once libvlc knows anything
+        if any(track_id >= 0 for track_id, _ in tracks):
+            self.zapper.audio_tracks_found()
+        for track_id, track_description in tracks:
+            # Decode the description if it's in bytes
+            if isinstance(track_description, bytes):
+                track_description = track_description.decode('utf-8')
+            self.audio_tracks_combobox.addItem(track_description, track_id)
+        current = self.audio_tracks_combobox.findData(self.vlc_player.audio_get_track())
+        if current >= 0:
+            self.audio_tracks_combobox.setCurrentIndex(current)
+        self.audio_tracks_combobox.blockSignals(False)
 
     def change_audio_track(self, index):
         if index == 0:
@@ -292,78 +609,337 @@ class MainWindow(QMainWindow):
         if track_id is not None:
             print(f"Changing to track ID: {track_id}")
             self.vlc_player.audio_set_track(track_id)
+            self.remember_audio_track(track_id, self.audio_tracks_combobox.itemText(index))
         else:
             print("Invalid track ID")
 
+    def remember_audio_track(self, track_id, track_name):
+        # VLC's TS demuxer numbers elementary streams by PID, so the track id
+        # is the audio PID the stream URL asks the receiver for
+        service = self.current_service()
+        if not service or not self.catalog_ip:
+            return
+        self.current_audio_pid = str(track_id)
+        self.zapper.audio_choices[service['id']] = (self.current_audio_pid, track_name)
+        self.catalog_cache.save_audio_choice(self.catalog_ip, service['id'], self.current_audio_pid, track_name)
+
     def on_media_changed(self, event):
-        QTimer.singleShot(1, self.populate_audio_tracks)
+        self.audio_tracks_changed.emit()
+
+    def toggle_analysis(self, checked):
+        if self.stream_analysis:
+            self.stream_analysis.stop()
+            self.stream_analysis = None
+        service = self.current_service()
+        if checked and service:
+            self.analysis_summary.setText(f"Connecting to {service['servicename']}...")
+            self.request_proginfo(service, lambda data: self.start_analysis(service, data), volatile=False, slot="analysis")
+        elif checked:
+            self.analyze_button.setChecked(False)
+
+    def start_analysis(self, service, data):
+        if not self.analyze_button.isChecked():
+            return
+        url = self.get_corrected_url(service['url'], self.zapper.audio_pid(service['id'], data))
+        # Through the relay the analysis sees exactly what the player gets
+        import ts_analyzer
+
+        self.stream_analysis = ts_analyzer.StreamAnalysis(self.zapper.media_url(url), on_report=self.analysis_report.emit,
+                                                          on_error=self.analysis_failed.emit).start()
+        self.analysis_service = service['servicename']
+
+    def show_analysis(self, report):
+        import ts_analyzer
+
+        jitter = "".join(f", PCR jitter {pcr['rms_ms']:.1f} ms" for pcr in list(report["pcr"].values())[:1])
+        self.analysis_summary.setText(f"{self.analysis_service}: {report['bitrate'] / 1e6:.2f} Mbit/s, "
+                                      f"{report['cc_errors']} CC errors, {report['tei']} TEI{jitter}\n"
+                                      f"{ts_analyzer.diagnosis(report)}")
+        pids = sorted(report["pids"], key=lambda entry: -entry["bitrate"])
+        self.analysis_table.setRowCount(len(pids))
+        for row, entry in enumerate(pids):
+            values = [str(entry['pid']), f"{entry['bitrate'] / 1e6:.3f}", str(entry['cc_errors']), str(entry['tei'])]
+            for column, value in enumerate(values):
+                self.analysis_table.setItem(row, column, QTableWidgetItem(value))
+
+    def toggle_recording(self):
+        service = self.current_service()
+        if not service:
+            return
+        if service['id'] in self.recorder:
+            self.recorder.stop(service['id'])
+            QTimer.singleShot(200, self.update_recordings)
+        else:
+            self.request_proginfo(service, lambda data: self.start_recording(service, data), volatile=False, slot="record")
+
+    def start_recording(self, service, data):
+        url = self.get_corrected_url(service['url'], self.zapper.audio_pid(service['id'], data))
+        # Through the relay a recording shares the tuner with the live picture
+        self.recorder.start(service['id'], service['servicename'].lstrip('$'), self.zapper.media_url(url))
+        self.recordings_timer.start()
+        self.update_recordings()
+
+    def update_recordings(self):
+        status = self.recorder.status()
+        self.recordings_label.setText(status)
+        self.recordings_label.setVisible(bool(status))
+        if not status:
+            self.recordings_timer.stop()
+        service = self.current_service()
+        self.record_button.setText("Stop Recording" if service and service['id'] in self.recorder else "Record")
+
+    def toggle_previews(self, checked):
+        if checked and not self.preview_pipeline:
+            if not self.catalog_ip:
+                QMessageBox.information(self, "Previews", "Load the services of a receiver first.")
+                self.previews_button.setChecked(False)
+                return
+            self.preview_icons = PreviewIcons(self.services_model)
+            self.preview_pipeline = PreviewPipeline(stb_client.get_client(self.catalog_ip), ThumbnailCache(),
+                                                    on_ready=self.preview_icons.ready.emit, busy=self.busy_transponders)
+            self.preview_icons.pipeline = self.preview_pipeline
+        elif not checked and self.preview_pipeline:
+            print(f"Previews: {self.preview_pipeline.stats}")
+            self.preview_pipeline.stop()
+            self.preview_pipeline = None
+        self.services_list.setIconSize(PREVIEW_SIZE if checked else QSize())
+        self.services_model.set_previews(self.preview_icons if checked else None)
+        self.previews_label.setVisible(checked)
+        if checked:
+            self.previews_timer.start()
+        else:
+            self.previews_timer.stop()
+
+    def busy_transponders(self):
+        """ Transponders of the service playing, the recordings and the mosaic; called from the preview thread. """
+        client = stb_client.get_client(self.catalog_ip)
+        service_ids = list(self.recorder.service_ids())
+        if self.zapper.current_url and self.zapper.recent:
+            service_ids.append(self.zapper.recent[0])
+        infos = [client.proginfo_cache.peek(service_id) for service_id in service_ids]
+        return [mosaic.transponder_of(info) for info in infos if info] + list(self.mosaic_transponders)
+
+    def toggle_relay(self, checked):
+        if checked and not self.stream_relay:
+            try:
+                from stream_relay import StreamRelay
+                self.stream_relay = StreamRelay().start()
+            except OSError as e:
+                QMessageBox.critical(self, "Error", f"Could not start the stream relay: {e}")
+                self.relay_button.setChecked(False)
+                return
+        self.zapper.set_relay(self.stream_relay if checked else None)
+        self.zapper.restart()
 
-    def on_fullscreen_button_clicked(self):
-        item = self.services_list.currentItem()
-        if not item:
+    def open_mosaic(self):
+        index = self.services_list.currentIndex()
+        if not index.isValid():
+            QMessageBox.information(self, "Mosaic", "Select a service to center the mosaic on.")
+            return
+        if self.vlc_instance is None:
+            QMessageBox.information(self, "Mosaic", "Video playback is not available yet.")
+            return
+        client = self.get_client()
+        if not client:
+            return
+        tiles, ok = QInputDialog.getInt(self, "Mosaic", "Number of tiles:", 9, mosaic.MIN_TILES, mosaic.MAX_TILES)
+        if not ok:
+            return
+        self.close_mosaic()
+        rows = mosaic.by_distance(index.row(), tiles * mosaic.LOOKUPS_PER_TILE, self.services_model.rowCount())
+        candidates = [self.services_model.service(self.services_model.index(row)) for row in rows]
+        # Recordings keep their tuners while the mosaic runs
+        recorded = [client.proginfo_cache.peek(service_id) for service_id in self.recorder.service_ids()]
+        scheduler = mosaic.TunerScheduler(busy=[mosaic.transponder_of(info) for info in recorded if info])
+        self.mosaic_button.setEnabled(False)
+        self.workers.submit("mosaic", lambda task: mosaic.plan(client, candidates, tiles, scheduler, task),
+                            on_done=lambda result: self.show_mosaic(tiles, scheduler, *result),
+                            on_error=self.on_mosaic_failed)
+
+    def show_mosaic(self, tiles, scheduler, chosen, refused):
+        self.mosaic_button.setEnabled(True)
+        if not chosen:
+            QMessageBox.information(self, "Mosaic", f"No service fits on the receiver's {scheduler.tuners} tuner(s).")
             return
-        service = item.data(Qt.UserRole)
-        corrected_url = self.get_corrected_url(service['url'], self.current_audio_pid)
-        audio_track = self.audio_tracks_combobox.currentIndex()
-        self.vlc_player.stop()
-        self.fullscreen_player = FullscreenVideoWindow(corrected_url, audio_track)
+        summary = (f"{len(chosen)} of {tiles} tiles on {len(scheduler.transponders)} transponder(s), "
+                   f"{scheduler.tuners} tuner(s)")
+        if refused:
+            summary += f"; {refused} service(s) left out, they need another tuner"
+        # The main player would hold a tuner of its own
+        if self.vlc_player:
+            self.vlc_player.stop()
+            self.supervisor.cancel()
+        services = [(service['servicename'].lstrip('$'),
+                     self.zapper.media_url(self.get_corrected_url(service['url'], self.zapper.audio_pid(service['id'], info))))
+                    for service, info in chosen]
+        self.mosaic_transponders = tuple(mosaic.transponder_of(info) for _, info in chosen)
+        self.mosaic = MosaicWindow(self.vlc_instance, services, summary)
+        self.mosaic.closed.connect(self.on_mosaic_closed)
+        self.mosaic.start()
+
+    def on_mosaic_failed(self, error):
+        self.mosaic_button.setEnabled(True)
+        QMessageBox.critical(self, "Error", f"Could not plan the mosaic: {error}")
+
+    def on_mosaic_closed(self):
+        # Closed by the user: the main player gets its tuner back
+        self.mosaic = None
+        self.mosaic_transponders = ()
+        self.zapper.restart()
+
+    def close_mosaic(self):
+        """ Close the mosaic without resuming the main player. """
+        if self.mosaic:
+            window, self.mosaic = self.mosaic, None
+            self.mosaic_transponders = ()
+            window.closed.disconnect(self.on_mosaic_closed)
+            window.close()
+
+    def show_stats(self):
+        if self.stats_dialog is None:
+            self.stats_dialog = StatsDialog(self)
+        self.stats_dialog.show()
+        self.stats_dialog.raise_()
+
+    def on_fullscreen_button_clicked(self):
+        self.toggle_fullscreen()
+
+    def toggle_fullscreen(self):
+        """ Show the player frame alone, full screen, or bring the window back.
+
+        The player keeps rendering into the same frame, so the stream is never
+        reopened: no new session on the receiver, no buffering, same audio track.
+        """
+        started = time.perf_counter()
+        if self.hidden_for_fullscreen is None:
+            self.hidden_for_fullscreen = [widget for widget in self.main_widget.findChildren(QWidget, options=Qt.FindDirectChildrenOnly)
+                                          if widget is not self.player_frame and widget.isVisible()]
+            for widget in self.hidden_for_fullscreen:
+                widget.hide()
+            self.saved_margins = self.layout.contentsMargins()
+            self.layout.setContentsMargins(0, 0, 0, 0)
+            self.showFullScreen()
+        else:
+            for widget in self.hidden_for_fullscreen:
+                widget.show()
+            self.hidden_for_fullscreen = None
+            self.layout.setContentsMargins(self.saved_margins)
+            self.showNormal()
+        QApplication.processEvents()
+        print(f"Fullscreen {'on' if self.isFullScreen() else 'off'} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def leave_fullscreen(self):
+        if self.hidden_for_fullscreen is not None:
+            self.toggle_fullscreen()
+
+    def eventFilter(self, obj, event):
+        if obj is self.player_frame and event.type() == QEvent.MouseButtonDblClick and self.current_service():
+            self.toggle_fullscreen()
+            return True
+        return super(MainWindow, self).eventFilter(obj, event)
 
     def copy_to_clipboard(self, url):
+        import pyperclip
+
         pyperclip.copy(url)
         QMessageBox.information(self, "Copied", f"URL copied to clipboard:\n{url}")
 
     def closeEvent(self, event):
         if QMessageBox.question(self, "Quit", "Do you want to quit?") == QMessageBox.Yes:
             QMessageBox.information(self, "Goodbye", "Thank you for using this app!\nWritten by: soscaster")
+            if self.signal_monitor:
+                self.signal_monitor.stop()
+            self.close_mosaic()
+            self.presence.close()
+            print(f"Discord presence: {self.presence.stats}")
+            self.workers.shutdown()
+            if self.preview_pipeline:
+                print(f"Previews: {self.preview_pipeline.stats}")
+                self.preview_pipeline.stop()
+            self.supervisor.stop()
+            print(f"Playback: {self.supervisor.status()}")
+            self.zapper.shutdown()
+            self.recorder.stop_all()
+            if self.stream_analysis:
+                self.stream_analysis.stop()
+            print(f"Zap times: {self.zapper.stats}")
+            if self.stream_relay:
+                print(f"Stream relay: {self.stream_relay}")
+                self.stream_relay.stop()
+            if self.catalog_ip:
+                print(f"Proginfo cache: {stb_client.get_client(self.catalog_ip).proginfo_cache}")
             event.accept()
         else:
             event.ignore()
 
-class FullscreenVideoWindow(QMainWindow):
-    def __init__(self, url, audio_track):
-        super(FullscreenVideoWindow, self).__init__()
-        self.setWindowTitle("Fullscreen Video Player")
-        # self.setGeometry(0, 0, 800, 600)
-        self.setWindowState(Qt.WindowFullScreen)
-        self.setWindowIcon(QIcon(resource_path("favicon.ico")))
-
-        self.vlc_instance = vlc.Instance("--verbose 0")
-        self.vlc_player = self.vlc_instance.media_player_new()
-        if sys.platform.startswith('linux'):
-            self.vlc_player.set_xwindow(self.winId())
-        elif sys.platform == "win32":
-            self.vlc_player.set_hwnd(self.winId())
-        
-        self.play_stream(url, audio_track)
-        self.show()
-
-    def set_deinterlace_mode(self, mode):
-        self.vlc_player.video_set_deinterlace(mode.encode('utf-8'))
-
-    def populate_audio_tracks(self, audio_track):
-        track_count = self.vlc_player.audio_get_track_count()
-        print("Track count:", track_count)
-        if track_count > 0:
-            self.vlc_player.audio_set_track(audio_track)
-        else:
-            print("No audio tracks found. Refreshing...")
-            # Wait 2 seconds before refreshing
-            QTimer.singleShot(2000, self.populate_audio_tracks(audio_track))
-
-    def play_stream(self, url, audio_track):
-        media = self.vlc_instance.media_new(url)
-        self.vlc_player.set_media(media)
-        self.set_deinterlace_mode('linear')
-        print(f"Playing URL: {url}")
-        self.vlc_player.play()
-        print("Populating audio tracks with:", audio_track)
-        # self.populate_audio_tracks(audio_track)
-        
-    def closeEvent(self, event):
-        self.vlc_player.stop()
-        event.accept()
+class Sparkline(QWidget):
+    def __init__(self, parent=None):
+        super(Sparkline, self).__init__(parent)
+        self.setFixedHeight(24)
+        self.values = []
+
+    def set_values(self, values):
+        self.values = values
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        values = [value for value in self.values if value == value]
+        if len(values) < 2:
+            return
+        low, high = min(values), max(values)
+        span = (high - low) or 1.0
+        width, height = self.width() - 1, self.height() - 3
+        step = width / (len(values) - 1)
+        points = [QPointF(i * step, 1 + height - (value - low) / span * height) for i, value in enumerate(values)]
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setPen(QPen(QColor("steelblue"), 1.5))
+        painter.drawPolyline(QPolygonF(points))
+
+class StatsDialog(QDialog):
+    """ Live view of `telemetry.metrics`, refreshed every second while shown. """
+
+    def __init__(self, parent=None):
+        super(StatsDialog, self).__init__(parent)
+        self.setWindowTitle("Performance Stats")
+        self.resize(760, 360)
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget(0, 7, self)
+        self.table.setHorizontalHeaderLabels(["Metric", "Labels", "Count", "p50 ms", "p90 ms", "p99 ms", "Max ms"])
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super(StatsDialog, self).showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super(StatsDialog, self).hideEvent(event)
+
+    def refresh(self):
+        histograms, counters = telemetry.metrics.summary()
+        rows = [(name, labels, str(count)) + tuple(f"{value * 1000:.1f}" for value in values)
+                for name, labels, count, *values in histograms]
+        rows += [(name, labels, str(total), "", "", "", "") for name, labels, total in counters]
+        self.table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column >= 2:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, column, item)
 
 if __name__ == "__main__":
+    # Preview workers are spawned processes, also in frozen builds
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MainWindow()
     sys.exit(app.exec_())
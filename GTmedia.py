@@ -1,12 +1,33 @@
+import startup
 import tkinter as tk
-from tkinter import messagebox
-import requests
-import json
-import pyperclip
+from tkinter import filedialog, messagebox, simpledialog
+import multiprocessing
 import os
 import sys
-import vlc
 import time
+from catalog_cache import CatalogCache, diff_catalogs
+from catalog_loader import CatalogLoader
+from mosaic import transponder_of
+from playback_supervisor import PlaybackSupervisor
+import stb_client
+from recorder import Recorder
+from service_index import ServiceIndex, rows_matching
+import telemetry
+from thumbnails import PreviewPipeline, ThumbnailCache
+from tk_service_list import PreviewImages, VirtualServiceList
+import vlc_shared
+from zapper import Zapper
+from workers import TkWorker
+
+MONITORED_FIELDS = {
+    "Signal Intensity": "intensity",
+    "Signal Quality": "quality",
+    "Receive Rate": "rev_rate",
+    "Send Rate": "send_rate"
+}
+
+# Imported in the background once the window is up, see App.start_background_services
+PRELOADED_MODULES = ("requests", "signal_monitor", "discovery", "stream_relay", "pyperclip")
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
@@ -55,32 +76,23 @@ class App(tk.Tk):
         self.get_button = tk.Button(self, text="Get Services", command=self.get_services)
         self.get_button.pack(pady=5)
 
+        self.discover_button = tk.Button(self, text="Discover Receivers", command=self.discover_receivers)
+        self.discover_button.pack(pady=5)
+
         self.main_frame = tk.Frame(self)
         self.main_frame.pack(pady=10, fill=tk.BOTH, expand=True)
 
         self.services_frame = tk.Frame(self.main_frame)
         self.services_frame.pack(side="left", fill=tk.BOTH, expand=False)
 
-        self.canvas = tk.Canvas(self.services_frame, width=200)
-        self.scrollbar_y = tk.Scrollbar(self.services_frame, orient="vertical", command=self.canvas.yview)
-        self.scrollable_frame = tk.Frame(self.canvas)
-        
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(
-                scrollregion=self.canvas.bbox("all")
-            )
-        )
-        
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=self.scrollbar_y.set)
-        
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.scrollbar_y.pack(side="right", fill="y")
+        self.search_text = tk.StringVar()
+        self.search_text.trace_add("write", lambda *args: self.apply_search())
+        self.search_entry = tk.Entry(self.services_frame, textvariable=self.search_text)
+        self.search_entry.pack(fill=tk.X, pady=(0, 5))
 
-        self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
-        self.canvas.bind_all("<Button-4>", self._on_mousewheel)  # Linux specific
-        self.canvas.bind_all("<Button-5>", self._on_mousewheel)  # Linux specific
+        self.services_list = VirtualServiceList(self.services_frame, on_select=self.show_service_info, on_activate=self.zap_service)
+        self.services_list.pack(fill=tk.BOTH, expand=True)
+        self.service_index = ServiceIndex()
 
         self.player_frame = tk.Frame(self.main_frame, width=800, height=600, bg="black")
         self.player_frame.pack(side="right", padx=10, pady=10)
@@ -90,24 +102,96 @@ class App(tk.Tk):
         self.fullscreen_button = tk.Button(self.description_frame, text="Toggle Fullscreen", command=self.toggle_fullscreen)
         self.fullscreen_button.pack(pady=5)
         
+        self.monitor_enabled = tk.BooleanVar(value=False)
+        self.monitor_button = tk.Checkbutton(self.description_frame, text="Monitor Signal", variable=self.monitor_enabled, command=self.toggle_monitor)
+        self.monitor_button.pack(pady=5)
+        self.record_button = tk.Button(self.description_frame, text="Record", command=self.toggle_recording)
+        self.record_button.pack(pady=5)
+        self.recordings_label = tk.Label(self.description_frame, text="", justify="left", anchor="w", wraplength=300)
+        self.recordings_label.pack(fill=tk.X, padx=10)
+        self.relay_enabled = tk.BooleanVar(value=False)
+        self.relay_button = tk.Checkbutton(self.description_frame, text="Play via Relay", variable=self.relay_enabled, command=self.toggle_relay)
+        self.relay_button.pack(pady=5)
+        self.playback_label = tk.Label(self.description_frame, text="", justify="left", anchor="w", wraplength=300)
+        self.playback_label.pack(fill=tk.X, padx=10)
+        self.export_history_button = tk.Button(self.description_frame, text="Export Signal History", state=tk.DISABLED, command=self.export_signal_history)
+        self.export_history_button.pack(pady=5)
+        self.previews_enabled = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.description_frame, text="Show Previews", variable=self.previews_enabled,
+                       command=self.toggle_previews).pack(pady=5)
+        self.previews_label = tk.Label(self.description_frame, text="", justify="left", anchor="w", wraplength=300)
+        self.previews_label.pack(fill=tk.X, padx=10)
+        self.preview_pipeline = None
+        tk.Button(self.description_frame, text="Performance Stats", command=self.show_stats).pack(pady=5)
+        self.stats_window = None
+
         self.info_labels = {}
+        self.sparklines = {}
         for info in ["Service Name", "Satellite Name", "Frequency", "PID", "Signal Intensity", "Signal Quality", "Receive Rate", "Send Rate"]:
             tk.Label(self.description_frame, text=info + ":", anchor="w", font=("TkDefaultFont", 12, "normal")).pack(fill=tk.X, padx=10, pady=2)
             self.info_labels[info] = tk.Label(self.description_frame, text="", anchor="w", bg="white", font=("TkDefaultFont", 12, "normal"))
             self.info_labels[info].pack(fill=tk.X, padx=10, pady=2)
-
-        self.selected_label = None
-
-        self.vlc_instance = vlc.Instance()
-        self.vlc_player = self.vlc_instance.media_player_new()
-
-        # Delay setting the window ID to ensure the frame is fully initialized
-        self.after(100, self.initialize_vlc_player)
-
-    def initialize_vlc_player(self):
+            if info in MONITORED_FIELDS:
+                self.sparklines[info] = tk.Canvas(self.description_frame, height=24, bg="white", highlightthickness=0)
+
+        self.selected_service = None
+        self.workers = TkWorker(self)
+
+        self.signal_monitor = None
+        self.monitored_service = None
+
+        self.catalog_cache = CatalogCache()
+        self.catalog_ip = None
+
+        # libvlc starts in the background; the zapper plays once it is up
+        self.vlc_instance = None
+        self.vlc_player = None
+        self.zapper = Zapper()
+        self.supervisor = PlaybackSupervisor(self.zapper)
+        self.stream_relay = None
+        self.recorder = Recorder()
+        self.recordings_polling = False
+        self.fullscreen_layout = None
+        self.bind("<Escape>", lambda e: self.leave_fullscreen())
+        self.bind("<F11>", lambda e: self.toggle_fullscreen())
+        self.player_frame.bind("<Double-Button-1>", lambda e: self.toggle_fullscreen())
+
+        # Runs once the mainloop has drawn the window
+        self.after(0, self.start_background_services)
+        self.show_cached_services()
+
+    def start_background_services(self):
+        startup.interactive("GTmedia")
+        telemetry.metrics.configure_from_environment()
+        self.workers.submit("vlc", lambda task: vlc_shared.get_instance(),
+                            on_done=self.on_vlc_ready, on_error=self.on_vlc_failed)
+        startup.preload(*PRELOADED_MODULES)
+
+    def on_vlc_ready(self, instance):
+        self.vlc_instance = instance
+        self.vlc_player = instance.media_player_new()
+        # Let clicks and keys reach Tk so fullscreen can be left from the video
+        self.vlc_player.video_set_mouse_input(False)
+        self.vlc_player.video_set_key_input(False)
         window_id = self.player_frame.winfo_id()
-        self.vlc_player.set_hwnd(window_id)
+        vlc_shared.attach_to_widget(self.vlc_player, window_id)
         print(f"Window ID: {window_id}")
+        # Before the zapper, which starts the service already asked for
+        self.supervisor.attach(self.vlc_player)
+        self.zapper.attach(instance, self.vlc_player)
+        self.update_playback_status()
+        if self.zapper.current_url:
+            self.set_deinterlace_mode('linear')
+        print(f"libvlc ready after {startup.elapsed() * 1000:.0f} ms (initialized in {vlc_shared.init_time * 1000:.0f} ms)")
+
+    def update_playback_status(self):
+        self.playback_label.configure(text=self.supervisor.status())
+        self.after(1000, self.update_playback_status)
+
+    def on_vlc_failed(self, error):
+        print(f"Video playback unavailable: {error}")
+        tk.Label(self.player_frame, text=f"Video playback unavailable:\n{error}", fg="white", bg="black",
+                 wraplength=700).place(relx=0.5, rely=0.5, anchor="center")
 
     def validate_ip(self, P):
         if P.isdigit() and len(P) <= 3:
@@ -132,75 +216,160 @@ class App(tk.Tk):
         else:
             return None
 
+    def set_ip_address(self, ip_address):
+        for entry, part in zip([self.ip_entry1, self.ip_entry2, self.ip_entry3, self.ip_entry4], ip_address.split(".")):
+            entry.delete(0, tk.END)
+            entry.insert(0, part)
+
+    def discover_receivers(self):
+        import discovery
+
+        network = simpledialog.askstring("Discover Receivers", "Networks to scan (CIDR, space separated):", initialvalue=discovery.local_subnet(), parent=self)
+        if not network or not network.split():
+            return
+        self.discover_button.configure(state=tk.DISABLED, text="Scanning...")
+        self.workers.submit("discovery", lambda task: discovery.discover(network.split()),
+                            on_done=self.on_receivers_found,
+                            on_error=self.on_discovery_failed)
+
+    def on_receivers_found(self, receivers):
+        self.discover_button.configure(state=tk.NORMAL, text="Discover Receivers")
+        if not receivers:
+            messagebox.showinfo("Discover Receivers", "No receivers found.")
+            return
+
+        dialog = tk.Toplevel(self)
+        dialog.title("Discover Receivers")
+        dialog.transient(self)
+        tk.Label(dialog, text="Receivers found:", font=("TkDefaultFont", 12, "normal")).pack(padx=10, pady=5)
+        listbox = tk.Listbox(dialog, width=50, height=min(len(receivers), 10), font=("TkDefaultFont", 12, "normal"))
+        for receiver in receivers:
+            listbox.insert(tk.END, str(receiver))
+        listbox.selection_set(0)
+        listbox.pack(padx=10, pady=5)
+
+        def choose(event=None):
+            selection = listbox.curselection()
+            dialog.destroy()
+            if selection:
+                self.set_ip_address(receivers[selection[0]].ip_address)
+                self.get_services()
+
+        listbox.bind("<Double-Button-1>", choose)
+        tk.Button(dialog, text="Use Receiver", command=choose).pack(pady=5)
+
+    def on_discovery_failed(self, error):
+        self.discover_button.configure(state=tk.NORMAL, text="Discover Receivers")
+        messagebox.showerror("Error", f"Discovery failed: {error}")
+
+    def show_cached_services(self):
+        ip_address = self.catalog_cache.last_ip()
+        if not ip_address:
+            return
+        self.set_ip_address(ip_address)
+        started = time.perf_counter()
+        # Loaded on a worker so the window is usable before the list is filled;
+        # a Get Services click in the meantime takes over the slot
+        self.workers.submit("catalog", lambda task: self.catalog_cache.load(ip_address),
+                            on_done=lambda services: self.on_cached_services(ip_address, services, started),
+                            on_error=lambda error: self.get_services())
+
+    def on_cached_services(self, ip_address, services, started):
+        self.display_services(services)
+        self.set_catalog_ip(ip_address)
+        print(f"Showing {len(services)} cached services for {ip_address} after {(time.perf_counter() - started) * 1000:.1f} ms")
+        # Refresh in the background; only the differences are applied to the list
+        self.after_idle(self.get_services)
+
     def get_services(self):
         ip_address = self.get_ip_address()
         if not ip_address:
             messagebox.showerror("Error", "Please enter a valid IP address.")
             return
 
-        url = f"http://{ip_address}:81/getallservices"
-        count = 100
-
-        while True:
-            full_url = f"{url}?count={count}"
-            try:
-                response = requests.get(full_url)
-                response.raise_for_status()
-                data = response.json()
-            except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
-                messagebox.showerror("Error", f"Failed to fetch services: {e}")
-                return
-
-            if "pagetotal" not in data or "services" not in data:
-                messagebox.showerror("Error", "Invalid response format.")
-                return
-
-            if data["pagetotal"] <= 1:
-                break
-            count += 100
-
-        self.display_services(data["services"])
+        self.get_button.configure(state=tk.DISABLED)
+        loader = CatalogLoader(stb_client.get_client(ip_address))
+        refresh = ip_address == self.catalog_ip and len(self.services_list) > 0
+        if not refresh:
+            self.display_services([])
+            self.set_catalog_ip(ip_address)
+
+        def load(task):
+            services = loader.load(on_page=None if refresh else task.report)
+            self.catalog_cache.save(ip_address, services)
+            return services
+
+        self.workers.submit("catalog", load,
+                            on_done=lambda services: self.on_services_loaded(loader, services, refresh),
+                            on_error=self.on_services_failed,
+                            on_progress=self.append_services)
+
+    def set_catalog_ip(self, ip_address):
+        self.catalog_ip = ip_address
+        # Audio tracks picked in either front end are shared through the cache
+        self.zapper.audio_choices = self.catalog_cache.load_audio_choices(ip_address)
+        if self.preview_pipeline:
+            self.services_list.previews.loaded.clear()
+            self.preview_pipeline.set_client(stb_client.get_client(ip_address))
+
+    def on_services_loaded(self, loader, services, refresh):
+        self.get_button.configure(state=tk.NORMAL)
+        print(f"Loaded {loader.stats}")
+        if refresh:
+            diff = diff_catalogs(self.services_list.store, services)
+            self.services_list.apply_diff(diff)
+            self.service_index.apply_diff(diff)
+            if self.search_text.get():
+                self.apply_search()
+            print(f"Catalog refresh: {diff}")
+
+    def on_services_failed(self, error):
+        self.get_button.configure(state=tk.NORMAL)
+        messagebox.showerror("Error", f"Failed to fetch services: {error}")
 
     def display_services(self, services):
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-
-        for service in services:
-            service_name = service["servicename"]
-            service_id = service["id"]
-            label = tk.Label(self.scrollable_frame, text=service_name, fg="black" if not service_name.startswith('$') else "red", cursor="hand2", font=("TkDefaultFont", 12, "normal"))
-            label.pack(anchor="w", padx=10, pady=2)
-            label.bind("<Button-1>", lambda e, service_id=service_id, label=label: self.show_service_info(service_id, label))
-            label.bind("<Double-Button-1>", lambda e, url=service["url"]: self.play_stream(url))
-
-        self.scrollable_frame.update_idletasks()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-
-    def show_service_info(self, service_id, label):
-        if self.selected_label:
-            self.selected_label.configure(bg=self.cget("bg"), font=("TkDefaultFont", 12, "normal"))
-        label.configure(bg="lightblue", font=("TkDefaultFont", 15, "bold"))
-        self.selected_label = label
+        self.services_list.clear()
+        self.service_index.clear()
+        self.append_services(services)
+
+    def append_services(self, services):
+        self.services_list.append_services(services)
+        self.service_index.extend(services)
+        if self.search_text.get():
+            self.apply_search()
+
+    def apply_search(self):
+        started = time.perf_counter()
+        rows = rows_matching(self.service_index.query(self.search_text.get()), self.services_list.store)
+        self.services_list.set_filter(rows)
+        if rows is not None:
+            print(f"Search matched {len(rows)} services in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def show_service_info(self, service):
+        service_id = service["id"]
+        self.selected_service = service_id
+        self.record_button.configure(text="Stop Recording" if service_id in self.recorder else "Record")
 
         ip_address = self.get_ip_address()
         if not ip_address:
             messagebox.showerror("Error", "Please enter a valid IP address.")
             return
 
-        url = f"http://{ip_address}:81/proginfo?id={service_id}"
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
-            messagebox.showerror("Error", f"Failed to fetch service info: {e}")
-            return
+        if self.monitor_enabled.get():
+            self.watch_service(ip_address, service_id)
 
-        required_keys = {"servicename", "satname", "FQ", "PID", "intensity", "quality", "rev_rate", "send_rate"}
-        if not all(key in data for key in required_keys):
-            messagebox.showerror("Error", "Invalid response format.")
-            return
+        # A newer click supersedes any /proginfo request still in flight
+        client = stb_client.get_client(ip_address)
+        self.workers.submit("proginfo", lambda task: client.cached_proginfo(service_id),
+                            on_done=lambda data: self.on_proginfo(service_id, data),
+                            on_error=lambda error: messagebox.showerror("Error", f"Failed to fetch service info: {error}"))
+
+    def on_proginfo(self, service_id, data):
+        # Satellite and frequency become searchable once we have seen them
+        self.service_index.set_proginfo(service_id, data)
+        self.display_service_info(data)
 
+    def display_service_info(self, data):
         service_info = {
             "Service Name": data['servicename'],
             "Satellite Name": data['satname'],
@@ -215,37 +384,249 @@ class App(tk.Tk):
         for key, value in service_info.items():
             self.info_labels[key].configure(text=value)
 
+    def toggle_monitor(self):
+        if self.monitor_enabled.get():
+            for info, sparkline in self.sparklines.items():
+                sparkline.pack(fill=tk.X, padx=10, after=self.info_labels[info])
+            ip_address = self.get_ip_address()
+            if ip_address and self.selected_service is not None:
+                self.watch_service(ip_address, self.selected_service)
+        else:
+            for sparkline in self.sparklines.values():
+                sparkline.pack_forget()
+            if self.signal_monitor:
+                self.signal_monitor.stop()
+
+    def watch_service(self, ip_address, service_id):
+        self.monitored_service = service_id
+        if self.signal_monitor is None:
+            from signal_monitor import SignalMonitor
+            self.signal_monitor = SignalMonitor(on_sample=lambda *sample: self.workers.call_soon(self.show_signal_sample, *sample),
+                                                on_error=lambda error: print(f"Signal monitor: {error}"))
+        self.signal_monitor.watch(stb_client.get_client(ip_address), service_id)
+
+    def show_signal_sample(self, service_id, data, history):
+        if not self.monitor_enabled.get() or service_id != self.monitored_service:
+            return
+        for info, key in MONITORED_FIELDS.items():
+            text = str(data[key])
+            summary = history.summary(key)
+            if summary:
+                text += "    min {:g} / avg {:.1f} / max {:g}".format(*summary)
+            self.info_labels[info].configure(text=text)
+            self.draw_sparkline(self.sparklines[info], history.series(key))
+        self.export_history_button.configure(state=tk.NORMAL)
+
+    def draw_sparkline(self, canvas, values):
+        canvas.delete("all")
+        values = [value for value in values if value == value]
+        if len(values) < 2:
+            return
+        low, high = min(values), max(values)
+        span = (high - low) or 1.0
+        width, height = canvas.winfo_width() - 1, int(canvas.cget("height")) - 3
+        step = width / (len(values) - 1)
+        points = []
+        for i, value in enumerate(values):
+            points += [i * step, 1 + height - (value - low) / span * height]
+        canvas.create_line(*points, fill="steelblue", width=1.5)
+
+    def export_signal_history(self):
+        history = self.signal_monitor.histories.get(self.monitored_service)
+        if history is None:
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".csv", initialfile=f"signal-{self.monitored_service}.csv", filetypes=[("CSV files", "*.csv")])
+        if path:
+            history.to_csv(path)
+
     def set_deinterlace_mode(self, mode):
-        self.vlc_player.video_set_deinterlace(mode.encode('utf-8'))
+        if self.vlc_player:
+            self.vlc_player.video_set_deinterlace(mode.encode('utf-8'))
 
-    def play_stream(self, url):
-        media = self.vlc_instance.media_new(url)
-        self.vlc_player.set_media(media)
-        self.vlc_player.play()
+    def zap_service(self, service):
+        ip_address = self.get_ip_address()
+        if not ip_address:
+            messagebox.showerror("Error", "Please enter a valid IP address.")
+            return
+        client = stb_client.get_client(ip_address)
+        self.zapper.start(service)
+        # A cached PID is enough to start playing; /proginfo only confirms it
+        info = client.proginfo_cache.peek(service["id"], max_age=client.proginfo_cache.static_ttl)
+        if info or self.zapper.can_play(service["id"]):
+            self.start_playback(service, info)
+        self.workers.submit("zap", lambda task: client.cached_proginfo(service["id"], volatile=False),
+                            on_done=lambda data: self.on_zap_proginfo(service, data),
+                            on_error=lambda error: messagebox.showerror("Error", f"Failed to fetch service info: {error}"))
+        nearby = self.services_list.neighbours(service["id"])
+        self.zapper.prefetch(client, self.zapper.prefetch_targets(nearby, self.services_list.store.by_id))
+
+    def on_zap_proginfo(self, service, data):
+        if self.zapper.current_url != stb_client.corrected_stream_url(service["url"], self.zapper.audio_pid(service["id"], data)):
+            self.start_playback(service, data)
+
+    def start_playback(self, service, data):
+        self.zapper.play(service, data)
         self.set_deinterlace_mode('linear')
 
-    def _on_mousewheel(self, event):
-        if event.delta:
-            self.canvas.yview_scroll(-1*(event.delta//120), "units")
-        elif event.num == 4:
-            self.canvas.yview_scroll(-1, "units")
-        elif event.num == 5:
-            self.canvas.yview_scroll(1, "units")
-
     def copy_to_clipboard(self, url):
+        import pyperclip
+
         pyperclip.copy(url)
         messagebox.showinfo("Copied", f"URL copied to clipboard:\n{url}")
 
     def on_closing(self):
         if messagebox.askokcancel("Quit", "Do you want to quit?"):
             messagebox.showinfo("Goodbye", "Thank you for using this app!\nWritten by: soscaster")
+            if self.signal_monitor:
+                self.signal_monitor.stop()
+            self.workers.shutdown()
+            if self.preview_pipeline:
+                print(f"Previews: {self.preview_pipeline.stats}")
+                self.preview_pipeline.stop()
+            self.supervisor.stop()
+            print(f"Playback: {self.supervisor.status()}")
+            self.zapper.shutdown()
+            self.recorder.stop_all()
+            print(f"Zap times: {self.zapper.stats}")
+            if self.stream_relay:
+                print(f"Stream relay: {self.stream_relay}")
+                self.stream_relay.stop()
+            if self.catalog_ip:
+                print(f"Proginfo cache: {stb_client.get_client(self.catalog_ip).proginfo_cache}")
             self.destroy()
 
+    def toggle_recording(self):
+        service = self.services_list.selected_service()
+        if not service:
+            return
+        if service["id"] in self.recorder:
+            self.recorder.stop(service["id"])
+            self.record_button.configure(text="Record")
+            return
+        ip_address = self.get_ip_address()
+        if not ip_address:
+            messagebox.showerror("Error", "Please enter a valid IP address.")
+            return
+        client = stb_client.get_client(ip_address)
+        self.workers.submit("record", lambda task: client.cached_proginfo(service["id"], volatile=False),
+                            on_done=lambda data: self.start_recording(service, data),
+                            on_error=lambda error: messagebox.showerror("Error", f"Failed to fetch service info: {error}"))
+
+    def start_recording(self, service, data):
+        url = stb_client.corrected_stream_url(service["url"], self.zapper.audio_pid(service["id"], data))
+        # Through the relay a recording shares the tuner with the live picture
+        self.recorder.start(service["id"], service["servicename"].lstrip('$'), self.zapper.media_url(url))
+        if not self.recordings_polling:
+            self.recordings_polling = True
+            self.update_recordings()
+
+    def update_recordings(self):
+        status = self.recorder.status()
+        self.recordings_label.configure(text=status)
+        service = self.services_list.selected_service()
+        self.record_button.configure(text="Stop Recording" if service and service["id"] in self.recorder else "Record")
+        self.recordings_polling = bool(status)
+        if status:
+            self.after(1000, self.update_recordings)
+
+    def toggle_previews(self):
+        if self.previews_enabled.get() and not self.preview_pipeline:
+            if not self.catalog_ip:
+                messagebox.showinfo("Previews", "Load the services of a receiver first.")
+                self.previews_enabled.set(False)
+                return
+            images = PreviewImages(self.services_list)
+            images.pipeline = self.preview_pipeline = PreviewPipeline(
+                stb_client.get_client(self.catalog_ip), ThumbnailCache(),
+                on_ready=lambda service_id: self.workers.call_soon(images.on_ready, service_id),
+                busy=self.busy_transponders)
+            self.services_list.set_previews(images)
+            self.update_previews()
+        elif not self.previews_enabled.get() and self.preview_pipeline:
+            print(f"Previews: {self.preview_pipeline.stats}")
+            self.preview_pipeline.stop()
+            self.preview_pipeline = None
+            self.services_list.set_previews(None)
+            self.previews_label.configure(text="")
+
+    def update_previews(self):
+        if self.preview_pipeline:
+            self.previews_label.configure(text=str(self.preview_pipeline.stats))
+            self.after(1000, self.update_previews)
+
+    def busy_transponders(self):
+        """ Transponders of the service playing and of the recordings; called from the preview thread. """
+        client = stb_client.get_client(self.catalog_ip)
+        service_ids = list(self.recorder.service_ids())
+        if self.zapper.current_url and self.zapper.recent:
+            service_ids.append(self.zapper.recent[0])
+        infos = [client.proginfo_cache.peek(service_id) for service_id in service_ids]
+        return [transponder_of(info) for info in infos if info]
+
+    def toggle_relay(self):
+        if self.relay_enabled.get() and not self.stream_relay:
+            try:
+                from stream_relay import StreamRelay
+                self.stream_relay = StreamRelay().start()
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not start the stream relay: {e}")
+                self.relay_enabled.set(False)
+                return
+        self.zapper.set_relay(self.stream_relay if self.relay_enabled.get() else None)
+        self.zapper.restart()
+
+    def show_stats(self):
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+            return
+        self.stats_window = tk.Toplevel(self)
+        self.stats_window.title("Performance Stats")
+        text = tk.Text(self.stats_window, width=100, height=20, font=("TkFixedFont", 10))
+        text.pack(fill=tk.BOTH, expand=True)
+
+        def refresh():
+            if not text.winfo_exists():
+                return
+            text.configure(state=tk.NORMAL)
+            text.delete("1.0", tk.END)
+            text.insert(tk.END, telemetry.format_summary(telemetry.metrics.summary()))
+            text.configure(state=tk.DISABLED)
+            self.after(1000, refresh)
+
+        refresh()
+
     def toggle_fullscreen(self):
-        is_fullscreen = self.vlc_player.get_fullscreen()
-        self.vlc_player.set_fullscreen(not is_fullscreen)
-        print(f"Fullscreen mode set to: {not is_fullscreen}")
+        """ Let the player frame fill the screen, or restore the window layout.
+
+        The player keeps its window, so the stream is not reopened and the
+        audio track and buffer survive the switch.
+        """
+        started = time.perf_counter()
+        if self.fullscreen_layout is None:
+            self.fullscreen_layout = [(widget, widget.pack_info()) for widget in self.pack_slaves() + self.main_frame.pack_slaves()]
+            for widget, _ in self.fullscreen_layout:
+                if widget not in (self.main_frame, self.player_frame):
+                    widget.pack_forget()
+            self.main_frame.pack_configure(pady=0)
+            self.player_frame.pack_configure(fill=tk.BOTH, expand=True, padx=0, pady=0)
+            self.attributes("-fullscreen", True)
+        else:
+            self.attributes("-fullscreen", False)
+            # Re-pack everything so the original packing order comes back
+            for widget, _ in self.fullscreen_layout:
+                widget.pack_forget()
+            for widget, info in self.fullscreen_layout:
+                widget.pack(**info)
+            self.fullscreen_layout = None
+        self.update_idletasks()
+        print(f"Fullscreen {'on' if self.fullscreen_layout else 'off'} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def leave_fullscreen(self):
+        if self.fullscreen_layout is not None:
+            self.toggle_fullscreen()
 
 if __name__ == "__main__":
+    # Preview workers are spawned processes, also in frozen builds
+    multiprocessing.freeze_support()
     app = App()
     app.mainloop()
@@ -0,0 +1,202 @@
+""" On-disk cache of the last service catalog seen for each receiver.
+
+The catalog is kept in a small SQLite database so the service list can be
+shown straight away at launch while a background refresh runs. The refresh
+result is compared with the cached one by `diff_catalogs`, and only the
+changed services are applied to the list widget.
+
+Run as a script to time a cold start (full download) against a warm one:
+
+    python catalog_cache.py 192.168.1.10
+"""
+import argparse
+import bisect
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from service_store import ServiceStore
+
+
+def default_cache_dir():
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "gtmedia-sat2ip")
+
+
+class CatalogDiff:
+    def __init__(self):
+        self.removed = []   # service ids
+        self.changed = []   # (position, service) whose name or url changed
+        self.added = []     # (position, service), ascending positions
+
+    def __bool__(self):
+        return bool(self.removed or self.changed or self.added)
+
+    def __str__(self):
+        return f"{len(self.added)} added, {len(self.removed)} removed, {len(self.changed)} changed"
+
+
+def _longest_increasing(positions):
+    """ Indexes into `positions` forming its longest strictly increasing run. """
+    tails, tails_at, previous = [], [], [None] * len(positions)
+    for i, value in enumerate(positions):
+        k = bisect.bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tails_at.append(i)
+        else:
+            tails[k] = value
+            tails_at[k] = i
+        previous[i] = tails_at[k - 1] if k else None
+    keep = set()
+    i = tails_at[-1] if tails_at else None
+    while i is not None:
+        keep.add(i)
+        i = previous[i]
+    return keep
+
+
+def _columns(services):
+    """ The ids of a service list or store, and a function giving a row's (name, url). """
+    if isinstance(services, ServiceStore):
+        return services.ids, lambda row: (services.names[row], services.url(row))
+    return ([service["id"] for service in services],
+            lambda row: (services[row]["servicename"], services[row]["url"]))
+
+
+def diff_catalogs(old, new):
+    """ Describe how to turn the `old` service list into `new` (lists or `ServiceStore`s).
+
+    Removing `removed`, then inserting `added` at their positions in
+    ascending order and finally updating `changed` in place reproduces `new`
+    exactly; all positions refer to `new`. Services that moved
+    relative to the others are reported as removed and added again.
+    """
+    diff = CatalogDiff()
+    old_ids, old_fields = _columns(old)
+    new_ids, new_fields = _columns(new)
+    old_position = {service_id: i for i, service_id in enumerate(old_ids)}
+
+    kept = [i for i, service_id in enumerate(new_ids) if service_id in old_position]
+    in_order = _longest_increasing([old_position[new_ids[i]] for i in kept])
+    stays = {new_ids[kept[k]] for k in in_order}
+
+    diff.removed = [service_id for service_id in old_ids if service_id not in stays]
+    for position, service_id in enumerate(new_ids):
+        if service_id not in stays:
+            diff.added.append((position, new[position]))
+        elif old_fields(old_position[service_id]) != new_fields(position):
+            diff.changed.append((position, new[position]))
+    return diff
+
+
+class CatalogCache:
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            path = os.path.join(default_cache_dir(), "catalog.sqlite")
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS services (
+                ip TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                id INTEGER NOT NULL,
+                servicename TEXT NOT NULL,
+                url TEXT NOT NULL,
+                PRIMARY KEY (ip, position)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS audio_choices (
+                ip TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                pid TEXT NOT NULL,
+                track TEXT,
+                PRIMARY KEY (ip, id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+
+    def load(self, ip_address):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, servicename, url FROM services WHERE ip = ? ORDER BY position",
+                (ip_address,)).fetchall()
+        store = ServiceStore()
+        store.extend_rows(rows)
+        return store
+
+    def save(self, ip_address, services):
+        rows = [(ip_address, position, service["id"], service["servicename"], service["url"])
+                for position, service in enumerate(services)]
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM services WHERE ip = ?", (ip_address,))
+            self.db.executemany("INSERT INTO services VALUES (?, ?, ?, ?, ?)", rows)
+            self.db.execute("INSERT OR REPLACE INTO settings VALUES ('last_ip', ?)", (ip_address,))
+
+    def last_ip(self):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM settings WHERE key = 'last_ip'").fetchone()
+        return row[0] if row else None
+
+    def load_audio_choices(self, ip_address):
+        """ Audio PID and track name picked per service, keyed by service id. """
+        with self.lock:
+            rows = self.db.execute("SELECT id, pid, track FROM audio_choices WHERE ip = ?", (ip_address,)).fetchall()
+        return {service_id: (pid, track) for service_id, pid, track in rows}
+
+    def save_audio_choice(self, ip_address, service_id, pid, track):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO audio_choices VALUES (?, ?, ?, ?)",
+                            (ip_address, service_id, pid, track))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def benchmark(ip_address, port=81):
+    from catalog_loader import CatalogLoader
+    from stb_client import STBClient
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = CatalogCache(os.path.join(directory, "catalog.sqlite"))
+
+        started = time.perf_counter()
+        first_page = []
+        loader = CatalogLoader(STBClient(ip_address, port))
+        services = loader.load(on_page=lambda page: first_page or first_page.append(time.perf_counter() - started))
+        cold_total = time.perf_counter() - started
+        cache.save(ip_address, services)
+
+        started = time.perf_counter()
+        cached = cache.load(ip_address)
+        warm = time.perf_counter() - started
+
+        started = time.perf_counter()
+        diff = diff_catalogs(cached, services)
+        diffed = time.perf_counter() - started
+        cache.close()
+
+    print(f"{len(services)} services from {ip_address}:{port}")
+    print(f"cold start: first page in {first_page[0] * 1000:.1f} ms, full catalog in {cold_total * 1000:.1f} ms")
+    print(f"warm start: cached catalog in {warm * 1000:.1f} ms")
+    print(f"refresh diff: {diff} in {diffed * 1000:.1f} ms")
+    return cold_total, warm
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time cold and warm catalog startup.")
+    parser.add_argument("ip_address")
+    parser.add_argument("--port", type=int, default=81)
+    args = parser.parse_args()
+    benchmark(args.ip_address, args.port)
@@ -0,0 +1,115 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from service_store import ServiceStore
+from stb_client import STBError
+
+
+class CatalogLoadError(STBError):
+    pass
+
+
+class CatalogStats:
+    def __init__(self):
+        self.pages = 0
+        self.services = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return (f"{self.services} services in {self.pages} pages, "
+                f"{self.bytes / 1024:.1f} KiB in {self.elapsed:.2f}s")
+
+
+class CatalogLoader:
+    """ Fetch the /getallservices catalog one page at a time.
+
+    The first page tells us `pagetotal`; the remaining pages are then requested
+    concurrently (at most `max_workers` at once) and handed to `on_page` in
+    order, so every service is downloaded exactly once.
+
+    Receivers that ignore the `page` parameter answer every request with the
+    first page. That shows as page 2 repeating ids from page 1; the loader
+    then falls back to asking for the whole catalog in one response, as the
+    application did before paging.
+    """
+
+    def __init__(self, client, page_size=100, max_workers=4):
+        self.client = client
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.stats = CatalogStats()
+
+    def fetch_page(self, page, count=None):
+        try:
+            return self.client.get_services_page(page, count or self.page_size)
+        except STBError as e:
+            raise CatalogLoadError(e) from e
+
+    def fetch_unpaged(self, pagetotal):
+        """ The whole catalog in one response: `count` grows until the receiver reports a single page. """
+        count = self.page_size * pagetotal
+        while True:
+            data, size = self.fetch_page(1, count)
+            pagetotal = int(data["pagetotal"])
+            if pagetotal <= 1:
+                return data, size
+            count *= pagetotal
+
+    def pages(self):
+        """ Yield the services of each page, in page order.
+
+        At most `2 * max_workers` pages are requested ahead of the consumer,
+        so a slow consumer does not pull the whole catalog into memory.
+        """
+        self.stats = CatalogStats()
+        started = time.perf_counter()
+
+        def count(data, size):
+            self.stats.pages += 1
+            self.stats.bytes += size
+            self.stats.services += len(data["services"])
+            self.stats.elapsed = time.perf_counter() - started
+            return data["services"]
+
+        first, size = self.fetch_page(1)
+        yield count(first, size)
+
+        pagetotal = int(first["pagetotal"])
+        first_ids = set(first["services"].ids)
+        remaining = iter(range(2, pagetotal + 1))
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            ahead = deque(pool.submit(self.fetch_page, page) for page in islice(remaining, 2 * self.max_workers))
+            while ahead:
+                data, size = ahead.popleft().result()
+                if first_ids is not None:
+                    if first_ids.intersection(data["services"].ids):
+                        print("Receiver ignores the page parameter; loading the catalog in one response")
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        data, size = self.fetch_unpaged(pagetotal)
+                        data["services"] = ServiceStore([service for service in data["services"]
+                                                         if service["id"] not in first_ids])
+                        yield count(data, size)
+                        return
+                    first_ids = None
+                for page in islice(remaining, 1):
+                    ahead.append(pool.submit(self.fetch_page, page))
+                yield count(data, size)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def load(self, on_page=None):
+        """ Load the whole catalog and return it as one `ServiceStore`.
+
+        `on_page(services)` is called for every page in page order as soon as
+        that page and all pages before it have arrived.
+        """
+        services = ServiceStore()
+        for page in self.pages():
+            services.extend(page)
+            if on_page:
+                on_page(page)
+        return services
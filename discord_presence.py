@@ -0,0 +1,141 @@
+""" Discord Rich Presence that never holds up the GUI.
+
+Connecting to Discord blocks for as long as the IPC pipe takes to answer,
+and fails outright when Discord is not running or pypresence is not
+installed. Discord also accepts only one presence update per 15 seconds.
+Updates are therefore handed to a publisher thread that keeps just the
+latest state. When a change arrives inside the interval it replaces the
+state that is waiting, so zapping through ten channels sends one update.
+The thread (re)connects when it has something to send and the pipe is down.
+"""
+import threading
+import time
+
+
+class PresenceStats:
+    def __init__(self):
+        self.sent = 0
+        self.merged = 0
+        self.failed = 0
+        self.connects = 0
+
+    def __str__(self):
+        return (f"{self.sent} updates sent, {self.merged} merged, {self.failed} failed, "
+                f"{self.connects} connection(s)")
+
+
+class DiscordPresence:
+    """ Publishes the latest `update` at most once per `min_interval` seconds.
+
+    After a failed connection attempt the next one waits `retry_interval`.
+    """
+
+    def __init__(self, client_id, min_interval=15.0, retry_interval=30.0):
+        self.client_id = client_id
+        self.min_interval = min_interval
+        self.retry_interval = retry_interval
+        self.stats = PresenceStats()
+        self.condition = threading.Condition()
+        self.latest = None
+        self.closing = False
+        self.enabled = True
+        self.rpc = None
+        # pypresence binds its event loop to the thread that connects, so this
+        # thread does the connecting and every update after it
+        self.thread = threading.Thread(target=self._run, name="discord", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def update(self, **fields):
+        """ Queue `fields` for `Presence.update`; never blocks. """
+        with self.condition:
+            if not self.enabled:
+                return
+            if self.latest is not None:
+                self.stats.merged += 1
+            self.latest = fields
+            self.condition.notify()
+
+    def close(self):
+        """ Disconnect in the background; a pending update is dropped. """
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+
+    def _next(self, ready_at):
+        """ Wait for a state to send once `ready_at()` has passed; None when closing. """
+        with self.condition:
+            while not self.closing:
+                wait = None if self.latest is None else ready_at() - time.monotonic()
+                if wait is not None and wait <= 0:
+                    fields, self.latest = self.latest, None
+                    return fields
+                self.condition.wait(wait)
+            return None
+
+    def _requeue(self, fields):
+        with self.condition:
+            if self.latest is None:
+                self.latest = fields
+            else:
+                self.stats.merged += 1
+
+    def _run(self):
+        try:
+            from pypresence import Presence
+            from pypresence.exceptions import PipeClosed, PyPresenceException
+        except ImportError:
+            print("Discord presence off: pypresence is not installed")
+            with self.condition:
+                self.enabled = False
+                self.latest = None
+            return
+        errors = (PyPresenceException, OSError)
+        last_sent = float("-inf")
+        retry_at = 0.0
+        unavailable = False
+        while True:
+            fields = self._next(lambda: max(last_sent + self.min_interval, 0.0 if self.rpc else retry_at))
+            if fields is None:
+                break
+            if self.rpc is None:
+                try:
+                    rpc = Presence(self.client_id)
+                    rpc.connect()
+                except errors as e:
+                    if not unavailable:
+                        print(f"Discord presence unavailable, retrying every {self.retry_interval:.0f}s: {e}")
+                        unavailable = True
+                    retry_at = time.monotonic() + self.retry_interval
+                    self._requeue(fields)
+                    continue
+                self.rpc = rpc
+                self.stats.connects += 1
+                unavailable = False
+            try:
+                self.rpc.update(**fields)
+            except (PipeClosed, OSError) as e:
+                # Discord was closed or restarted: reconnect and send it again
+                print(f"Discord presence connection lost: {e}")
+                self.stats.failed += 1
+                self._disconnect(errors)
+                self._requeue(fields)
+                continue
+            except PyPresenceException as e:
+                # Discord refused this update; the next one may be fine
+                print(f"Discord presence update failed: {e}")
+                self.stats.failed += 1
+                continue
+            self.stats.sent += 1
+            last_sent = time.monotonic()
+        self._disconnect(errors)
+
+    def _disconnect(self, errors):
+        if self.rpc is None:
+            return
+        try:
+            self.rpc.close()
+        except errors + (RuntimeError,):
+            pass
+        self.rpc = None
@@ -0,0 +1,164 @@
+""" Find GTMedia receivers on the LAN.
+
+Every address of the given networks is probed concurrently with asyncio for
+an HTTP server on port 81 that answers `/getallservices` with a catalog.
+Asking for one service per page makes `pagetotal` the size of the catalog,
+so a single small request per host gives both latency and service count.
+
+    python discovery.py 192.168.1.0/24 10.0.0.0/24
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import socket
+import time
+
+from stb_client import DEFAULT_PORT
+
+PROBE_PATH = "/getallservices?count=1&page=1"
+MAX_RESPONSE = 64 * 1024
+
+
+class Receiver:
+    def __init__(self, ip_address, port, latency, services):
+        self.ip_address = ip_address
+        self.port = port
+        self.latency = latency
+        self.services = services
+
+    def __repr__(self):
+        return f"Receiver({self.ip_address}:{self.port}, {self.latency * 1000:.1f} ms, {self.services} services)"
+
+    def __str__(self):
+        return f"{self.ip_address}  -  {self.services} services, {self.latency * 1000:.0f} ms"
+
+
+def local_subnet(prefix=24):
+    """ Best guess at the LAN this machine is on, e.g. 192.168.1.0/24. """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            # No packet is sent; this only picks the outgoing interface
+            s.connect(("192.0.2.1", 9))
+            address = s.getsockname()[0]
+        except OSError:
+            address = "192.168.1.1"
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+
+def _parse_response(raw):
+    head, _, body = raw.partition(b"\r\n\r\n")
+    status_line = head.split(b"\r\n", 1)[0].split()
+    if len(status_line) < 2 or status_line[1] != b"200":
+        return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or "pagetotal" not in data or "services" not in data:
+        return None
+    try:
+        return int(data["pagetotal"])
+    except (TypeError, ValueError):
+        return None
+
+
+def _complete(raw):
+    """ True once the headers and `Content-Length` bytes of body have arrived. """
+    head, separator, body = raw.partition(b"\r\n\r\n")
+    if not separator:
+        return False
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            try:
+                return len(body) >= int(value)
+            except ValueError:
+                return False
+    return False
+
+
+async def probe(ip_address, port=DEFAULT_PORT, timeout=1.0):
+    """ Return a `Receiver` if `ip_address` looks like a GTMedia box, else None.
+
+    The whole exchange gets `timeout` seconds; a receiver that keeps the
+    connection open after a complete answer is judged on what it sent.
+    """
+    started = time.perf_counter()
+    raw = bytearray()
+    writer = None
+
+    async def exchange():
+        nonlocal writer
+        reader, writer = await asyncio.open_connection(ip_address, port)
+        # HTTP/1.0 so the body is never chunked
+        writer.write(f"GET {PROBE_PATH} HTTP/1.0\r\nHost: {ip_address}:{port}\r\n"
+                     f"Connection: close\r\n\r\n".encode())
+        while len(raw) < MAX_RESPONSE and not _complete(raw):
+            chunk = await reader.read(MAX_RESPONSE - len(raw))
+            if not chunk:
+                break
+            raw.extend(chunk)
+
+    try:
+        await asyncio.wait_for(exchange(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    except OSError:
+        return None
+    finally:
+        if writer:
+            writer.close()
+    services = _parse_response(bytes(raw))
+    if services is None:
+        return None
+    return Receiver(ip_address, port, time.perf_counter() - started, services)
+
+
+async def scan(networks, port=DEFAULT_PORT, concurrency=256, timeout=1.0, on_found=None):
+    """ Probe every host of `networks` (CIDR strings) and rank the receivers found.
+
+    At most `concurrency` connections are open at once. Receivers are sorted
+    by latency, then by catalog size.
+    """
+    limit = asyncio.Semaphore(concurrency)
+    found = []
+
+    async def probe_limited(ip_address):
+        async with limit:
+            receiver = await probe(ip_address, port, timeout)
+        if receiver:
+            found.append(receiver)
+            if on_found:
+                on_found(receiver)
+
+    hosts = []
+    for network in networks:
+        network = ipaddress.ip_network(network, strict=False)
+        hosts.extend(network.hosts() if network.num_addresses > 1 else [network.network_address])
+    await asyncio.gather(*(probe_limited(str(host)) for host in hosts))
+    found.sort(key=lambda receiver: (round(receiver.latency, 3), -receiver.services))
+    return found
+
+
+def discover(networks, port=DEFAULT_PORT, concurrency=256, timeout=1.0, on_found=None):
+    """ Blocking wrapper around `scan` for use from worker threads. """
+    if isinstance(networks, str):
+        networks = [networks]
+    return asyncio.run(scan(networks, port, concurrency, timeout, on_found))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find GTMedia receivers on the network.")
+    parser.add_argument("networks", nargs="*", help="CIDR ranges, default: the local /24")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    args = parser.parse_args()
+
+    networks = args.networks or [local_subnet()]
+    started = time.perf_counter()
+    receivers = discover(networks, args.port, args.concurrency, args.timeout)
+    print(f"Scanned {', '.join(networks)} in {time.perf_counter() - started:.2f}s")
+    for receiver in receivers:
+        print(receiver)
@@ -0,0 +1,261 @@
+""" A stand-in GTMedia receiver for development and benchmarks.
+
+Answers /getallservices and /proginfo with the same JSON shapes as the real
+receiver, and streams a synthetic MPEG-TS for every service it lists. The
+catalog size, response latency and jitter, and the share of requests that
+fail with HTTP 500 can all be set.
+
+    python mock_receiver.py --services 10000 --latency 20 --jitter 10 --error-rate 0.01 --port 8081
+    GTMEDIA_PORT=8081 python GTmedia.py    # then connect to 127.0.0.1
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+TS_PACKET = 188
+SATELLITES = ("Astra 19.2E", "Hotbird 13E", "Vinasat 132E", "Thaicom 78.5E", "Measat 91.5E")
+WORDS = ("News", "Sport", "Movie", "Music", "Kids", "Docu", "Travel", "Cinema", "Life", "World", "Live", "Plus")
+PCR_INTERVAL = 0.02
+SERVICES_PER_TRANSPONDER = 8
+
+
+def make_catalog(count, seed=0):
+    """ `count` services with receiver-style names and stream URLs.
+
+    About a third are scrambled, which the receiver marks with a leading `$`.
+    The URLs hold the stream path of the mock; `url_base` is filled in by
+    `MockReceiver`.
+    """
+    rng = random.Random(seed)
+    services = []
+    for service_id in range(1, count + 1):
+        name = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {service_id}"
+        if rng.random() < 0.3:
+            name = "$" + name
+        video_pid = 256 + (service_id % 32) * 16
+        services.append({
+            "id": service_id,
+            "servicename": name,
+            # Same field layout as the receiver; the audio PID is 4th from the end
+            "url": f"{{url_base}}/stream/{service_id}_{video_pid}_{video_pid + 1}_{service_id % 7}_0_0",
+        })
+    return services
+
+
+class SyntheticStream:
+    """ TS packets on a video and an audio PID, with a PCR every 20 ms. """
+
+    def __init__(self, video_pid, audio_pid, bitrate):
+        self.pids = (video_pid, audio_pid)
+        self.counters = [0, 0]
+        self.packets_per_tick = max(2, round(bitrate * PCR_INTERVAL / (TS_PACKET * 8)))
+        self.pcr = 0
+
+    def _header(self, which, adaptation=False):
+        pid = self.pids[which]
+        counter = self.counters[which]
+        self.counters[which] = (counter + 1) % 16
+        return bytes((0x47, (pid >> 8) & 0x1F, pid & 0xFF, (0x30 if adaptation else 0x10) | counter))
+
+    def tick(self):
+        """ The packets of the next 20 ms. """
+        base, extension = divmod(self.pcr, 300)
+        adaptation = bytes((7, 0x10, (base >> 25) & 0xFF, (base >> 17) & 0xFF, (base >> 9) & 0xFF,
+                            (base >> 1) & 0xFF, ((base & 1) << 7) | 0x7E | ((extension >> 8) & 1),
+                            extension & 0xFF))
+        packets = [self._header(0, True) + adaptation + b"\xff" * (TS_PACKET - 12)]
+        for i in range(1, self.packets_per_tick):
+            packets.append(self._header(1 if i % 10 == 0 else 0) + b"\xff" * (TS_PACKET - 4))
+        self.pcr += int(PCR_INTERVAL * 27_000_000)
+        return b"".join(packets)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, a keep-alive
+    # client waits for a delayed ACK (~40 ms) on every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        receiver = self.server.receiver
+        parts = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        receiver.count(parts.path)
+        receiver.delay()
+        if parts.path.startswith("/stream/"):
+            return self._stream(parts.path[len("/stream/"):])
+        if receiver.should_fail():
+            receiver.count("errors")
+            return self._send(500, {"error": "mock failure"})
+        if parts.path == "/getallservices":
+            try:
+                return self._send(200, receiver.page(int(query.get("page", 1)), int(query.get("count", 100))))
+            except ValueError:
+                return self._send(400, {"error": "bad page or count"})
+        if parts.path == "/proginfo":
+            info = receiver.proginfo(query.get("id"))
+            return self._send(200, info) if info else self._send(404, {"error": "unknown service"})
+        self._send(404, {"error": "not found"})
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, fields):
+        parts = fields.split("_")
+        try:
+            service = self.server.receiver.service(parts[0])
+            stream = SyntheticStream(int(parts[1]), int(parts[2]), self.server.receiver.stream_bitrate)
+        except (IndexError, ValueError):
+            service = None
+        if service is None:
+            return self._send(404, {"error": "unknown service"})
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp2t")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        started = time.perf_counter()
+        ticks = 0
+        try:
+            while not self.server.receiver.stopping.is_set():
+                self.wfile.write(stream.tick())
+                ticks += 1
+                time.sleep(max(0.0, started + ticks * PCR_INTERVAL - time.perf_counter()))
+        except OSError:
+            pass
+
+
+class MockReceiver:
+    """ The fake receiver; `start` serves it on a background thread.
+
+    Each request waits `latency` ± `jitter` seconds, and `error_rate` of the
+    JSON requests fail with HTTP 500. Streams run at `stream_bitrate`. With
+    `paging` off, /getallservices ignores `page` like some firmware does.
+    """
+
+    def __init__(self, services=1000, host="127.0.0.1", port=81, latency=0.0, jitter=0.0,
+                 error_rate=0.0, stream_bitrate=8_000_000, seed=0, paging=True):
+        self.host = host
+        self.paging = paging
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stream_bitrate = stream_bitrate
+        self.random = random.Random(seed)
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.receiver = self
+        self.port = self.server.server_address[1]
+        url_base = f"http://{host}:{self.port}"
+        self.services = [dict(service, url=service["url"].format(url_base=url_base))
+                         for service in make_catalog(services, seed)]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-receiver", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __str__(self):
+        with self.lock:
+            counts = ", ".join(f"{path} {count}" for path, count in sorted(self.stats.items()))
+        return f"mock receiver on {self.host}:{self.port} with {len(self.services)} services: {counts or 'no requests'}"
+
+    def count(self, key):
+        with self.lock:
+            self.stats["/stream" if key.startswith("/stream/") else key] += 1
+
+    def delay(self):
+        if self.latency or self.jitter:
+            with self.lock:
+                seconds = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            time.sleep(max(0.0, seconds))
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def service(self, service_id):
+        try:
+            index = int(service_id) - 1
+        except (TypeError, ValueError):
+            return None
+        return self.services[index] if 0 <= index < len(self.services) else None
+
+    def page(self, page, count):
+        count = max(1, count)
+        if not self.paging:
+            page = 1
+        return {
+            "count": count,
+            "pagetotal": max(1, math.ceil(len(self.services) / count)),
+            "services": self.services[(page - 1) * count:page * count] if page > 0 else [],
+        }
+
+    def proginfo(self, service_id):
+        service = self.service(service_id)
+        if service is None:
+            return None
+        video_pid, audio_pid = service["url"].split("_")[1:3]
+        # Like a real satellite, every transponder carries several services
+        transponder = (service["id"] - 1) // SERVICES_PER_TRANSPONDER
+        with self.lock:
+            intensity, quality = self.random.randint(60, 95), self.random.randint(50, 90)
+            rate = self.random.uniform(2, 12)
+        return {
+            "servicename": service["servicename"].lstrip("$"),
+            "satname": SATELLITES[transponder % len(SATELLITES)],
+            "FQ": f"{10700 + transponder % 2000} {'HV'[transponder % 2]} 27500",
+            "PID": f"{video_pid}/{audio_pid}/{int(audio_pid) + 1}",
+            "intensity": str(intensity),
+            "quality": str(quality),
+            "rev_rate": f"{rate:.2f}",
+            "send_rate": f"{rate * 0.98:.2f}",
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake GTMedia receiver API and streams.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=81)
+    parser.add_argument("--services", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0, help="milliseconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="± milliseconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of JSON requests answered with 500")
+    parser.add_argument("--bitrate", type=float, default=8.0, help="stream bitrate in Mbit/s")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-paging", action="store_true", help="ignore the page parameter")
+    args = parser.parse_args()
+
+    receiver = MockReceiver(args.services, args.host, args.port, args.latency / 1000, args.jitter / 1000,
+                            args.error_rate, args.bitrate * 1e6, args.seed, paging=not args.no_paging).start()
+    print(f"Serving {len(receiver.services)} services on http://{args.host}:{receiver.port}")
+    try:
+        while True:
+            time.sleep(10)
+            print(receiver)
+    except KeyboardInterrupt:
+        pass
+    receiver.stop()
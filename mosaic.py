@@ -0,0 +1,166 @@
+""" Several services at once, within what the receiver's tuners can deliver.
+
+A tuner receives one transponder at a time, and every service on that
+transponder comes with it. So a mosaic of nine services costs one tuner if
+they share a transponder, and nine if they do not. `TunerScheduler` admits
+a service only if its transponder (satellite and `FQ` from /proginfo) is
+already tuned or a tuner is free. Transponders in use elsewhere, e.g. by
+recordings, count against the limit. The receiver does not report how many
+tuners it has: set GTMEDIA_TUNERS, default 1.
+
+Tiles are small, so they are decoded cheaply, see `TILE_OPTIONS`. All tiles
+share one libvlc instance. Per-tile frame counts come from libvlc's media
+statistics. libvlc decodes every player on threads of this one process, so
+per-tile CPU is an estimate: the process CPU time split by each tile's
+share of the decoded frames.
+
+Run as a script to see which services a mosaic around a service would show:
+
+    GTMEDIA_TUNERS=2 python mosaic.py 192.168.1.10 --service 1204 --tiles 9
+"""
+import argparse
+import os
+import time
+
+from stb_client import STBError
+
+DEFAULT_TUNERS = int(os.environ.get("GTMEDIA_TUNERS", 1))
+MIN_TILES, MAX_TILES = 4, 16
+# Decoder limits for every tile: decode at half resolution where the codec
+# supports it (MPEG-2 does, H.264 does not), skip the deblocking filter and
+# B-frames, and drop late frames instead of queueing them
+TILE_OPTIONS = (":avcodec-lowres=1", ":avcodec-skiploopfilter=4", ":avcodec-skip-frame=1",
+                ":avcodec-hurry-up", ":avcodec-fast", ":avcodec-threads=1")
+# Program info is looked up for at most this many candidates per tile
+LOOKUPS_PER_TILE = 4
+
+
+def transponder_of(info):
+    """ The transponder a service is on: its satellite and "frequency polarization symbol rate". """
+    return info["satname"], " ".join(str(info["FQ"]).upper().split())
+
+
+class TunerScheduler:
+    """ Admits services for as long as their transponders fit on `tuners` tuners. """
+
+    def __init__(self, tuners=DEFAULT_TUNERS, busy=()):
+        self.tuners = tuners
+        self.transponders = set(busy)
+
+    def admit(self, info):
+        """ True if the service can be streamed; takes a tuner if it needs one. """
+        transponder = transponder_of(info)
+        if transponder in self.transponders:
+            return True
+        if len(self.transponders) < self.tuners:
+            self.transponders.add(transponder)
+            return True
+        return False
+
+
+def by_distance(row, count, total):
+    """ Rows `row`, row + 1, row - 1, row + 2, ... within 0..total, at most `count`. """
+    rows = [row]
+    for offset in range(1, total):
+        for candidate in (row + offset, row - offset):
+            if 0 <= candidate < total:
+                rows.append(candidate)
+        if len(rows) >= count or offset > max(row, total - row):
+            break
+    return rows[:count]
+
+
+def plan(client, candidates, tiles, scheduler, task=None):
+    """ The first `tiles` of `candidates` the scheduler admits, as (service, info) pairs.
+
+    Also returns how many candidates were turned away for lack of a tuner.
+    Program info is fetched for at most `LOOKUPS_PER_TILE * tiles` candidates.
+    """
+    chosen = []
+    refused = 0
+    for service in candidates[:tiles * LOOKUPS_PER_TILE]:
+        if len(chosen) == tiles:
+            break
+        if task:
+            task.check()
+        try:
+            info = client.cached_proginfo(service["id"], volatile=False)
+        except STBError as e:
+            print(f"Mosaic: no program info for {service['servicename']}: {e}")
+            continue
+        if scheduler.admit(info):
+            chosen.append((service, info))
+        else:
+            refused += 1
+    return chosen, refused
+
+
+class TileStats:
+    """ Frame counts of one tile from successive libvlc media statistics. """
+
+    def __init__(self):
+        self.decoded = 0
+        self.displayed = 0
+        self.lost = 0
+        self.bitrate = 0.0
+        self.decoded_rate = 0.0
+        self.sampled_at = None
+
+    def update(self, stats, now=None):
+        """ Take a `vlc.MediaStats` snapshot; returns the frames decoded since the last one. """
+        now = time.monotonic() if now is None else now
+        decoded = max(0, stats.decoded_video - self.decoded)
+        if self.sampled_at is not None and now > self.sampled_at:
+            self.decoded_rate = decoded / (now - self.sampled_at)
+        self.decoded = stats.decoded_video
+        self.displayed = stats.displayed_pictures
+        self.lost = stats.lost_pictures
+        # libvlc reports bytes per millisecond
+        self.bitrate = stats.demux_bitrate * 8000
+        self.sampled_at = now
+        return decoded
+
+
+class CpuMeter:
+    """ CPU use of this process, in percent of one core, between two `sample` calls. """
+
+    def __init__(self):
+        self.wall = time.monotonic()
+        self.cpu = time.process_time()
+
+    def sample(self):
+        wall, cpu = time.monotonic(), time.process_time()
+        percent = (cpu - self.cpu) / (wall - self.wall) * 100 if wall > self.wall else 0.0
+        self.wall, self.cpu = wall, cpu
+        return percent
+
+
+def split_cpu(percent, decoded):
+    """ `percent` shared out in proportion to the frames each tile decoded. """
+    total = sum(decoded)
+    return [percent * count / total if total else 0.0 for count in decoded]
+
+
+if __name__ == "__main__":
+    from catalog_loader import CatalogLoader
+    from stb_client import get_client
+
+    parser = argparse.ArgumentParser(description="Plan a mosaic around a service.")
+    parser.add_argument("ip_address")
+    parser.add_argument("--service", type=int, help="service id to center on, default: the first")
+    parser.add_argument("--tiles", type=int, default=9, choices=range(MIN_TILES, MAX_TILES + 1), metavar="4..16")
+    parser.add_argument("--tuners", type=int, default=DEFAULT_TUNERS)
+    args = parser.parse_args()
+
+    client = get_client(args.ip_address)
+    services = CatalogLoader(client).load()
+    ids = [service["id"] for service in services]
+    row = ids.index(args.service) if args.service in ids else 0
+    candidates = [services[i] for i in by_distance(row, args.tiles * LOOKUPS_PER_TILE, len(services))]
+    scheduler = TunerScheduler(args.tuners)
+    chosen, refused = plan(client, candidates, args.tiles, scheduler)
+    for service, info in chosen:
+        satellite, fq = transponder_of(info)
+        print(f"{service['servicename']:<32} {satellite} {fq}")
+    print(f"{len(chosen)} of {args.tiles} tiles on {len(scheduler.transponders)} transponder(s) "
+          f"with {args.tuners} tuner(s); {refused} service(s) needed another tuner")
@@ -0,0 +1,297 @@
+""" End-to-end benchmarks of both front ends against `mock_receiver`.
+
+For every catalog size a mock receiver is started and each scenario runs in
+a fresh Python process, so the peak memory it reports is its own:
+
+- catalog: `CatalogLoader` time to the first page and to the full catalog
+- qt, tk: time for `MainWindow` / `App` to fill the service list from the
+  receiver, and the latency from selecting a service to its info showing
+- qt_startup, tk_startup: time to interactive with the catalog cached, from
+  process start (see `startup`)
+
+Results are written as JSON tagged with the git commit, so runs from two
+commits can be compared:
+
+    python perf_suite.py --sizes 1000 10000 50000 --latency 5 -o before.json
+    python perf_suite.py --sizes 1000 10000 50000 --latency 5 -o after.json
+    python perf_suite.py --compare before.json after.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_receiver import MockReceiver
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("catalog", "qt", "tk", "qt_startup", "tk_startup")
+HOST = "127.0.0.1"
+
+
+def peak_rss_mib():
+    """ Peak resident memory of this process, None where it cannot be read. """
+    # ru_maxrss survives exec on Linux, so a child would report the suite's
+    # own peak; VmHWM starts afresh with the new program
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))] if samples else None
+
+
+def _wait(condition, pump, timeout=120.0):
+    """ Run the GUI event loop until `condition()` holds; 1 ms resolution. """
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("the front end did not finish in time")
+        pump()
+        time.sleep(0.001)
+
+
+def _load_front_end(filename, module_name):
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _expected_name(service):
+    # mock_receiver reports names without the scrambled marker
+    return service["servicename"].lstrip("$")
+
+
+def run_catalog(port, services, selections):
+    from catalog_loader import CatalogLoader
+    from stb_client import STBClient
+
+    rss_before = peak_rss_mib()
+    first_page = []
+    started = time.perf_counter()
+    loader = CatalogLoader(STBClient(HOST, port))
+    loaded = loader.load(on_page=lambda page: first_page or first_page.append(time.perf_counter() - started))
+    return {"first_page_s": first_page[0], "load_s": time.perf_counter() - started, "services": len(loaded),
+            "rss_before_mib": rss_before, "peak_rss_mib": peak_rss_mib()}
+
+
+def run_qt(port, services, selections):
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    module = _load_front_end("GTMedia-Qt.py", "gtmedia_qt")
+    rss_before = peak_rss_mib()
+    started = time.perf_counter()
+    window = module.MainWindow()
+    startup = time.perf_counter() - started
+    model = window.services_model
+    window.set_ip_address(HOST)
+
+    started = time.perf_counter()
+    window.get_services()
+    _wait(lambda: len(model.store) > 0, app.processEvents)
+    first_rows = time.perf_counter() - started
+    _wait(lambda: len(model.store) == services and window.get_button.isEnabled(), app.processEvents)
+    populate = time.perf_counter() - started
+
+    latencies = []
+    label = window.info_labels["Service Name"]
+    for row in random.Random(0).sample(range(services), min(selections, services)):
+        index = model.index(row, 0)
+        expected = _expected_name(model.service(index))
+        started = time.perf_counter()
+        window.services_list.setCurrentIndex(index)
+        window.on_service_selected(index)
+        _wait(lambda: label.text() == expected, app.processEvents)
+        latencies.append(time.perf_counter() - started)
+    return _front_end_result(startup, first_rows, populate, latencies, rss_before)
+
+
+def run_tk(port, services, selections):
+    module = _load_front_end("GTmedia.py", "gtmedia_tk")
+    rss_before = peak_rss_mib()
+    started = time.perf_counter()
+    app = module.App()
+    app.update()
+    startup = time.perf_counter() - started
+    service_list = app.services_list
+    app.set_ip_address(HOST)
+
+    started = time.perf_counter()
+    app.get_services()
+    _wait(lambda: len(service_list) > 0, app.update)
+    first_rows = time.perf_counter() - started
+    _wait(lambda: len(service_list) == services and str(app.get_button["state"]) == "normal", app.update)
+    populate = time.perf_counter() - started
+
+    latencies = []
+    label = app.info_labels["Service Name"]
+    for row in random.Random(0).sample(range(services), min(selections, services)):
+        service = service_list.service(row)
+        expected = _expected_name(service)
+        started = time.perf_counter()
+        service_list.select(row)
+        app.show_service_info(service)
+        _wait(lambda: label.cget("text") == expected, app.update)
+        latencies.append(time.perf_counter() - started)
+    return _front_end_result(startup, first_rows, populate, latencies, rss_before)
+
+
+def _front_end_result(startup, first_rows, populate, latencies, rss_before):
+    return {"startup_s": startup, "first_rows_s": first_rows, "populate_s": populate,
+            "select_p50_ms": _percentile(latencies, 0.5) * 1000, "select_p90_ms": _percentile(latencies, 0.9) * 1000,
+            "select_max_ms": max(latencies) * 1000, "rss_before_mib": rss_before, "peak_rss_mib": peak_rss_mib()}
+
+
+def run_startup(front_end, port, services, selections):
+    from catalog_cache import CatalogCache
+    from catalog_loader import CatalogLoader
+    from stb_client import STBClient
+    import startup
+
+    # As on every launch after the first, the window opens on the cached catalog
+    cache = CatalogCache()
+    cache.save(HOST, CatalogLoader(STBClient(HOST, port)).load())
+    cache.close()
+    samples = startup.measure(front_end, runs=5)
+    return {"tti_median_s": statistics.median(samples), "tti_max_s": max(samples)}
+
+
+RUNNERS = {"catalog": run_catalog, "qt": run_qt, "tk": run_tk,
+           "qt_startup": lambda *args: run_startup("qt", *args),
+           "tk_startup": lambda *args: run_startup("tk", *args)}
+
+
+def _run_child(scenario, port, services, selections, cache_dir):
+    """ Run one scenario in a new interpreter; returns its result dict. """
+    env = dict(os.environ, GTMEDIA_PORT=str(port), XDG_CACHE_HOME=cache_dir, LOCALAPPDATA=cache_dir)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    with tempfile.NamedTemporaryFile("r", suffix=".json", delete=False) as result_file:
+        result_path = result_file.name
+    try:
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), "--scenario", scenario,
+                                  "--port", str(port), "--services", str(services),
+                                  "--selections", str(selections), "--result", result_path],
+                                 env=env, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        with open(result_path) as f:
+            text = f.read()
+        if text:
+            return json.loads(text)
+        lines = process.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit status {process.returncode}"}
+    finally:
+        os.unlink(result_path)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(sizes, scenarios=SCENARIOS, selections=20, latency=0.0, jitter=0.0, error_rate=0.0):
+    results = {"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+               "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "receiver": {"latency_s": latency, "jitter_s": jitter, "error_rate": error_rate},
+               "sizes": {}}
+    for size in sizes:
+        receiver = MockReceiver(size, HOST, 0, latency, jitter, error_rate).start()
+        results["sizes"][str(size)] = by_scenario = {}
+        try:
+            for scenario in scenarios:
+                # A fresh cache directory, so every run starts cold
+                with tempfile.TemporaryDirectory() as cache_dir:
+                    by_scenario[scenario] = result = _run_child(scenario, receiver.port, size, selections, cache_dir)
+                print(f"{size:>6} {scenario:<8} {_format_result(result)}")
+        finally:
+            receiver.stop()
+    return results
+
+
+def _format_result(result):
+    if "error" in result:
+        return f"failed: {result['error']}"
+    return "  ".join(f"{key} {value:.3f}" if isinstance(value, float) else f"{key} {value}"
+                     for key, value in result.items() if value is not None)
+
+
+def compare(before, after, threshold=0.1):
+    """ Print every metric of two result files side by side; returns the regressions. """
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    regressions = []
+    for size, scenarios in after["sizes"].items():
+        for scenario, result in scenarios.items():
+            old_result = before["sizes"].get(size, {}).get(scenario, {})
+            for key, value in result.items():
+                old = old_result.get(key)
+                if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or key == "services":
+                    continue
+                change = (value - old) / old if old else 0.0
+                # Every metric is a time or a size: higher is worse
+                flag = " <- regression" if change > threshold else ""
+                if flag:
+                    regressions.append((size, scenario, key, change))
+                print(f"{size:>6} {scenario:<8} {key:<16} {old:10.3f} -> {value:10.3f} {change * 100:+7.1f}%{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark catalog loading and both front ends on a mock receiver.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--selections", type=int, default=20, help="services selected per front end")
+    parser.add_argument("--latency", type=float, default=0.0, help="receiver latency in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="± milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    # Used by the suite to run a single scenario in a child process
+    parser.add_argument("--scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--services", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        result = RUNNERS[args.scenario](args.port, args.services, args.selections)
+        with open(args.result, "w") as f:
+            json.dump(result, f)
+        sys.stdout.flush()
+        # Skip the front ends' quit dialogs and worker shutdown
+        os._exit(0)
+    elif args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        sys.exit(1 if compare(before, after, args.threshold / 100) else 0)
+    else:
+        results = run_suite(args.sizes, args.scenarios, args.selections, args.latency / 1000,
+                            args.jitter / 1000, args.error_rate)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to {args.output}")
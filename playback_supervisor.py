@@ -0,0 +1,267 @@
+""" Keeps live playback running and picks libvlc's network caching per receiver.
+
+libvlc gives up on a live stream that dies. After an error or "end reached",
+or when a receiver stops sending but leaves the connection open, the last
+picture just stays frozen on screen. `PlaybackSupervisor` watches the
+player's error, end-reached and buffering events. Twice a second it also
+checks that the input is still reading bytes. When the stream is dead, it
+reopens it after a backoff delay: 0.5 s, doubling up to 15 s. The delay goes
+back to the start once playback has run for 30 s.
+
+`CachingPolicy` picks `network-caching` for one receiver from `LADDER_MS`. It
+starts at the lowest level that covers the jitter measured on the
+receiver's HTTP API (p90 minus p50 of recent /proginfo round trips). Each
+stall moves it up one step. Each 5 minutes without a stall moves it back
+down one step. A quiet LAN stays at 300 ms, while a link that keeps stalling
+climbs to a few seconds. The new value applies the next time a stream is
+opened, and a reconnect is one such time.
+
+Run as a script to replay a sequence of stalls through the policy:
+
+    python playback_supervisor.py --jitter-ms 40 --stalls 0,20,25,400,1000
+"""
+import argparse
+import threading
+import time
+from urllib.parse import urlsplit
+
+import stb_client
+from telemetry import metrics
+
+LADDER_MS = (300, 500, 800, 1200, 2000, 3000, 5000)
+BACKOFF = (0.5, 1.0, 2.0, 4.0, 8.0, 15.0)
+
+
+def spread(samples):
+    """ p90 - p50 of `samples`, 0 for fewer than 5. """
+    if len(samples) < 5:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[int(0.9 * (len(ordered) - 1))] - ordered[len(ordered) // 2]
+
+
+class CachingPolicy:
+    """ The network caching for one receiver, from its jitter and its stalls. """
+
+    def __init__(self, calm_period=300.0, clock=time.monotonic):
+        self.calm_period = calm_period
+        self.clock = clock
+        self.jitter = 0.0
+        self.stalls = 0
+        self.steps = 0
+        self.calm_since = clock()
+
+    def base_level(self):
+        # Room for a few round trips of jitter on top of a LAN's worth
+        needed = 200 + 4 * self.jitter * 1000
+        return next((i for i, ms in enumerate(LADDER_MS) if ms >= needed), len(LADDER_MS) - 1)
+
+    def stalled(self):
+        self.stalls += 1
+        self.steps = min(self.steps + 1, len(LADDER_MS) - 1)
+        self.calm_since = self.clock()
+
+    def caching_ms(self):
+        now = self.clock()
+        while self.steps and now - self.calm_since >= self.calm_period:
+            self.steps -= 1
+            self.calm_since += self.calm_period
+        return LADDER_MS[min(self.base_level() + self.steps, len(LADDER_MS) - 1)]
+
+    def options(self):
+        return (f":network-caching={self.caching_ms()}", ":http-reconnect")
+
+
+class PlaybackSupervisor:
+    """ Reconnects `zapper`'s player when the stream dies and chooses its caching.
+
+    Call `attach` once the zapper has a player. `on_change` is called with no
+    arguments, on a background thread, whenever `status()` changes.
+    """
+
+    def __init__(self, zapper, on_change=None, stall_timeout=6.0, stable_after=30.0, poll_interval=0.5):
+        self.zapper = zapper
+        self.on_change = on_change
+        self.stall_timeout = stall_timeout
+        self.stable_after = stable_after
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.policies = {}
+        self.reconnects = 0
+        self.attempt = 0
+        self.reconnect_at = None
+        self.dead = None
+        self.playing_since = None
+        self.stalling = False
+        self.host = None
+        self.events = None
+        self.stopping = threading.Event()
+        self.thread = None
+        zapper.media_options = self.media_options
+
+    def policy(self, host):
+        with self.lock:
+            policy = self.policies.get(host)
+            if policy is None:
+                policy = self.policies[host] = CachingPolicy()
+            return policy
+
+    def media_options(self, url):
+        """ The libvlc options for a stream from the receiver at `url`. """
+        host = urlsplit(url).hostname
+        policy = self.policy(host)
+        client = stb_client.get_client(host) if host else None
+        if client is not None:
+            policy.jitter = spread(list(client.latencies))
+        return policy.options()
+
+    def attach(self, player):
+        import vlc
+
+        self.player = player
+        self.vlc = vlc
+        self.media_stats = vlc.MediaStats()
+        self.host = urlsplit(self.zapper.current_url or "").hostname
+        # A wrapper of our own: each one holds a single callback per event type
+        self.events = events = player.event_manager()
+        events.event_attach(vlc.EventType.MediaPlayerOpening, self._on_opening)
+        events.event_attach(vlc.EventType.MediaPlayerPlaying, self._on_playing)
+        events.event_attach(vlc.EventType.MediaPlayerBuffering, self._on_buffering)
+        events.event_attach(vlc.EventType.MediaPlayerEncounteredError, self._on_dead)
+        events.event_attach(vlc.EventType.MediaPlayerEndReached, self._on_dead)
+        self.thread = threading.Thread(target=self._watch, name="playback-supervisor", daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        """ Drop a pending reconnect, e.g. when the player was stopped on purpose. """
+        self.reconnect_at = None
+        self.dead = None
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    # libvlc event threads: no libvlc calls here, the watchdog acts on these
+
+    def _on_opening(self, event):
+        # The user zapped, or our reconnect went through: nothing left to retry
+        self.reconnect_at = None
+        self.playing_since = None
+        self.stalling = False
+        self.host = urlsplit(self.zapper.current_url or "").hostname
+        self._changed()
+
+    def _on_playing(self, event):
+        if self.playing_since is None:
+            self.playing_since = time.monotonic()
+        self.dead = None
+
+    def _on_buffering(self, event):
+        if self.playing_since is None:
+            return
+        if event.u.new_cache < 100:
+            if not self.stalling:
+                self.stalling = True
+                self._stalled("rebuffer")
+        else:
+            self.stalling = False
+
+    def _on_dead(self, event):
+        self.dead = "error" if event.type == self.vlc.EventType.MediaPlayerEncounteredError else "end"
+
+    def _stalled(self, reason):
+        if self.host:
+            self.policy(self.host).stalled()
+        metrics.increment("playback_stalls_total", reason=reason)
+        self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def _watch(self):
+        last_read = None
+        progress_at = time.monotonic()
+        while not self.stopping.wait(self.poll_interval):
+            now = time.monotonic()
+            if self.reconnect_at is not None:
+                if now >= self.reconnect_at:
+                    self.reconnect_at = None
+                    self._reconnect()
+                    last_read, progress_at = None, time.monotonic()
+                continue
+            if self.dead:
+                self._schedule(self.dead)
+                continue
+            if self.player.get_state() not in (self.vlc.State.Playing, self.vlc.State.Buffering):
+                last_read, progress_at = None, now
+                continue
+            media = self.player.get_media()
+            if media is not None and media.get_stats(self.media_stats):
+                read = self.media_stats.read_bytes
+                if read != last_read:
+                    last_read, progress_at = read, now
+                elif now - progress_at >= self.stall_timeout:
+                    self._stalled("frozen")
+                    self._schedule("frozen")
+                    continue
+            if self.attempt and self.playing_since is not None and now - self.playing_since >= self.stable_after:
+                self.attempt = 0
+                self._changed()
+
+    def _schedule(self, reason):
+        """ Reconnect after the next backoff delay. """
+        self.dead = None
+        delay = BACKOFF[min(self.attempt, len(BACKOFF) - 1)]
+        self.attempt += 1
+        self.reconnect_at = time.monotonic() + delay
+        print(f"Stream lost ({reason}), reconnecting in {delay:g} s (attempt {self.attempt})")
+        metrics.increment("playback_reconnects_total", reason=reason)
+
+    def _reconnect(self):
+        if not self.zapper.current_url:
+            return
+        self.reconnects += 1
+        self.playing_since = None
+        self.zapper.restart()
+        self._changed()
+
+    def status(self):
+        """ One line for the status bar: the caching in use and the reconnects so far. """
+        text = f"{self.reconnects} reconnect{'s' if self.reconnects != 1 else ''}"
+        host = self.host or urlsplit(self.zapper.current_url or "").hostname
+        if host:
+            policy = self.policy(host)
+            text = (f"Caching {policy.caching_ms()} ms (jitter {policy.jitter * 1000:.0f} ms, "
+                    f"{policy.stalls} stall{'s' if policy.stalls != 1 else ''}), {text}")
+        if self.reconnect_at is not None:
+            text += f", retrying in {max(0.0, self.reconnect_at - time.monotonic()):.0f} s"
+        return text
+
+
+def benchmark(jitter_ms=5.0, stall_times=(), duration=1800.0, step=60.0):
+    """ The caching chosen over `duration` seconds for stalls at `stall_times`. """
+    clock = [0.0]
+    policy = CachingPolicy(clock=lambda: clock[0])
+    policy.jitter = jitter_ms / 1000
+    stalls = sorted(stall_times)
+    chosen = []
+    while clock[0] <= duration:
+        while stalls and stalls[0] <= clock[0]:
+            stalls.pop(0)
+            policy.stalled()
+        chosen.append((clock[0], policy.caching_ms()))
+        clock[0] += step
+    for at, caching in chosen:
+        print(f"{at:6.0f} s  {caching:5d} ms")
+    return chosen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay stalls through the caching policy.")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--stalls", default="", help="comma-separated seconds at which the stream stalls")
+    parser.add_argument("--duration", type=float, default=1800.0)
+    args = parser.parse_args()
+    benchmark(args.jitter_ms, [float(at) for at in args.stalls.split(",") if at], args.duration)
@@ -0,0 +1,126 @@
+""" Export receiver catalogs as M3U or XSPF playlists, without the GUI.
+
+Entries are written as catalog pages arrive, so memory stays flat however
+large the catalog is. Each stream URL gets the audio PID from /proginfo, the
+same correction the "Copy URL" button applies; those lookups run a few at a
+time per page.
+
+    python playlist_export.py 192.168.1.10 -o channels.m3u --group-by satname
+    python playlist_export.py 192.168.1.10 192.168.1.11 --format xspf -o all.xspf
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+import stb_client
+from catalog_loader import CatalogLoader
+from stb_client import DEFAULT_PORT, STBError
+
+GROUP_KEYS = ("receiver", "satname", "FQ")
+
+
+class M3UWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def begin(self):
+        self.stream.write("#EXTM3U\n")
+
+    def add(self, title, url, group=None):
+        attributes = ' group-title="{}"'.format(group.replace('"', "'")) if group else ""
+        self.stream.write(f"#EXTINF:-1{attributes},{title}\n{url}\n")
+
+    def end(self):
+        pass
+
+
+class XSPFWriter:
+    """ XSPF has no notion of groups; the group goes into `<album>`, which is
+    what players such as VLC sort and group tracks by. """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def begin(self):
+        self.stream.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                          '<playlist version="1" xmlns="http://xspf.org/ns/0/">\n'
+                          '  <trackList>\n')
+
+    def add(self, title, url, group=None):
+        album = f"<album>{escape(group)}</album>" if group else ""
+        self.stream.write(f"    <track><location>{escape(url)}</location>"
+                          f"<title>{escape(title)}</title>{album}</track>\n")
+
+    def end(self):
+        self.stream.write("  </trackList>\n</playlist>\n")
+
+
+WRITERS = {"m3u": M3UWriter, "xspf": XSPFWriter}
+
+
+def _proginfo(client, service):
+    try:
+        return client.cached_proginfo(service["id"], volatile=False)
+    except STBError as e:
+        print(f"{client.ip_address}: no /proginfo for {service['servicename']}: {e}", file=sys.stderr)
+        return None
+
+
+def export(ip_addresses, writer, port=DEFAULT_PORT, group_by=None, concurrency=8, proginfo=True):
+    """ Write the catalogs of `ip_addresses` to `writer`; returns the entry count.
+
+    Without `proginfo` the URLs are written as the receiver lists them and
+    only `receiver` grouping is available.
+    """
+    count = 0
+    writer.begin()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ip_address in ip_addresses:
+            client = stb_client.get_client(ip_address, port)
+            loader = CatalogLoader(client)
+            for page in loader.pages():
+                infos = pool.map(lambda service: _proginfo(client, service), page) if proginfo else [None] * len(page)
+                for service, info in zip(page, infos):
+                    url = service["url"]
+                    if info:
+                        url = stb_client.corrected_stream_url(url, stb_client.audio_pid_of(info))
+                    if group_by == "receiver":
+                        group = ip_address
+                    elif group_by and info:
+                        group = str(info[group_by])
+                    else:
+                        group = None
+                    writer.add(service["servicename"], url, group)
+                    count += 1
+            print(f"{ip_address}: {loader.stats}", file=sys.stderr)
+    writer.end()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write receiver catalogs to an M3U or XSPF playlist.")
+    parser.add_argument("ip_addresses", nargs="+")
+    parser.add_argument("-o", "--output", default="-", help="playlist file, default: standard output")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="default: from the output file extension, else m3u")
+    parser.add_argument("--group-by", choices=GROUP_KEYS)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel /proginfo lookups")
+    parser.add_argument("--no-proginfo", action="store_true", help="skip the audio PID correction")
+    args = parser.parse_args()
+
+    playlist_format = args.format or ("xspf" if args.output.lower().endswith(".xspf") else "m3u")
+    if args.no_proginfo and args.group_by in ("satname", "FQ"):
+        parser.error(f"--group-by {args.group_by} needs /proginfo")
+    stream = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    started = time.perf_counter()
+    try:
+        entries = export(args.ip_addresses, WRITERS[playlist_format](stream), args.port,
+                         args.group_by, args.concurrency, not args.no_proginfo)
+    except STBError as e:
+        sys.exit(f"Export failed: {e}")
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    print(f"Wrote {entries} entries in {time.perf_counter() - started:.2f}s", file=sys.stderr)
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+STATIC_KEYS = ("servicename", "satname", "FQ", "PID")
+VOLATILE_KEYS = ("intensity", "quality", "rev_rate", "send_rate")
+
+
+class _Entry:
+    """ Cached info with one timestamp per field group. """
+    __slots__ = ("info", "static_at", "volatile_at")
+
+    def __init__(self):
+        self.info = {}
+        self.static_at = None
+        self.volatile_at = None
+
+    def update(self, info, now):
+        self.info = {**self.info, **info}
+        if any(key in info for key in STATIC_KEYS):
+            self.static_at = now
+        if any(key in info for key in VOLATILE_KEYS):
+            self.volatile_at = now
+
+    @staticmethod
+    def _age(fetched_at, now):
+        return float("inf") if fetched_at is None else now - fetched_at
+
+    def static_age(self, now):
+        return self._age(self.static_at, now)
+
+    def volatile_age(self, now):
+        return self._age(self.volatile_at, now)
+
+
+class ProgInfoCache:
+    """ LRU cache of /proginfo results keyed by service id.
+
+    Tuning data (`STATIC_KEYS`) rarely changes and is kept for `static_ttl`
+    seconds, while the signal readings (`VOLATILE_KEYS`) are only trusted for
+    `volatile_ttl` seconds. Each group carries its own timestamp, so a lookup
+    only goes to the receiver when a group it needs has gone stale.
+    Concurrent lookups of the same id share a single request to the receiver.
+    """
+
+    def __init__(self, fetch, static_ttl=600.0, volatile_ttl=2.0, maxsize=512, clock=time.monotonic):
+        self.fetch = fetch
+        self.static_ttl = static_ttl
+        self.volatile_ttl = volatile_ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, service_id, volatile=True, fresh=False):
+        """ Return the program info of `service_id`.
+
+        With `volatile=False` only the static fields need to be fresh, so a
+        cached entry is returned even if its signal readings are old. `fresh`
+        skips the cache but still joins a request already in flight.
+        """
+        with self.lock:
+            entry = self.entries.get(service_id)
+            if not fresh and entry and self._is_fresh(entry, volatile):
+                self.entries.move_to_end(service_id)
+                self.hits += 1
+                return entry.info
+            owner = False
+            future = self.inflight.get(service_id)
+            if future:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                future = self.inflight[service_id] = Future()
+                owner = True
+        if not owner:
+            return future.result()
+
+        try:
+            info = self.fetch(service_id)
+        except BaseException as e:
+            with self.lock:
+                del self.inflight[service_id]
+            future.set_exception(e)
+            raise
+        self.put(service_id, info)
+        with self.lock:
+            del self.inflight[service_id]
+        future.set_result(info)
+        return info
+
+    def _is_fresh(self, entry, volatile):
+        now = self.clock()
+        if entry.static_age(now) >= self.static_ttl:
+            return False
+        return not volatile or entry.volatile_age(now) < self.volatile_ttl
+
+    def put(self, service_id, info):
+        """ Merge `info` into the cached entry; only the field groups it
+        contains are marked as refreshed. """
+        with self.lock:
+            entry = self.entries.get(service_id)
+            if entry is None:
+                entry = self.entries[service_id] = _Entry()
+            entry.update(info, self.clock())
+            self.entries.move_to_end(service_id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def peek(self, service_id, max_age=None):
+        """ Cached info whose static fields are no older than `max_age` (any age
+        by default), without touching the LRU order or the statistics. """
+        with self.lock:
+            entry = self.entries.get(service_id)
+        if entry is None or entry.static_at is None:
+            return None
+        if max_age is not None and entry.static_age(self.clock()) >= max_age:
+            return None
+        return entry.info
+
+    def invalidate(self, service_id=None):
+        with self.lock:
+            if service_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(service_id, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        lookups = self.hits + self.misses + self.coalesced
+        rate = self.hits / lookups * 100 if lookups else 0.0
+        return (f"{len(self.entries)} entries, {self.hits} hits, {self.misses} misses, "
+                f"{self.coalesced} coalesced ({rate:.0f}% hit rate)")
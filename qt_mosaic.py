@@ -0,0 +1,136 @@
+import math
+
+from PyQt5.QtCore import QEvent, Qt, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QFrame, QGridLayout, QLabel, QVBoxLayout, QWidget
+
+import vlc_shared
+from mosaic import TILE_OPTIONS, CpuMeter, TileStats, split_cpu
+
+
+class MosaicTile(QWidget):
+    """ One service of the mosaic: its video and a line of stats below it. """
+
+    def __init__(self, instance, name, url, options=TILE_OPTIONS, parent=None):
+        super(MosaicTile, self).__init__(parent)
+        import vlc
+
+        self.name = name
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(2, 2, 2, 2)
+        layout.setSpacing(1)
+        self.video = QFrame(self)
+        self.video.setMinimumSize(160, 90)
+        self.video.setStyleSheet("background-color: black;")
+        layout.addWidget(self.video, 1)
+        self.label = QLabel(name, self)
+        layout.addWidget(self.label)
+        self.setStyleSheet("MosaicTile { border: 2px solid transparent; }")
+        self.setAttribute(Qt.WA_StyledBackground)
+
+        self.media = instance.media_new(url, *options)
+        self.player = instance.media_player_new()
+        vlc_shared.attach_to_widget(self.player, int(self.video.winId()))
+        # Clicks on the video must reach Qt to move the focus
+        self.player.video_set_mouse_input(False)
+        self.player.video_set_key_input(False)
+        self.player.set_media(self.media)
+        self.player.audio_set_mute(True)
+        self.stats = TileStats()
+        self.media_stats = vlc.MediaStats()
+
+    def start(self):
+        self.player.play()
+
+    def set_focused(self, focused):
+        self.player.audio_set_mute(not focused)
+        self.setStyleSheet(f"MosaicTile {{ border: 2px solid {'orange' if focused else 'transparent'}; }}")
+
+    def sample(self):
+        """ Frames decoded since the last sample. """
+        if not self.media.get_stats(self.media_stats):
+            return 0
+        return self.stats.update(self.media_stats)
+
+    def show_stats(self, cpu):
+        stats = self.stats
+        self.label.setText(f"{self.name}\n{stats.decoded_rate:.0f} fps, {stats.lost} dropped, "
+                           f"{stats.bitrate / 1e6:.1f} Mbit/s, ~{cpu:.0f}% CPU")
+
+    def stop(self):
+        self.player.stop()
+        self.player.release()
+        self.media.release()
+
+
+class MosaicWindow(QWidget):
+    """ A grid of tiles sharing one libvlc instance; audio follows the clicked tile.
+
+    `services` are (name, stream URL) pairs, at most 16.
+    """
+
+    closed = pyqtSignal()
+
+    def __init__(self, instance, services, summary="", parent=None):
+        super(MosaicWindow, self).__init__(parent, Qt.Window)
+        self.setWindowTitle("Mosaic")
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.resize(1280, 760)
+        layout = QVBoxLayout(self)
+        grid = QGridLayout()
+        grid.setSpacing(2)
+        layout.addLayout(grid, 1)
+        self.status = QLabel(summary, self)
+        layout.addWidget(self.status)
+        self.summary = summary
+
+        columns = math.ceil(math.sqrt(len(services)))
+        self.tiles = []
+        for i, (name, url) in enumerate(services):
+            tile = MosaicTile(instance, name, url, parent=self)
+            tile.video.installEventFilter(self)
+            tile.installEventFilter(self)
+            grid.addWidget(tile, i // columns, i % columns)
+            self.tiles.append(tile)
+        self.focused = None
+        self.cpu = CpuMeter()
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh_stats)
+
+    def start(self):
+        self.show()
+        for tile in self.tiles:
+            tile.start()
+        if self.tiles:
+            self.focus(self.tiles[0])
+        self.timer.start()
+        return self
+
+    def focus(self, tile):
+        if self.focused is not None:
+            self.focused.set_focused(False)
+        self.focused = tile
+        tile.set_focused(True)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.MouseButtonPress:
+            for tile in self.tiles:
+                if obj is tile or obj is tile.video:
+                    self.focus(tile)
+                    return True
+        return super(MosaicWindow, self).eventFilter(obj, event)
+
+    def refresh_stats(self):
+        decoded = [tile.sample() for tile in self.tiles]
+        percent = self.cpu.sample()
+        for tile, cpu in zip(self.tiles, split_cpu(percent, decoded)):
+            tile.show_stats(cpu)
+        dropped = sum(tile.stats.lost for tile in self.tiles)
+        self.status.setText(f"{self.summary}  |  process CPU {percent:.0f}%, {dropped} frames dropped")
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        for tile in self.tiles:
+            tile.stop()
+        self.closed.emit()
+        super(MosaicWindow, self).closeEvent(event)
@@ -0,0 +1,77 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from workers import Cancelled, Task
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    progress = pyqtSignal(object)
+    done = pyqtSignal()
+
+
+class Worker(QRunnable):
+    def __init__(self, fn):
+        super(Worker, self).__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.signals = WorkerSignals()
+        self.task = Task(report=self.signals.progress.emit)
+
+    def run(self):
+        try:
+            if self.task.cancelled:
+                return
+            try:
+                result = self.fn(self.task)
+            except Cancelled:
+                return
+            except Exception as e:
+                self.signals.failed.emit(e)
+                return
+            self.signals.finished.emit(result)
+        finally:
+            self.signals.done.emit()
+
+
+class WorkerPool(QObject):
+    """ QThreadPool front end with one cancellable task per named slot.
+
+    Results are delivered through queued signals on the GUI thread. Submitting
+    to a busy slot cancels the previous task: if it has not started yet it is
+    taken off the pool queue, otherwise its result is simply dropped.
+    """
+
+    def __init__(self, max_threads=4, parent=None):
+        super(WorkerPool, self).__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.slots = {}
+        self.active = set()
+
+    def submit(self, slot, fn, on_done, on_error=None, on_progress=None):
+        self.cancel(slot)
+        worker = Worker(fn)
+        task = worker.task
+        worker.signals.finished.connect(lambda result: task.cancelled or on_done(result))
+        if on_error:
+            worker.signals.failed.connect(lambda error: task.cancelled or on_error(error))
+        if on_progress:
+            worker.signals.progress.connect(lambda value: task.cancelled or on_progress(value))
+        worker.signals.done.connect(lambda: self.active.discard(worker))
+        self.slots[slot] = worker
+        self.active.add(worker)
+        self.pool.start(worker)
+        return task
+
+    def cancel(self, slot):
+        worker = self.slots.pop(slot, None)
+        if worker:
+            worker.task.cancel()
+            if self.pool.tryTake(worker):
+                self.active.discard(worker)
+
+    def shutdown(self):
+        for slot in list(self.slots):
+            self.cancel(slot)
+        self.pool.waitForDone(1000)
@@ -0,0 +1,323 @@
+""" Record services to disk in the background.
+
+Every recording has its own thread and a single fixed buffer: the stream is
+received straight into the buffer (`recv_into`) and written out when it is
+full, or once a second at low bitrates, so memory does not grow with the
+length of the recording, a crash loses at most a second of it and the GUI
+thread never touches the data. Output is split into segments by size
+and/or duration, cut on TS packet boundaries. On platforms that have it,
+segments are preallocated with `posix_fallocate` a step ahead of the data
+and trimmed on close, so a crash leaves at most one step of zeros behind.
+
+    python recorder.py http://192.168.1.10:8080/?id_... --minutes 60 --segment-mib 1024
+"""
+import argparse
+import os
+import re
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+TS_PACKET = 188
+MAX_HEADER = 16 * 1024
+PREALLOCATE_STEP = 16 * 1024 * 1024
+
+
+class RecordingError(Exception):
+    pass
+
+
+def default_recordings_dir():
+    return os.path.join(os.path.expanduser("~"), "Videos", "GTMedia")
+
+
+def open_stream(url, timeout=5.0):
+    """ Connect to an HTTP stream; returns the socket and the first body bytes. """
+    parts = urlsplit(url)
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    sock = socket.create_connection((parts.hostname, parts.port or 80), timeout)
+    try:
+        # HTTP/1.0 keeps the body a plain byte stream, no chunked encoding
+        sock.sendall(f"GET {path} HTTP/1.0\r\nHost: {parts.netloc}\r\n\r\n".encode())
+        head = b""
+        while b"\r\n\r\n" not in head:
+            chunk = sock.recv(4096)
+            if not chunk or len(head) > MAX_HEADER:
+                raise RecordingError("no valid response from the receiver")
+            head += chunk
+    except BaseException:
+        sock.close()
+        raise
+    head, _, body = head.partition(b"\r\n\r\n")
+    status_line = head.split(b"\r\n", 1)[0]
+    if status_line.split()[1:2] != [b"200"]:
+        sock.close()
+        raise RecordingError(f"receiver answered {status_line.decode(errors='replace')}")
+    return sock, body
+
+
+class RecordingStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.bytes_written = 0
+        self.segments = []
+        self.write_time = 0.0
+        self.stalls = 0
+        self.longest_stall = 0.0
+        self.rate = 0.0
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def __str__(self):
+        elapsed = max(self.elapsed, 1e-9)
+        return (f"{self.bytes_written / 1048576:.1f} MiB in {elapsed:.0f}s "
+                f"({self.bytes_written * 8 / elapsed / 1e6:.1f} Mbit/s, now {self.rate * 8 / 1e6:.1f}), "
+                f"{len(self.segments)} segment(s), disk {self.bytes_written / max(self.write_time, 1e-9) / 1048576:.0f} MiB/s, "
+                f"{self.stalls} stall(s), longest {self.longest_stall:.1f}s")
+
+
+class Recording:
+    """ One service being written to disk by its own thread.
+
+    A stall is counted when no data arrives, or a write takes longer, than
+    `stall_threshold` seconds. Buffered data is written out at least every
+    `flush_interval` seconds.
+    """
+
+    def __init__(self, name, url, directory, buffer_size=4 * 1024 * 1024, segment_size=None,
+                 segment_seconds=None, stall_threshold=1.0, on_finished=None, flush_interval=1.0):
+        self.name = name
+        self.url = url
+        self.directory = directory
+        # Whole TS packets, so every flush ends on a packet boundary
+        self.buffer = memoryview(bytearray(buffer_size - buffer_size % TS_PACKET))
+        # At least one packet per segment, so every segment makes progress
+        self.segment_size = segment_size and max(segment_size, TS_PACKET)
+        self.segment_seconds = segment_seconds
+        self.stall_threshold = stall_threshold
+        self.on_finished = on_finished
+        self.flush_interval = flush_interval
+        self.stats = RecordingStats()
+        self.error = None
+        self.stopping = threading.Event()
+        self.file = None
+        self.segment_bytes = 0
+        self.allocated = 0
+        self.segment_started = 0.0
+        self.thread = threading.Thread(target=self._run, name=f"record-{name}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self, wait=True):
+        self.stopping.set()
+        if wait:
+            self.thread.join()
+
+    @property
+    def running(self):
+        return self.thread.is_alive()
+
+    def _segment_path(self):
+        safe_name = re.sub(r"[^\w.-]+", "_", self.name).strip("_") or "service"
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.directory, f"{safe_name}_{stamp}_{len(self.stats.segments) + 1:03d}.ts")
+
+    def _open_segment(self):
+        self._close_segment()
+        path = self._segment_path()
+        # Unbuffered: the recording buffer already batches the writes
+        self.file = open(path, "wb", buffering=0)
+        self.stats.segments.append(path)
+        self.segment_bytes = 0
+        self.allocated = 0
+        self.segment_started = time.monotonic()
+
+    def _preallocate(self, end):
+        """ Make sure the segment has room up to `end`, reserving a step beyond it. """
+        if not self.segment_size or end <= self.allocated or not hasattr(os, "posix_fallocate"):
+            return
+        size = min(self.segment_size, end + PREALLOCATE_STEP)
+        try:
+            os.posix_fallocate(self.file.fileno(), self.allocated, size - self.allocated)
+            self.allocated = size
+        except OSError:
+            # Not supported by this filesystem: stop trying for this segment
+            self.allocated = self.segment_size
+
+    def _close_segment(self):
+        if self.file:
+            # Drop the preallocated tail
+            self.file.truncate(self.segment_bytes)
+            self.file.close()
+            self.file = None
+
+    def _segment_full(self):
+        # Less than a whole packet left counts as full
+        return ((self.segment_size and self.segment_size - self.segment_bytes < TS_PACKET) or
+                (self.segment_seconds and time.monotonic() - self.segment_started >= self.segment_seconds))
+
+    def _write(self, view):
+        started = time.monotonic()
+        self._preallocate(self.segment_bytes + len(view))
+        while view:
+            written = self.file.write(view)
+            view = view[written:]
+            self.segment_bytes += written
+            self.stats.bytes_written += written
+        elapsed = time.monotonic() - started
+        self.stats.write_time += elapsed
+        self._stall(elapsed)
+
+    def _stall(self, seconds):
+        if seconds > self.stall_threshold:
+            self.stats.stalls += 1
+            self.stats.longest_stall = max(self.stats.longest_stall, seconds)
+
+    def _flush(self, filled):
+        """ Write out the whole packets in the first `filled` bytes of the buffer,
+        rotating segments as needed. Returns how many bytes of a partial packet
+        were moved to the start of the buffer.
+        """
+        whole = filled - filled % TS_PACKET
+        view = self.buffer[:whole]
+        while view:
+            if self._segment_full():
+                self._open_segment()
+            part = view
+            if self.segment_size:
+                # Cut exactly at the size limit, on a packet boundary
+                room = self.segment_size - self.segment_bytes
+                part = view[:room - room % TS_PACKET]
+            self._write(part)
+            view = view[len(part):]
+        self.buffer[:filled - whole] = self.buffer[whole:filled]
+        return filled - whole
+
+    def _run(self):
+        sock = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            sock, body = open_stream(self.url)
+            sock.settimeout(self.stall_threshold)
+            self._open_segment()
+            filled = len(body)
+            self.buffer[:filled] = body
+            window_started, window_bytes = time.monotonic(), 0
+            flushed_at = time.monotonic()
+            waiting_since = None
+            while not self.stopping.is_set():
+                try:
+                    count = sock.recv_into(self.buffer[filled:])
+                except socket.timeout:
+                    waiting_since = waiting_since or time.monotonic() - self.stall_threshold
+                else:
+                    if waiting_since is not None:
+                        self._stall(time.monotonic() - waiting_since)
+                        waiting_since = None
+                    if not count:
+                        break
+                    filled += count
+                    window_bytes += count
+                now = time.monotonic()
+                if now - window_started >= 1.0:
+                    self.stats.rate = window_bytes / (now - window_started)
+                    window_started, window_bytes = now, 0
+                # Also rotates segments by duration, which is why it runs while stalled too
+                if filled == len(self.buffer) or now - flushed_at >= self.flush_interval:
+                    filled = self._flush(filled)
+                    flushed_at = now
+            # A partial packet left at the end is dropped
+            self._flush(filled)
+        except (OSError, RecordingError) as e:
+            self.error = e
+            print(f"Recording {self.name} failed: {e}")
+        finally:
+            if sock:
+                sock.close()
+            self._close_segment()
+            print(f"Recording {self.name} finished: {self.stats}")
+            if self.on_finished:
+                self.on_finished(self)
+
+
+class Recorder:
+    """ The recordings running at the moment, keyed by service id. """
+
+    def __init__(self, directory=None, buffer_size=4 * 1024 * 1024, segment_size=1024 * 1024 * 1024,
+                 segment_seconds=None):
+        self.directory = directory or default_recordings_dir()
+        self.buffer_size = buffer_size
+        self.segment_size = segment_size
+        self.segment_seconds = segment_seconds
+        self.recordings = {}
+        self.lock = threading.Lock()
+
+    def __contains__(self, service_id):
+        with self.lock:
+            return service_id in self.recordings
+
+    def service_ids(self):
+        with self.lock:
+            return list(self.recordings)
+
+    def start(self, service_id, name, url):
+        with self.lock:
+            if service_id in self.recordings:
+                return self.recordings[service_id]
+            recording = self.recordings[service_id] = Recording(
+                name, url, self.directory, self.buffer_size, self.segment_size, self.segment_seconds,
+                on_finished=lambda recording: self._finished(service_id, recording))
+        return recording.start()
+
+    def _finished(self, service_id, recording):
+        with self.lock:
+            if self.recordings.get(service_id) is recording:
+                del self.recordings[service_id]
+
+    def stop(self, service_id, wait=False):
+        with self.lock:
+            recording = self.recordings.get(service_id)
+        if recording:
+            recording.stop(wait)
+
+    def stop_all(self):
+        with self.lock:
+            recordings = list(self.recordings.values())
+        for recording in recordings:
+            recording.stop(wait=False)
+        for recording in recordings:
+            recording.thread.join()
+
+    def status(self):
+        with self.lock:
+            recordings = list(self.recordings.values())
+        return "\n".join(f"● {recording.name}: {recording.stats}" for recording in recordings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record a stream URL to segmented TS files.")
+    parser.add_argument("url")
+    parser.add_argument("--name", default="recording")
+    parser.add_argument("--directory", default=default_recordings_dir())
+    parser.add_argument("--minutes", type=float, default=None, help="stop after this long, default: Ctrl+C")
+    parser.add_argument("--segment-mib", type=int, default=1024)
+    parser.add_argument("--segment-minutes", type=float, default=None)
+    parser.add_argument("--buffer-mib", type=int, default=4)
+    args = parser.parse_args()
+
+    recording = Recording(args.name, args.url, args.directory, args.buffer_mib * 1024 * 1024,
+                          args.segment_mib * 1024 * 1024,
+                          args.segment_minutes * 60 if args.segment_minutes else None).start()
+    deadline = time.monotonic() + args.minutes * 60 if args.minutes else None
+    try:
+        while recording.running and (deadline is None or time.monotonic() < deadline):
+            time.sleep(5)
+            print(recording.stats)
+    except KeyboardInterrupt:
+        pass
+    recording.stop()
@@ -0,0 +1,240 @@
+""" Search index over the service catalog.
+
+Service names are indexed by trigram, so a query only verifies the few
+services that contain every trigram of the search term instead of walking
+the whole catalog. Satellite names and frequencies get inverted indexes, and
+scrambled (`$`) services are kept in a set of their own.
+
+Query syntax, terms separated by spaces and all required to match:
+
+    bbc news        names containing both "bbc" and "news"
+    sat:astra       satellite name starting with "astra"
+    fq:11778        frequency starting with "11778"
+    $   /   -$      scrambled only / free-to-air only
+
+Satellite and frequency come from /proginfo, so those filters only know the
+services whose info has been fetched. Run as a script for query latency:
+
+    python service_index.py --services 50000
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _term_kind(term):
+    if term in ('$', '-$'):
+        return term
+    if term.startswith("sat:"):
+        return "sat"
+    if term.startswith("fq:"):
+        return "fq"
+    return "name"
+
+
+def _narrows(old_terms, new_terms):
+    """ True if every match of `new_terms` is also a match of `old_terms`.
+
+    That is the case while typing: earlier terms are unchanged and the last
+    one only grows (or new terms are appended).
+    """
+    if not old_terms or len(new_terms) < len(old_terms) or new_terms[:len(old_terms) - 1] != old_terms[:-1]:
+        return False
+    old, new = old_terms[-1], new_terms[len(old_terms) - 1]
+    if old == new:
+        return True
+    kind = _term_kind(old)
+    return kind in ("name", "sat", "fq") and _term_kind(new) == kind and new.startswith(old)
+
+
+class ServiceIndex:
+    def __init__(self):
+        self.names = {}
+        self.grams = defaultdict(set)
+        self.scrambled = set()
+        self.free_to_air = set()
+        self.satellites = defaultdict(set)
+        self.frequencies = defaultdict(set)
+        self.satellite_of = {}
+        self.frequency_of = {}
+        self.last_query = ([], None)
+
+    def __len__(self):
+        return len(self.names)
+
+    def clear(self):
+        self.__init__()
+
+    def add(self, service):
+        self.last_query = ([], None)
+        service_id = service["id"]
+        if service_id in self.names:
+            self.remove(service_id, keep_proginfo=True)
+        name = service["servicename"].lower()
+        self.names[service_id] = name
+        for gram in trigrams(name):
+            self.grams[gram].add(service_id)
+        if name.startswith('$'):
+            self.scrambled.add(service_id)
+        else:
+            self.free_to_air.add(service_id)
+
+    def extend(self, services):
+        for service in services:
+            self.add(service)
+
+    def remove(self, service_id, keep_proginfo=False):
+        self.last_query = ([], None)
+        name = self.names.pop(service_id, None)
+        if name is None:
+            return
+        for gram in trigrams(name):
+            ids = self.grams[gram]
+            ids.discard(service_id)
+            if not ids:
+                del self.grams[gram]
+        self.scrambled.discard(service_id)
+        self.free_to_air.discard(service_id)
+        if not keep_proginfo:
+            self._unlink(self.satellites, self.satellite_of, service_id)
+            self._unlink(self.frequencies, self.frequency_of, service_id)
+
+    def apply_diff(self, diff):
+        """ Update the index from a `catalog_cache.CatalogDiff`. """
+        for service_id in diff.removed:
+            self.remove(service_id)
+        for position, service in diff.added + diff.changed:
+            self.add(service)
+
+    def set_proginfo(self, service_id, info):
+        self.last_query = ([], None)
+        self._link(self.satellites, self.satellite_of, service_id, str(info["satname"]).lower())
+        self._link(self.frequencies, self.frequency_of, service_id, str(info["FQ"]).lower())
+
+    def _link(self, index, reverse, service_id, key):
+        if reverse.get(service_id) == key:
+            return
+        self._unlink(index, reverse, service_id)
+        index[key].add(service_id)
+        reverse[service_id] = key
+
+    def _unlink(self, index, reverse, service_id):
+        key = reverse.pop(service_id, None)
+        if key is not None:
+            index[key].discard(service_id)
+            if not index[key]:
+                del index[key]
+
+    def _match_name(self, term, candidates):
+        if len(term) < 3:
+            pool = self.names if candidates is None else candidates
+            return {service_id for service_id in pool if term in self.names[service_id]}
+        sets = sorted((self.grams.get(gram, ()) for gram in trigrams(term)), key=len)
+        if not sets[0]:
+            return set()
+        found = set(sets[0])
+        if candidates is not None:
+            found &= candidates
+        for ids in sets[1:]:
+            found &= ids
+            if not found:
+                return found
+        # Every trigram matched; make sure they are contiguous
+        return {service_id for service_id in found if term in self.names[service_id]}
+
+    def _match_prefix(self, index, prefix):
+        found = set()
+        for key, ids in index.items():
+            if key.startswith(prefix):
+                found |= ids
+        return found
+
+    def query(self, text):
+        """ Ids of the services matching `text`, or None when there is no filter.
+
+        While the user keeps typing, the search starts from the previous
+        result instead of the whole catalog.
+        """
+        terms = text.lower().split()
+        last_terms, last_result = self.last_query
+        candidates = last_result if _narrows(last_terms, terms) else None
+        names = []
+        for term in terms:
+            if term == '$':
+                found = self.scrambled
+            elif term == '-$':
+                found = self.free_to_air
+            elif term.startswith("sat:"):
+                found = self._match_prefix(self.satellites, term[4:])
+            elif term.startswith("fq:"):
+                found = self._match_prefix(self.frequencies, term[3:])
+            else:
+                names.append(term)
+                continue
+            candidates = set(found) if candidates is None else candidates & found
+        # Name terms are the costly ones, so they narrow an already reduced set
+        for term in sorted(names, key=len, reverse=True):
+            candidates = self._match_name(term, candidates)
+        self.last_query = (terms, candidates)
+        return candidates
+
+
+def rows_matching(ids, store):
+    """ Store rows of `ids` in catalog order; None passes through as "all rows". """
+    return None if ids is None else store.rows_of(ids)
+
+
+def benchmark(count=50000, queries=200):
+    from service_store import ServiceStore
+
+    words = ["news", "sport", "movie", "music", "kids", "hd", "bbc", "cnn", "vtv", "discovery",
+             "history", "cinema", "tv", "world", "channel", "plus", "one", "24", "info", "star"]
+    rng = random.Random(1)
+    services = [{"id": i, "servicename": ("$" if rng.random() < 0.3 else "")
+                 + " ".join(rng.choice(words) for _ in range(rng.randint(1, 3))).title() + f" {i}",
+                 "url": ""} for i in range(count)]
+    store = ServiceStore(services)
+
+    index = ServiceIndex()
+    started = time.perf_counter()
+    index.extend(services)
+    built = time.perf_counter() - started
+    for service in services[::4]:
+        index.set_proginfo(service["id"], {"satname": rng.choice(["Astra 19.2E", "Hotbird 13E", "Vinasat 132E"]),
+                                           "FQ": f"{rng.randrange(10700, 12750)} {rng.choice('HV')} 27500"})
+
+    typed = []
+    for _ in range(queries // 10):
+        phrase = f"{rng.choice(words)} {rng.choice(words)}"
+        typed += [phrase[:n] for n in range(1, len(phrase) + 1)]
+    typed += ["$", "-$ news", "sat:astra", "sat:hot cinema", "fq:11", "fq:12 $ sport"]
+
+    timings = []
+    for text in typed:
+        started = time.perf_counter()
+        rows_matching(index.query(text), store)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    started = time.perf_counter()
+    for service in services[:count // 100]:
+        index.add(dict(service, servicename=service["servicename"] + " renamed"))
+    renamed = time.perf_counter() - started
+
+    print(f"{count} services: index built in {built * 1000:.0f} ms, "
+          f"{count // 100} renames applied in {renamed * 1000:.1f} ms")
+    print(f"{len(timings)} keystrokes: p50 {timings[len(timings) // 2] * 1000:.2f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} ms, max {timings[-1] * 1000:.2f} ms")
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time service search queries on a synthetic catalog.")
+    parser.add_argument("--services", type=int, default=50000)
+    args = parser.parse_args()
+    benchmark(args.services)
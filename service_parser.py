@@ -0,0 +1,246 @@
+""" Incremental parser for /getallservices responses.
+
+`ServicePageParser` is fed the response body in chunks as it arrives. Each
+service object is decoded with the C scanner of `json` as soon as it is
+complete, and is added to a `ServiceStore` straight away. So neither the
+whole body nor a dict per service is ever held; only a chunk and the
+object being decoded are. `close` returns the top-level fields ("count",
+"pagetotal"), with "services" set to the store.
+
+Decoding costs about what `json.loads` does; filling the store's columns
+roughly doubles that. Streaming is therefore no faster than `json.loads`
+followed by copying into a store, and slower than `json.loads` alone. What
+it saves is memory: about half of what the dicts take, with no peak for the
+whole body. Run as a script to compare parse time and memory with
+`json.loads`:
+
+    python service_parser.py --services 50000
+"""
+import argparse
+import codecs
+import json
+import re
+import time
+import tracemalloc
+
+from service_store import ServiceStore
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+class _NeedMore(Exception):
+    pass
+
+
+class ServicePageParser:
+    """ Feeds a `{"services": [...], ...}` body into `store`. """
+
+    def __init__(self, store=None):
+        self.store = ServiceStore() if store is None else store
+        self.fields = {}
+        self.buffer = ""
+        self.pos = 0
+        self.state = "start"
+        self.key = None
+        self.final = False
+        self.decode = codecs.getincrementaldecoder("utf-8")().decode
+
+    def feed(self, chunk):
+        self.buffer = self.buffer[self.pos:] + self.decode(chunk)
+        self.pos = 0
+        self._parse()
+
+    def close(self):
+        """ The top-level fields, "services" being the store; ValueError if the body was cut short or malformed. """
+        self.buffer = self.buffer[self.pos:] + self.decode(b"", final=True)
+        self.pos = 0
+        self.final = True
+        self._parse()
+        if self.state != "done" or self.buffer[self.pos:].strip():
+            raise ValueError(f"Invalid services response near {self.buffer[self.pos:self.pos + 40]!r}")
+        return self.fields
+
+    def _skip(self):
+        self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+        return self.buffer[self.pos:self.pos + 1]
+
+    def _value(self):
+        """ The JSON value at `pos`; raises _NeedMore if it may not have fully arrived. """
+        try:
+            value, end = _decoder.raw_decode(self.buffer, self.pos)
+        except json.JSONDecodeError:
+            raise _NeedMore() from None
+        if end == len(self.buffer) and not self.final:
+            # A number at the very end may continue in the next chunk
+            raise _NeedMore()
+        self.pos = end
+        return value
+
+    def _parse(self):
+        buffer_end = len(self.buffer)
+        try:
+            while self.pos < buffer_end and self.state != "done":
+                char = self._skip()
+                if not char:
+                    return
+                if self.state == "start":
+                    if char != "{":
+                        raise ValueError("Invalid services response: expected an object")
+                    self.pos += 1
+                    self.state = "key"
+                elif self.state == "key":
+                    if char == ",":
+                        self.pos += 1
+                    elif char == "}":
+                        self.pos += 1
+                        self.state = "done"
+                    else:
+                        # The key and its colon are consumed together
+                        start = self.pos
+                        self.key = self._value()
+                        if self._skip() != ":":
+                            self.pos = start
+                            raise _NeedMore()
+                        self.pos += 1
+                        self.state = "value"
+                elif self.state == "value":
+                    if self.key == "services" and char == "[":
+                        self.fields["services"] = self.store
+                        # A page that arrived in one piece is decoded in one call
+                        try:
+                            services, end = _decoder.raw_decode(self.buffer, self.pos)
+                        except json.JSONDecodeError:
+                            self.pos += 1
+                            self.state = "services"
+                            continue
+                        self._add(services)
+                        self.pos = end
+                        self.state = "key"
+                    else:
+                        self.fields[self.key] = self._value()
+                        self.state = "key"
+                elif self.state == "services":
+                    if char == ",":
+                        self.pos += 1
+                    elif char == "]":
+                        self.pos += 1
+                        self.state = "key"
+                    elif not self._decode_run():
+                        self._add([self._value()])
+        except _NeedMore:
+            pass
+
+    def _decode_run(self, attempts=3):
+        """ Decode every service object that has fully arrived with a single `json.loads`.
+
+        Service objects are flat, so each complete one ends in a "}". A cut
+        after a "}" inside a name, or after the closing one of the response,
+        fails to decode and the cut before it is tried; if those fail too,
+        `_parse` goes one object at a time.
+        """
+        cut = len(self.buffer)
+        for _ in range(attempts):
+            cut = self.buffer.rfind("}", self.pos, cut)
+            if cut < 0:
+                return False
+            try:
+                services = json.loads("[" + self.buffer[self.pos:cut + 1] + "]")
+            except json.JSONDecodeError:
+                continue
+            self.pos = cut + 1
+            self._add(services)
+            return True
+        return False
+
+    def _add(self, services):
+        try:
+            self.store.extend(services)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid service entry in {services[:3]!r}...") from e
+
+
+def parse(body, chunk_size=65536):
+    """ Parse a complete body as if it arrived in `chunk_size` pieces; returns (store, fields). """
+    parser = ServicePageParser()
+    for start in range(0, len(body), chunk_size):
+        parser.feed(body[start:start + chunk_size])
+    return parser.store, parser.close()
+
+
+def _measure(fn, runs=5):
+    """ Best time of `runs`, then memory kept and peak from one more, traced run. """
+    elapsed = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        elapsed = min(elapsed, time.perf_counter() - started)
+    tracemalloc.start()
+    result = fn()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, retained, peak
+
+
+def benchmark(count=50000, page_size=None):
+    """ json.loads into dicts against streaming into a `ServiceStore`, per page of `page_size`.
+
+    Times are relative to plain `json.loads`, the baseline to beat.
+    """
+    from mock_receiver import make_catalog
+
+    services = [dict(service, url=service["url"].format(url_base="http://192.168.1.10:81"))
+                for service in make_catalog(count)]
+    page_size = page_size or count
+    bodies = [json.dumps({"count": page_size, "pagetotal": -(-count // page_size),
+                          "services": services[start:start + page_size]}).encode()
+              for start in range(0, count, page_size)]
+    del services
+
+    def with_json():
+        loaded = []
+        for body in bodies:
+            loaded.extend(json.loads(body)["services"])
+        return loaded
+
+    def with_json_and_store():
+        # What the front ends did: keep the parsed pages and copy them into the list's store
+        loaded = []
+        store = ServiceStore()
+        for body in bodies:
+            page = json.loads(body)["services"]
+            loaded.extend(page)
+            store.extend(page)
+        return loaded
+
+    def with_parser():
+        store = ServiceStore()
+        for body in bodies:
+            parser = ServicePageParser(store)
+            for start in range(0, len(body), 65536):
+                parser.feed(body[start:start + 65536])
+            parser.close()
+        return store
+
+    print(f"{count} services, {sum(map(len, bodies)) / 2 ** 20:.1f} MiB of JSON in pages of {page_size}")
+    results = {}
+    for name, fn in (("json.loads + dicts", with_json), ("json.loads + dicts + store", with_json_and_store),
+                     ("streamed into ServiceStore", with_parser)):
+        loaded, elapsed, retained, peak = _measure(fn)
+        assert len(loaded) == count
+        results[name] = (elapsed, retained, peak)
+        print(f"{name:<28} {elapsed * 1000:6.0f} ms, {retained / 2 ** 20:6.1f} MiB kept, "
+              f"{peak / 2 ** 20:6.1f} MiB peak, {retained / count:5.0f} bytes per service")
+        del loaded
+    baseline, streamed = results["json.loads + dicts"], results["streamed into ServiceStore"]
+    print(f"Streaming takes {streamed[0] / baseline[0]:.1f}x the time of plain json.loads "
+          f"and keeps {streamed[1] / baseline[1]:.2f}x the memory")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare catalog parse time and memory.")
+    parser.add_argument("--services", type=int, default=50000)
+    parser.add_argument("--page-size", type=int, help="services per response, default: all in one")
+    args = parser.parse_args()
+    benchmark(args.services, args.page_size)
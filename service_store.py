@@ -0,0 +1,234 @@
+""" Compact column storage for the service catalog.
+
+A service parsed into a dict costs ~380 bytes in CPython: the dict, an int
+and two strings. `ServiceStore` keeps one column per field instead:
+
+- ids: a typed array, 8 bytes each; ids sent as numeric strings are
+  stored as ints, and a catalog with other ids falls back to a plain list
+- names: interned strings, so names repeated across transponders and
+  satellites are kept once
+- urls: a common prefix such as "http://192.168.1.10:81/stream/" kept once
+  in a small table, plus each URL's tail
+- scrambled flags: one byte each
+
+A service dict is built only when a row is asked for. `service_parser`
+fills a store straight from a streamed /getallservices response.
+"""
+import sys
+from array import array
+from itertools import compress, repeat
+from operator import itemgetter
+
+
+def split_url(url):
+    """ (prefix, tail), cut after the last "/", "?" or "=". """
+    cut = max(url.rfind("/"), url.rfind("?"), url.rfind("=")) + 1
+    return url[:cut], url[cut:]
+
+
+def numeric_id(service_id):
+    """ An id sent as a string, e.g. "12", as the int it stands for; other ids as they are. """
+    if isinstance(service_id, str):
+        try:
+            number = int(service_id)
+        except ValueError:
+            return service_id
+        # "012" or " 12" would not read back the same
+        if str(number) == service_id:
+            return number
+    return service_id
+
+
+class ServiceStore:
+    """ Column-oriented list of services.
+
+    What the virtualized list views read from. Rows are looked up by id
+    through an index that is built on first use and rebuilt lazily after
+    rows are inserted or removed.
+    """
+
+    def __init__(self, services=()):
+        self.ids = array("q")
+        self.names = []
+        self.url_prefixes = []
+        self.url_prefix_rows = array("I")
+        self.url_tails = []
+        self.scrambled = bytearray()
+        self._prefixes = {}
+        self._rows = {}
+        self._rows_valid = False
+        self.extend(services)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return (self.service(row) for row in range(len(self.ids)))
+
+    def __getitem__(self, row):
+        return self.service(row)
+
+    def service(self, row):
+        return {"id": self.ids[row], "servicename": self.names[row], "url": self.url(row)}
+
+    def url(self, row):
+        return self.url_prefixes[self.url_prefix_rows[row]] + self.url_tails[row]
+
+    def to_list(self):
+        return list(self)
+
+    def row_of(self, service_id):
+        return self._row_index().get(numeric_id(service_id))
+
+    def by_id(self, service_id):
+        row = self.row_of(service_id)
+        return None if row is None else self.service(row)
+
+    def rows_of(self, service_ids):
+        """ Rows of the services in `service_ids` (a set), in catalog order. """
+        if len(service_ids) * 8 < len(self.ids):
+            rows = self._row_index()
+            return sorted(map(rows.__getitem__, service_ids & rows.keys()))
+        return list(compress(range(len(self.ids)), map(service_ids.__contains__, self.ids)))
+
+    def _row_index(self):
+        if not self._rows_valid:
+            self._rows = {service_id: row for row, service_id in enumerate(self.ids)}
+            self._rows_valid = True
+        return self._rows
+
+    def _prefix(self, prefix):
+        index = self._prefixes.get(prefix)
+        if index is None:
+            index = self._prefixes[prefix] = len(self.url_prefixes)
+            self.url_prefixes.append(sys.intern(prefix))
+        return index
+
+    def _storable(self, ids):
+        """ `ids` as the ids column can hold them, turning it into a list if it has to. """
+        ids = list(map(numeric_id, ids))
+        if isinstance(self.ids, array):
+            try:
+                array("q", ids)
+            except (TypeError, OverflowError):
+                self.ids = list(self.ids)
+        return ids
+
+    def _extend_ids(self, ids):
+        """ Append `ids` to the ids column; returns them as stored. """
+        if isinstance(self.ids, array):
+            first = len(self.ids)
+            try:
+                self.ids.extend(ids)
+                return ids
+            except (TypeError, OverflowError):
+                # array.extend keeps what it appended before the bad id
+                del self.ids[first:]
+        ids = self._storable(ids)
+        self.ids.extend(ids)
+        return ids
+
+    def append(self, service_id, name, url):
+        prefix, tail = split_url(url)
+        service_id = self._storable([service_id])[0]
+        if self._rows_valid:
+            self._rows[service_id] = len(self.ids)
+        self.ids.append(service_id)
+        self.names.append(sys.intern(name))
+        self.url_prefix_rows.append(self._prefix(prefix))
+        self.url_tails.append(tail)
+        self.scrambled.append(name.startswith('$'))
+
+    def extend(self, services):
+        if isinstance(services, ServiceStore):
+            return self._extend_store(services)
+        services = services if isinstance(services, list) else list(services)
+        self._extend_columns(list(map(itemgetter("id"), services)), list(map(itemgetter("servicename"), services)),
+                             list(map(itemgetter("url"), services)))
+
+    def extend_rows(self, rows):
+        """ Append (id, name, url) tuples, e.g. rows from SQLite. """
+        if rows:
+            self._extend_columns(*zip(*rows))
+
+    def _extend_columns(self, ids, names, urls):
+        if not ids:
+            return
+        first = len(self.ids)
+        ids = self._extend_ids(ids)
+        self.names.extend(map(sys.intern, names))
+        self.scrambled.extend(map(str.startswith, names, repeat('$')))
+        # Any split is correct as long as prefix + tail gives the URL back, and
+        # usually a whole page shares the prefix of the URL before it
+        prefix = self.url_prefixes[-1] if self.url_prefixes else split_url(urls[0])[0]
+        if all(map(str.startswith, urls, repeat(prefix))):
+            length = len(prefix)
+            self.url_prefix_rows.extend(array("I", [self._prefix(prefix)]) * len(urls))
+            self.url_tails.extend([url[length:] for url in urls])
+        else:
+            for url in urls:
+                prefix, tail = split_url(url)
+                self.url_prefix_rows.append(self._prefix(prefix))
+                self.url_tails.append(tail)
+        if self._rows_valid:
+            self._rows.update(zip(ids, range(first, len(self.ids))))
+
+    def _extend_store(self, other):
+        first = len(self.ids)
+        ids = self._extend_ids(other.ids)
+        self.names.extend(other.names)
+        remap = [self._prefix(prefix) for prefix in other.url_prefixes]
+        if remap == list(range(len(remap))):
+            self.url_prefix_rows.extend(other.url_prefix_rows)
+        else:
+            self.url_prefix_rows.extend(map(remap.__getitem__, other.url_prefix_rows))
+        self.url_tails.extend(other.url_tails)
+        self.scrambled.extend(other.scrambled)
+        if self._rows_valid:
+            self._rows.update(zip(ids, range(first, len(self.ids))))
+
+    def insert(self, row, service):
+        prefix, tail = split_url(service["url"])
+        self.ids.insert(row, self._storable([service["id"]])[0])
+        self.names.insert(row, sys.intern(service["servicename"]))
+        self.url_prefix_rows.insert(row, self._prefix(prefix))
+        self.url_tails.insert(row, tail)
+        self.scrambled.insert(row, service["servicename"].startswith('$'))
+        self._rows_valid = False
+
+    def update(self, row, service):
+        prefix, tail = split_url(service["url"])
+        self.names[row] = sys.intern(service["servicename"])
+        self.url_prefix_rows[row] = self._prefix(prefix)
+        self.url_tails[row] = tail
+        self.scrambled[row] = service["servicename"].startswith('$')
+
+    def remove(self, first, last=None):
+        """ Remove rows `first` through `last` inclusive. """
+        end = (first if last is None else last) + 1
+        del self.ids[first:end], self.names[first:end], self.url_prefix_rows[first:end]
+        del self.url_tails[first:end], self.scrambled[first:end]
+        self._rows_valid = False
+
+    def clear(self):
+        self.__init__()
+
+    def removal_ranges(self, service_ids):
+        """ Rows of `service_ids` as `(first, last)` runs, bottom-most first. """
+        rows = sorted((self.row_of(service_id) for service_id in service_ids), reverse=True)
+        ranges = []
+        for row in rows:
+            if ranges and ranges[-1][0] == row + 1:
+                ranges[-1][0] = row
+            else:
+                ranges.append([row, row])
+        return [tuple(run) for run in ranges]
+
+    def apply_diff(self, diff):
+        """ Apply a `catalog_cache.CatalogDiff` in place. """
+        for first, last in self.removal_ranges(diff.removed):
+            self.remove(first, last)
+        for position, service in diff.added:
+            self.insert(position, service)
+        for position, service in diff.changed:
+            self.update(position, service)
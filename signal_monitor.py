@@ -0,0 +1,191 @@
+import csv
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from proginfo_cache import VOLATILE_KEYS
+
+_NUMBER = re.compile(r"[-+]?\d+(?:\.\d+)?")
+
+
+def parse_reading(value):
+    """ Receiver readings come as numbers or strings like "78%" or "1.2Mbps". """
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.search(str(value))
+    return float(match.group()) if match else float("nan")
+
+
+class SignalHistory:
+    """ Fixed-size ring buffer of `VOLATILE_KEYS` samples for one service.
+
+    The monitor thread appends while GUIs read, so readers on other threads
+    work on a `snapshot`.
+    """
+
+    def __init__(self, capacity=600):
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.full((capacity, len(VOLATILE_KEYS)), np.nan)
+        self.next = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, info):
+        row = [parse_reading(info[key]) for key in VOLATILE_KEYS]
+        with self.lock:
+            self.times[self.next] = timestamp
+            self.values[self.next] = row
+            self.next = (self.next + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def snapshot(self):
+        """ A copy that later appends do not touch. """
+        copy = SignalHistory.__new__(SignalHistory)
+        with self.lock:
+            copy.capacity = self.capacity
+            copy.times = self.times.copy()
+            copy.values = self.values.copy()
+            copy.next = self.next
+            copy.count = self.count
+        copy.lock = threading.Lock()
+        return copy
+
+    def _ordered(self, column):
+        if self.count < self.capacity:
+            return column[:self.count]
+        return np.roll(column, -self.next, axis=0)
+
+    def series(self, key):
+        return self._ordered(self.values[:, VOLATILE_KEYS.index(key)])
+
+    def latest(self):
+        return self.values[(self.next - 1) % self.capacity]
+
+    def summary(self, key):
+        """ (min, mean, max) of the buffered samples for `key`. """
+        values = self.series(key)
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return None
+        return values.min(), values.mean(), values.max()
+
+    def to_csv(self, path):
+        history = self.snapshot()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("timestamp",) + VOLATILE_KEYS)
+            for timestamp, row in zip(history._ordered(history.times), history._ordered(history.values)):
+                writer.writerow([f"{timestamp:.3f}"] + [f"{value:g}" for value in row])
+
+
+class AdaptiveInterval:
+    """ Poll faster while readings move and back off while they are stable. """
+
+    def __init__(self, min_interval=0.5, max_interval=5.0, threshold=0.02):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.threshold = threshold
+        self.interval = min_interval
+
+    def update(self, previous, current):
+        if previous is None:
+            return self.interval
+        scale = np.maximum(np.abs(previous), 1.0)
+        change = np.nanmax(np.abs(current - previous) / scale, initial=0.0)
+        if change > self.threshold:
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        return self.interval
+
+
+class SignalMonitor:
+    """ Background poller of /proginfo for the currently selected service.
+
+    `on_sample(service_id, info, history)` is called from the monitor thread
+    after every successful poll with a snapshot of the service's history;
+    GUIs must hand it over to their own thread.
+    """
+
+    def __init__(self, on_sample, on_error=None, capacity=600, max_services=32,
+                 min_interval=0.5, max_interval=5.0):
+        self.on_sample = on_sample
+        self.on_error = on_error
+        self.capacity = capacity
+        self.max_services = max_services
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.histories = OrderedDict()
+        self.target = None
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def history(self, service_id):
+        history = self.histories.get(service_id)
+        if history is None:
+            history = self.histories[service_id] = SignalHistory(self.capacity)
+            while len(self.histories) > self.max_services:
+                self.histories.popitem(last=False)
+        self.histories.move_to_end(service_id)
+        return history
+
+    def watch(self, client, service_id):
+        with self.lock:
+            self.target = (client, service_id)
+            # A poller that was asked to stop but has not exited yet is
+            # revived rather than joined by a second one
+            self.stopped.clear()
+            self.wakeup.set()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="signal-monitor", daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        """ Ask the poller to exit without waiting for a poll in flight. """
+        with self.lock:
+            self.stopped.set()
+            self.wakeup.set()
+
+    def _exiting(self):
+        if not self.stopped.is_set():
+            return False
+        with self.lock:
+            if not self.stopped.is_set():
+                return False
+            self.thread = None
+            return True
+
+    def _run(self):
+        previous_target = None
+        pacing = None
+        previous = None
+        while not self._exiting():
+            target = self.target
+            if target != previous_target:
+                previous_target = target
+                pacing = AdaptiveInterval(self.min_interval, self.max_interval)
+                previous = None
+            client, service_id = target
+            self.wakeup.clear()
+            try:
+                info = client.proginfo_cache.get(service_id, fresh=True)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(e)
+                self.wakeup.wait(self.max_interval)
+                continue
+            if self.stopped.is_set() or target != self.target:
+                continue
+            history = self.history(service_id)
+            history.append(time.time(), info)
+            current = history.latest()
+            interval = pacing.update(previous, current)
+            previous = current.copy()
+            self.on_sample(service_id, info, history.snapshot())
+            self.wakeup.wait(interval)
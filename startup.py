@@ -0,0 +1,104 @@
+""" Startup timing and background warm-up for the front ends.
+
+Both front ends show their window before doing anything slow. libvlc and
+Discord start on background threads, and the modules only some features
+need (numpy, asyncio, requests) are imported on a background thread once
+the event loop runs. The cached catalog is loaded on a worker and filled in
+when it arrives. Time to interactive is the time from the front end
+starting to import to the first pass of the event loop after the window is
+shown. Import this module first so that the clock starts at the right time.
+
+Run as a script to measure time to interactive from process start, against
+`TARGET`:
+
+    python startup.py --runs 10
+    python startup.py --front-end qt
+"""
+import argparse
+import importlib
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+STARTED = time.perf_counter()
+# Time to interactive the front ends must stay under, process start included.
+# Headless, the Qt front end measures ~80 ms with 1000 or 50000 cached services:
+# the cached catalog is loaded on a worker and shown after the first event loop pass
+TARGET = 0.5
+EXIT_VARIABLE = "GTMEDIA_EXIT_WHEN_INTERACTIVE"
+FRONT_ENDS = {"qt": "GTMedia-Qt.py", "tk": "GTmedia.py"}
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def elapsed():
+    return time.perf_counter() - STARTED
+
+
+def preload(*module_names):
+    """ Import `module_names` on a background thread, in order. """
+    def run():
+        started = time.perf_counter()
+        for name in module_names:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                print(f"Preloading {name} failed: {e}")
+        print(f"Preloaded {len(module_names)} modules in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    thread = threading.Thread(target=run, name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def interactive(name):
+    """ Log time to interactive; call on the first event loop pass after showing the window. """
+    print(f"{name} interactive after {elapsed() * 1000:.0f} ms")
+    if os.environ.get(EXIT_VARIABLE):
+        sys.stdout.flush()
+        # The benchmark only needs the timing; skip the quit dialogs
+        os._exit(0)
+
+
+def measure(front_end, runs=5, env=None, timeout=60):
+    """ Seconds from process start to interactive, once per run. """
+    env = dict(os.environ if env is None else env, **{EXIT_VARIABLE: "1"})
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(HERE, FRONT_ENDS[front_end])], cwd=HERE, env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            ready = any(" interactive after " in line for line in process.stdout)
+            samples.append(time.perf_counter() - started)
+            process.wait(timeout)
+        finally:
+            if process.poll() is None:
+                process.kill()
+        if not ready:
+            raise RuntimeError(f"{FRONT_ENDS[front_end]} exited before becoming interactive")
+    return samples
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the front ends' time to interactive.")
+    parser.add_argument("--front-end", choices=sorted(FRONT_ENDS), nargs="+", default=sorted(FRONT_ENDS))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for front_end in args.front_end:
+        try:
+            samples = measure(front_end, args.runs)
+        except RuntimeError as e:
+            print(f"{front_end}: {e}")
+            failed = True
+            continue
+        median = statistics.median(samples)
+        failed |= median > TARGET
+        print(f"{front_end}: median {median * 1000:.0f} ms, min {min(samples) * 1000:.0f} ms, "
+              f"max {max(samples) * 1000:.0f} ms ({'within' if median <= TARGET else 'over'} "
+              f"the {TARGET * 1000:.0f} ms target)")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,236 @@
+""" HTTP client for the GTMedia receiver API on port 81.
+
+Used by both front ends and usable on its own. One pooled keep-alive session
+is kept per receiver, so clicking through channels reuses the same TCP
+connection instead of opening a new one for every request.
+
+Run as a script to compare per-request latency against bare `requests.get`:
+
+    python stb_client.py 192.168.1.10 --requests 50
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple, TypedDict
+
+from proginfo_cache import ProgInfoCache
+from service_parser import ServicePageParser
+from service_store import ServiceStore
+from telemetry import metrics
+
+# GTMEDIA_PORT points both front ends at another port, e.g. a mock_receiver.py
+DEFAULT_PORT = int(os.environ.get("GTMEDIA_PORT", 81))
+DEFAULT_TIMEOUT = (3.05, 10)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+PROGINFO_KEYS = {"servicename", "satname", "FQ", "PID", "intensity", "quality", "rev_rate", "send_rate"}
+
+
+class Service(TypedDict):
+    id: int
+    servicename: str
+    url: str
+
+
+class ServicePage(TypedDict):
+    count: int
+    pagetotal: int
+    services: ServiceStore
+
+
+class ProgInfo(TypedDict):
+    servicename: str
+    satname: str
+    FQ: str
+    PID: str
+    intensity: str
+    quality: str
+    rev_rate: str
+    send_rate: str
+
+
+class STBError(Exception):
+    pass
+
+
+def corrected_stream_url(url: str, audio_pid: Optional[str]) -> str:
+    """ Return the SAT2IP url with its audio PID field replaced by `audio_pid`. """
+    if audio_pid is None:
+        return url
+    parts = url.split('_')
+    parts[-4] = str(audio_pid)
+    return '_'.join(parts)
+
+
+def audio_pid_of(info: ProgInfo) -> str:
+    """ The PID field of /proginfo reads "video/audio[/...]". """
+    return info['PID'].split('/')[1]
+
+
+class STBClient:
+    def __init__(self, ip_address: str, port: int = DEFAULT_PORT, timeout=DEFAULT_TIMEOUT,
+                 retries: int = 2, pool_size: int = 8):
+        self.ip_address = ip_address
+        self.base_url = f"http://{ip_address}:{port}"
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+        # Round trips of the last successful requests, see playback_supervisor
+        self.latencies = deque(maxlen=64)
+        self.proginfo_cache = ProgInfoCache(self.get_proginfo)
+
+    @property
+    def session(self):
+        """ The pooled session, created with the first request.
+
+        requests and urllib3 take ~100 ms to import, so they are loaded on
+        the worker thread making that request rather than on the GUI thread.
+        """
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                retry = Retry(total=self.retries, connect=self.retries, read=self.retries, status=self.retries,
+                              backoff_factor=0.2, status_forcelist=(500, 502, 503, 504),
+                              allowed_methods=frozenset(["GET"]))
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+                self._session = requests.Session()
+                self._session.mount("http://", adapter)
+            return self._session
+
+    def get_json(self, path: str, params: Optional[dict] = None) -> Tuple[dict, int]:
+        """ GET `path` and return the decoded JSON body and its size in bytes. """
+        import requests
+
+        started = time.perf_counter()
+        try:
+            response = self.session.get(self.base_url + path, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+            self._record(path, started, "error")
+            raise STBError(e) from e
+        self._record(path, started, "ok", len(response.content))
+        return data, len(response.content)
+
+    def get_streamed(self, path: str, parser, params: Optional[dict] = None) -> Tuple[dict, int]:
+        """ GET `path` and feed the body to `parser` as it arrives; returns what `parser.close()` does and the size. """
+        import requests
+
+        started = time.perf_counter()
+        size = 0
+        try:
+            with self.session.get(self.base_url + path, params=params, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                    size += len(chunk)
+                    parser.feed(chunk)
+            data = parser.close()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self._record(path, started, "error")
+            raise STBError(e) from e
+        self._record(path, started, "ok", size)
+        return data, size
+
+    def _record(self, path, started, outcome, size=0):
+        elapsed = time.perf_counter() - started
+        metrics.observe("receiver_http_seconds", elapsed, endpoint=path, outcome=outcome)
+        if outcome == "ok" and path == "/proginfo":
+            self.latencies.append(elapsed)
+        if size:
+            metrics.increment("receiver_http_bytes_total", size, endpoint=path)
+
+    def get_services_page(self, page: int = 1, count: int = 100) -> Tuple[ServicePage, int]:
+        """ One catalog page; its services are parsed into a `ServiceStore` while the body streams in. """
+        data, size = self.get_streamed("/getallservices", ServicePageParser(), {"count": count, "page": page})
+        if "pagetotal" not in data or "services" not in data:
+            raise STBError("Invalid response format.")
+        return data, size
+
+    def get_proginfo(self, service_id) -> ProgInfo:
+        data, _ = self.get_json("/proginfo", {"id": service_id})
+        if not PROGINFO_KEYS.issubset(data):
+            raise STBError("Invalid response format.")
+        return data
+
+    def cached_proginfo(self, service_id, volatile: bool = True) -> ProgInfo:
+        """ /proginfo through the client's cache; see `ProgInfoCache.get`. """
+        return self.proginfo_cache.get(service_id, volatile=volatile)
+
+    def stream_url(self, service: Service, audio_pid: Optional[str] = None) -> str:
+        return corrected_stream_url(service["url"], audio_pid)
+
+    def close(self):
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+_clients: Dict[Tuple[str, int], STBClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(ip_address: str, port: int = DEFAULT_PORT) -> STBClient:
+    """ Return the shared client for a receiver, creating it on first use. """
+    with _clients_lock:
+        client = _clients.get((ip_address, port))
+        if client is None:
+            client = _clients[(ip_address, port)] = STBClient(ip_address, port)
+        return client
+
+
+def _percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+def _report(name, samples):
+    print(f"{name:>16}: mean {statistics.mean(samples) * 1000:7.2f} ms  "
+          f"p50 {_percentile(samples, 0.5) * 1000:7.2f} ms  "
+          f"p95 {_percentile(samples, 0.95) * 1000:7.2f} ms")
+
+
+def benchmark(ip_address, port=DEFAULT_PORT, requests_count=50):
+    import requests
+
+    client = STBClient(ip_address, port)
+    page, _ = client.get_services_page(1, count=requests_count)
+    ids = [service["id"] for service in page["services"]] or [0]
+    ids = (ids * requests_count)[:requests_count]
+
+    bare = []
+    for service_id in ids:
+        started = time.perf_counter()
+        requests.get(f"{client.base_url}/proginfo", params={"id": service_id},
+                     timeout=client.timeout).json()
+        bare.append(time.perf_counter() - started)
+
+    pooled = []
+    for service_id in ids:
+        started = time.perf_counter()
+        client.get_proginfo(service_id)
+        pooled.append(time.perf_counter() - started)
+
+    print(f"/proginfo x{len(ids)} on {client.base_url}")
+    _report("requests.get", bare)
+    _report("pooled session", pooled)
+    client.close()
+    return bare, pooled
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /proginfo latency with and without connection reuse.")
+    parser.add_argument("ip_address")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    benchmark(args.ip_address, args.port, args.requests)
@@ -0,0 +1,407 @@
+""" Local HTTP relay that shares one receiver stream with many viewers.
+
+The receiver can only serve a few SAT>IP streams at once. The relay opens
+each upstream URL once, receives the MPEG-TS straight into a ring buffer
+(`sock_recv_into`, no intermediate bytes objects) and copies each client's
+share out of it once, when writing. A client that falls a whole buffer
+behind, or stops reading, is dropped rather than buffered for. The
+upstream session is closed a few seconds after its last client leaves, so
+zapping back or reconnecting the player reuses it.
+
+Play `relay.url_for(stream_url)` instead of `stream_url`. The relay only
+opens upstream URLs registered that way, or on one of its `allowed_hosts`;
+anything else gets a 404. Run as a script to serve, or to measure
+throughput against a local fake TS source:
+
+    python stream_relay.py --port 8081 --receiver 192.168.1.10:8080
+    python stream_relay.py --benchmark --clients 8 --seconds 5
+"""
+import argparse
+import asyncio
+import socket
+import threading
+import time
+from urllib.parse import parse_qs, quote, urlsplit
+
+TS_PACKET = 188
+CHUNK_SIZE = TS_PACKET * 348
+MAX_HEADER = 16 * 1024
+
+
+class RelayError(Exception):
+    pass
+
+
+class SlowClient(Exception):
+    pass
+
+
+class RingBuffer:
+    """ Fixed-size byte ring addressed by absolute stream offsets. """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.view = memoryview(bytearray(capacity))
+        self.written = 0
+
+    def oldest(self):
+        return max(0, self.written - self.capacity)
+
+    def writable(self, limit):
+        """ The contiguous free space at the write position, at most `limit` bytes. """
+        start = self.written % self.capacity
+        return self.view[start:start + min(limit, self.capacity - start)]
+
+    def advance(self, count):
+        self.written += count
+
+    def write(self, data):
+        data = memoryview(data)
+        while data:
+            view = self.writable(len(data))
+            view[:] = data[:len(view)]
+            self.advance(len(view))
+            data = data[len(view):]
+
+    def read(self, position, limit):
+        """ Up to `limit` bytes from `position` as one or two memoryviews. """
+        end = min(self.written, position + limit)
+        views = []
+        while position < end:
+            start = position % self.capacity
+            view = self.view[start:start + min(end - position, self.capacity - start)]
+            views.append(view)
+            position += len(view)
+        return views
+
+
+class _Channel:
+    def __init__(self, relay, url):
+        self.relay = relay
+        self.url = url
+        self.ring = RingBuffer(relay.buffer_size)
+        self.clients = 0
+        self.closed = False
+        self.changed = asyncio.Event()
+        self.idle_handle = None
+        self.task = asyncio.ensure_future(self._pump())
+
+    def _notify(self):
+        # Wake the clients waiting on the current event; later waiters get a new one
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def start_position(self):
+        """ Where a new client starts: a little behind live, on a TS packet. """
+        position = max(self.ring.oldest(), self.ring.written - self.relay.backlog)
+        position -= position % TS_PACKET
+        return position + TS_PACKET if position < self.ring.oldest() else position
+
+    async def _open(self):
+        loop = asyncio.get_running_loop()
+        parts = urlsplit(self.url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, (parts.hostname, parts.port or 80)), self.relay.timeout)
+            # HTTP/1.0 keeps the body a plain byte stream, no chunked encoding
+            await loop.sock_sendall(sock, f"GET {path} HTTP/1.0\r\nHost: {parts.netloc}\r\n\r\n".encode())
+            head = bytearray()
+            while b"\r\n\r\n" not in head:
+                if len(head) > MAX_HEADER:
+                    raise RelayError("upstream header too long")
+                chunk = await asyncio.wait_for(loop.sock_recv(sock, 4096), self.relay.timeout)
+                if not chunk:
+                    raise RelayError("upstream closed before sending a response")
+                head += chunk
+        except BaseException:
+            sock.close()
+            raise
+        head, _, body = bytes(head).partition(b"\r\n\r\n")
+        status_line = head.split(b"\r\n", 1)[0]
+        status = status_line.split()
+        if len(status) < 2 or status[1] != b"200":
+            sock.close()
+            raise RelayError(f"upstream answered {status_line.decode(errors='replace')}")
+        self.ring.write(body)
+        return sock
+
+    async def _pump(self):
+        loop = asyncio.get_running_loop()
+        sock = None
+        try:
+            sock = await self._open()
+            self._notify()
+            while True:
+                count = await loop.sock_recv_into(sock, self.ring.writable(CHUNK_SIZE))
+                if not count:
+                    break
+                self.ring.advance(count)
+                self.relay.bytes_in += count
+                self._notify()
+        except (OSError, asyncio.TimeoutError, RelayError) as e:
+            print(f"Relay upstream {self.url} failed: {e}")
+        finally:
+            if sock:
+                sock.close()
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.task.cancel()
+        if self.relay.channels.get(self.url) is self:
+            del self.relay.channels[self.url]
+        self._notify()
+
+    def attach(self):
+        self.clients += 1
+        if self.idle_handle:
+            self.idle_handle.cancel()
+            self.idle_handle = None
+
+    def detach(self):
+        self.clients -= 1
+        if not self.clients and not self.closed:
+            self.idle_handle = asyncio.get_running_loop().call_later(self.relay.idle_timeout, self._close_if_idle)
+
+    def _close_if_idle(self):
+        if not self.clients:
+            self.close()
+
+
+class StreamRelay:
+    """ Relay server; `start()` runs it on its own thread and event loop.
+
+    `allowed_hosts` are "host:port" pairs whose URLs may be relayed without
+    going through `url_for` first.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, buffer_size=8 * 1024 * 1024, backlog=512 * 1024,
+                 idle_timeout=3.0, timeout=5.0, max_write=256 * 1024, allowed_hosts=()):
+        self.host = host
+        self.port = port
+        self.buffer_size = buffer_size
+        self.backlog = backlog
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.max_write = max_write
+        self.channels = {}
+        self.sources = set()
+        self.allowed_hosts = set(allowed_hosts)
+        self.server = None
+        self.loop = None
+        self.thread = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.dropped = 0
+
+    def url_for(self, upstream_url):
+        self.sources.add(upstream_url)
+        return f"http://{self.host}:{self.port}/relay?src={quote(upstream_url, safe='')}"
+
+    async def serve(self):
+        """ Bind the listening socket; the server then runs with the loop. """
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    def start(self):
+        """ Serve from a background thread; returns once the port is bound. """
+        started = threading.Event()
+        failure = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.loop.run_until_complete(self.serve())
+            except OSError as e:
+                failure.append(e)
+                started.set()
+                return
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name="stream-relay", daemon=True)
+        self.thread.start()
+        started.wait()
+        if failure:
+            raise failure[0]
+        print(f"Stream relay listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        if not self.loop:
+            return
+
+        async def shutdown():
+            self.server.close()
+            for channel in list(self.channels.values()):
+                channel.close()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.loop = None
+
+    def allows(self, upstream_url):
+        return upstream_url in self.sources or urlsplit(upstream_url).netloc in self.allowed_hosts
+
+    def __str__(self):
+        return (f"{len(self.channels)} upstream streams, {self.bytes_in / 1048576:.1f} MiB in, "
+                f"{self.bytes_out / 1048576:.1f} MiB out, {self.dropped} slow clients dropped")
+
+    async def _handle_client(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.timeout)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+        parts = request.split(b"\r\n", 1)[0].split()
+        target = urlsplit(parts[1].decode("latin-1")) if len(parts) >= 2 else None
+        sources = parse_qs(target.query).get("src") if target and target.path == "/relay" else None
+        # Never an open proxy: only streams the application asked for
+        if not sources or not self.allows(sources[0]):
+            writer.write(b"HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            writer.close()
+            return
+
+        channel = self.channels.get(sources[0])
+        if channel is None:
+            channel = self.channels[sources[0]] = _Channel(self, sources[0])
+        writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: video/mp2t\r\nCache-Control: no-cache\r\n\r\n")
+        channel.attach()
+        try:
+            await self._stream(channel, writer)
+        except (SlowClient, asyncio.TimeoutError):
+            self.dropped += 1
+            print(f"Relay dropped a slow client of {channel.url}")
+        except ConnectionError:
+            pass
+        finally:
+            channel.detach()
+            writer.close()
+
+    async def _stream(self, channel, writer):
+        ring = channel.ring
+        position = channel.start_position()
+        while True:
+            changed = channel.changed
+            if position >= ring.written:
+                if channel.closed:
+                    return
+                await changed.wait()
+                continue
+            if position < ring.oldest():
+                raise SlowClient()
+            for view in ring.read(position, self.max_write):
+                # A copy: since Python 3.12 the transport keeps unsent memoryviews
+                # as they are, and the pump would overwrite them before they go out
+                writer.write(bytes(view))
+                position += len(view)
+                self.bytes_out += len(view)
+            # A client that stops reading altogether is dropped as well
+            await asyncio.wait_for(writer.drain(), self.timeout)
+
+
+def _fake_source(bitrate):
+    # Null packets, PID 0x1FFF, paced at `bitrate` bits per second
+    block = (b"\x47\x1f\xff\x10" + b"\xff" * (TS_PACKET - 4)) * (CHUNK_SIZE // TS_PACKET)
+
+    async def serve(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: video/mp2t\r\n\r\n")
+        started = time.perf_counter()
+        sent = 0
+        try:
+            while True:
+                writer.write(block)
+                sent += len(block)
+                await writer.drain()
+                await asyncio.sleep(max(0.0, started + sent * 8 / bitrate - time.perf_counter()))
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    return serve
+
+
+async def _benchmark(clients, seconds, slow_clients, bitrate):
+    source = await asyncio.start_server(_fake_source(bitrate), "127.0.0.1", 0)
+    upstream = f"http://127.0.0.1:{source.sockets[0].getsockname()[1]}/?id_1_101_102_0_0_0"
+    relay = StreamRelay(buffer_size=4 * 1024 * 1024, timeout=2.0)
+    await relay.serve()
+    relayed = urlsplit(relay.url_for(upstream))
+    received = [0] * (clients + slow_clients)
+
+    async def client(index, slow):
+        reader, writer = await asyncio.open_connection(relay.host, relay.port)
+        writer.write(f"GET {relayed.path}?{relayed.query} HTTP/1.0\r\n\r\n".encode())
+        await reader.readuntil(b"\r\n\r\n")
+        try:
+            while True:
+                data = await reader.read(256 * 1024)
+                if not data:
+                    break
+                received[index] += len(data)
+                if slow:
+                    await asyncio.sleep(0.5)
+        finally:
+            writer.close()
+
+    tasks = [asyncio.ensure_future(client(i, i >= clients)) for i in range(clients + slow_clients)]
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    await asyncio.sleep(seconds)
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    sessions = len(relay.channels)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    relay.server.close()
+    for channel in list(relay.channels.values()):
+        channel.close()
+    # Let the client handlers see their channel close before the loop goes away
+    await asyncio.sleep(0.1)
+    source.close()
+
+    fast = [count * 8 / elapsed / 1e6 for count in received[:clients]]
+    print(f"{clients} clients over {elapsed:.1f}s: upstream {relay.bytes_in * 8 / elapsed / 1e6:.1f} Mbit/s, "
+          f"per client min {min(fast):.1f} / max {max(fast):.1f} Mbit/s, "
+          f"fan-out {relay.bytes_out * 8 / elapsed / 1e6:.0f} Mbit/s")
+    print(f"{sessions} upstream session(s), {relay.dropped} of {slow_clients} slow clients dropped, "
+          f"CPU {cpu / elapsed * 100:.0f}% (source, relay and clients in one process)")
+    return relay
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Share receiver streams with local players, or benchmark the relay.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--receiver", action="append", default=[], metavar="HOST:PORT",
+                        help="receiver whose streams may be relayed, can be repeated")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--slow-clients", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--bitrate", type=float, default=40.0, help="fake source rate in Mbit/s")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        asyncio.run(_benchmark(args.clients, args.seconds, args.slow_clients, args.bitrate * 1e6))
+    else:
+        if not args.receiver:
+            parser.error("give at least one --receiver")
+        relay = StreamRelay(args.host, args.port, allowed_hosts=args.receiver).start()
+        print(f"Play http://{relay.host}:{relay.port}/relay?src=<url-encoded stream URL on {args.receiver[0]}>")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            print(relay)
+            relay.stop()
@@ -0,0 +1,237 @@
+""" Timing histograms and event counters, cheap enough to leave on.
+
+`metrics` is the process-wide registry. Recording a value is a bisect into
+fixed bucket bounds under a lock, 1-2 µs. With the JSON lines
+log on, the observation is also appended to a queue that a background
+thread writes out once a second. The registry is also available as
+Prometheus text, over HTTP if asked for:
+
+    GTMEDIA_TELEMETRY_LOG=~/gtmedia.jsonl GTMEDIA_METRICS_PORT=9464 python GTMedia-Qt.py
+    curl http://127.0.0.1:9464/metrics
+
+Run as a script to measure the recording overhead:
+
+    python telemetry.py --observations 1000000
+"""
+import argparse
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Upper bounds in seconds, from a fast cached lookup to a slow tune
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Observations waiting for the log writer; the oldest are dropped beyond this
+MAX_LOG_QUEUE = 100_000
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction):
+        """ Estimated by interpolating inside the bucket, like histogram_quantile(). """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+
+def _label_text(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+class Telemetry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.log_queue = None
+        self.log_thread = None
+        self.server = None
+
+    def observe(self, name, seconds, **labels):
+        """ Add `seconds` to the histogram `name` for these labels. """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+        queue = self.log_queue
+        if queue is not None:
+            queue.append((time.time(), name, seconds, labels))
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def summary(self):
+        """ (name, labels, count, p50, p90, p99, max) per histogram, then (name, labels, total) per counter. """
+        with self.lock:
+            histograms = sorted((key, histogram.count, histogram.quantile(0.5), histogram.quantile(0.9),
+                                 histogram.quantile(0.99), histogram.max)
+                                for key, histogram in self.histograms.items())
+            counters = sorted(self.counters.items())
+        return ([(name, _label_text(labels), *values) for (name, labels), *values in histograms],
+                [(name, _label_text(labels), total) for (name, labels), total in counters])
+
+    def prometheus_text(self):
+        lines = []
+        previous = None
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+            for (name, labels), histogram in histograms:
+                if name != previous:
+                    lines.append(f"# TYPE {name} histogram")
+                    previous = name
+                prefix = _label_text(labels) + "," if labels else ""
+                cumulative = 0
+                for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                suffix = "{" + _label_text(labels) + "}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{suffix} {histogram.count}")
+        for (name, labels), total in counters:
+            if name != previous:
+                lines.append(f"# TYPE {name} counter")
+                previous = name
+            suffix = "{" + _label_text(labels) + "}" if labels else ""
+            lines.append(f"{name}{suffix} {total}")
+        return "\n".join(lines) + "\n"
+
+    def start_log(self, path, interval=1.0):
+        """ Append every observation to `path` as a JSON line, written out every `interval` seconds.
+
+        Raises OSError if `path` cannot be opened.
+        """
+        if self.log_thread:
+            return
+        f = open(os.path.expanduser(path), "a", encoding="utf-8")
+        self.log_queue = deque(maxlen=MAX_LOG_QUEUE)
+        self.log_thread = threading.Thread(target=self._write_log, args=(f, interval),
+                                           name="telemetry-log", daemon=True)
+        self.log_thread.start()
+
+    def _write_log(self, f, interval):
+        queue = self.log_queue
+        try:
+            with f:
+                while True:
+                    time.sleep(interval)
+                    lines = []
+                    while queue:
+                        timestamp, name, value, labels = queue.popleft()
+                        lines.append(json.dumps({"ts": round(timestamp, 3), "metric": name, "value": round(value, 6), **labels}))
+                    if lines:
+                        f.write("\n".join(lines) + "\n")
+                        f.flush()
+        except OSError as e:
+            print(f"Telemetry log stopped: {e}")
+        finally:
+            # Nothing reads the queue any more, so stop filling it
+            self.log_queue = None
+            self.log_thread = None
+
+    def serve(self, host="127.0.0.1", port=9464):
+        """ Serve `prometheus_text` at http://host:port/metrics on a background thread. """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="telemetry-http", daemon=True).start()
+        return self.server
+
+    def configure_from_environment(self):
+        """ Start the log and the endpoint if GTMEDIA_TELEMETRY_LOG / GTMEDIA_METRICS_PORT are set. """
+        path = os.environ.get("GTMEDIA_TELEMETRY_LOG")
+        if path:
+            try:
+                self.start_log(path)
+                print(f"Telemetry log: {os.path.expanduser(path)}")
+            except OSError as e:
+                print(f"Telemetry log not started: {e}")
+        port = os.environ.get("GTMEDIA_METRICS_PORT")
+        if port:
+            try:
+                self.serve(port=int(port))
+                print(f"Metrics at http://127.0.0.1:{port}/metrics")
+            except (OSError, ValueError) as e:
+                print(f"Metrics endpoint not started: {e}")
+
+
+def format_summary(summary):
+    """ `Telemetry.summary()` as a plain-text table. """
+    histograms, counters = summary
+    lines = [f"{'metric':<28} {'labels':<32} {'count':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}"]
+    for name, labels, count, p50, p90, p99, maximum in histograms:
+        lines.append(f"{name:<28} {labels:<32} {count:>7} {p50 * 1000:>8.1f} {p90 * 1000:>8.1f} "
+                     f"{p99 * 1000:>8.1f} {maximum * 1000:>8.1f}")
+    for name, labels, total in counters:
+        lines.append(f"{name:<28} {labels:<32} {total:>7}")
+    return "\n".join(lines)
+
+
+metrics = Telemetry()
+
+
+def benchmark(observations=1_000_000):
+    registry = Telemetry()
+    started = time.perf_counter()
+    for _ in range(observations):
+        registry.observe("receiver_http_seconds", 0.012, endpoint="/proginfo", outcome="ok")
+    plain = (time.perf_counter() - started) / observations
+    registry.log_queue = deque()
+    started = time.perf_counter()
+    for _ in range(observations):
+        registry.observe("receiver_http_seconds", 0.012, endpoint="/proginfo", outcome="ok")
+    logged = (time.perf_counter() - started) / observations
+    print(f"observe(): {plain * 1e9:.0f} ns, {logged * 1e9:.0f} ns with the log queue")
+    return plain, logged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the cost of recording a timing.")
+    parser.add_argument("--observations", type=int, default=1_000_000)
+    args = parser.parse_args()
+    benchmark(args.observations)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_receiver import MockReceiver  # noqa: E402
+
+
+@pytest.fixture
+def mock_receiver():
+    """ Start `MockReceiver`s on free ports; all are stopped after the test. """
+    started = []
+
+    def start(services=250, port=0, **kwargs):
+        receiver = MockReceiver(services, port=port, **kwargs).start()
+        started.append(receiver)
+        return receiver
+
+    yield start
+    for receiver in started:
+        receiver.stop()
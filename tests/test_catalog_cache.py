@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from catalog_cache import CatalogCache, diff_catalogs
+from service_store import ServiceStore
+
+
+def service(service_id, name=None):
+    return {"id": service_id, "servicename": name or f"Service {service_id}",
+            "url": f"http://192.168.1.10:81/stream/{service_id}"}
+
+
+def edited(services, rng):
+    """ `services` with some removed, renamed, moved and added. """
+    services = [dict(s) for s in services if rng.random() > 0.1]
+    for s in rng.sample(services, len(services) // 10):
+        s["servicename"] += " HD"
+    for _ in range(len(services) // 20):
+        services.insert(rng.randrange(len(services) + 1), services.pop(rng.randrange(len(services))))
+    next_id = 10000
+    for _ in range(len(services) // 10):
+        services.insert(rng.randrange(len(services) + 1), service(next_id))
+        next_id += 1
+    return services
+
+
+def apply(old, diff):
+    """ Replay `diff` on a list the way the list models do. """
+    services = [s for s in old if s["id"] not in set(diff.removed)]
+    for position, s in diff.added:
+        services.insert(position, s)
+    for position, s in diff.changed:
+        services[position] = s
+    return services
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_diff_reproduces_the_new_catalog(seed):
+    rng = random.Random(seed)
+    old = [service(n) for n in range(300)]
+    new = edited(old, rng)
+    for diff in (diff_catalogs(old, new), diff_catalogs(ServiceStore(old), ServiceStore(new))):
+        assert apply(old, diff) == new
+    store = ServiceStore(old)
+    store.apply_diff(diff_catalogs(store, new))
+    assert store.to_list() == new
+
+
+def test_diff_is_minimal_for_small_changes():
+    old = [service(n) for n in range(10)]
+    assert not diff_catalogs(old, old)
+    new = old[:3] + [service(3, "Renamed")] + old[4:7] + [service(42)] + old[8:]
+    diff = diff_catalogs(old, new)
+    assert diff.removed == [7]
+    assert diff.added == [(7, service(42))]
+    assert diff.changed == [(3, service(3, "Renamed"))]
+    # One service moved to the top is one removal and one addition
+    moved = [old[9]] + old[:9]
+    assert str(diff_catalogs(old, moved)) == "1 added, 1 removed, 0 changed"
+
+
+def test_cache_round_trip(tmp_path):
+    cache = CatalogCache(str(tmp_path / "catalog.sqlite"))
+    services = [service(n) for n in range(50)] + [service("a-b")]
+    cache.save("192.168.1.10", services)
+    cache.save("192.168.1.11", services[:5])
+    cache.save_audio_choice("192.168.1.10", 3, "0x102", "deu")
+    cache.close()
+
+    cache = CatalogCache(str(tmp_path / "catalog.sqlite"))
+    assert cache.last_ip() == "192.168.1.11"
+    assert cache.load("192.168.1.10").to_list() == services
+    assert len(cache.load("192.168.1.11")) == 5
+    assert len(cache.load("10.0.0.1")) == 0
+    assert cache.load_audio_choices("192.168.1.10") == {3: ("0x102", "deu")}
+    cache.close()
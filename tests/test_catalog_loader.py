@@ -0,0 +1,50 @@
+from catalog_loader import CatalogLoader
+from stb_client import STBClient
+
+
+def load(receiver, page_size=100):
+    client = STBClient(receiver.host, receiver.port)
+    pages = []
+    try:
+        services = CatalogLoader(client, page_size=page_size).load(on_page=pages.append)
+    finally:
+        client.close()
+    return services, pages
+
+
+def test_pages_arrive_in_order_without_duplicates(mock_receiver):
+    receiver = mock_receiver(250)
+    services, pages = load(receiver)
+    assert [len(page) for page in pages] == [100, 100, 50]
+    assert list(services.ids) == [service["id"] for service in receiver.services]
+    assert receiver.stats["/getallservices"] == 3
+
+
+def test_single_page_catalog(mock_receiver):
+    receiver = mock_receiver(40)
+    services, pages = load(receiver)
+    assert len(pages) == 1
+    assert services.to_list() == receiver.services
+
+
+def test_receiver_ignoring_page_falls_back_to_one_response(mock_receiver):
+    receiver = mock_receiver(250, paging=False)
+    services, pages = load(receiver)
+    assert list(services.ids) == [service["id"] for service in receiver.services]
+    assert services.to_list() == receiver.services
+    # Page 1, then everything else from one full response
+    assert pages[0].to_list() == receiver.services[:100]
+    assert len(pages) == 2
+
+
+def test_pages_stay_bounded_ahead_of_consumer(mock_receiver):
+    receiver = mock_receiver(2000)
+    client = STBClient(receiver.host, receiver.port)
+    loader = CatalogLoader(client, page_size=10, max_workers=2)
+    pages = loader.pages()
+    next(pages)
+    next(pages)
+    pages.close()
+    client.close()
+    # Page 1, then at most 2 * max_workers pages ahead plus one refill
+    assert receiver.stats["/getallservices"] <= 1 + 2 * 2 + 1
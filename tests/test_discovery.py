@@ -0,0 +1,99 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from discovery import _parse_response, discover, probe
+
+
+class NotFound(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_error(404)
+
+
+@pytest.fixture
+def lan(mock_receiver):
+    """ Receivers on 127.0.0.2 and .3, a web server that is not one on .4 and a host that never answers on .5. """
+    fast = mock_receiver(120, host="127.0.0.2")
+    port = fast.port
+    slow = mock_receiver(30, host="127.0.0.3", port=port, latency=0.05)
+    web = ThreadingHTTPServer(("127.0.0.4", port), NotFound)
+    threading.Thread(target=web.serve_forever, daemon=True).start()
+    silent = socket.socket()
+    silent.bind(("127.0.0.5", port))
+    silent.listen()
+    yield port, fast, slow
+    web.shutdown()
+    web.server_close()
+    silent.close()
+
+
+def test_parse_response():
+    ok = b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{"count": 1, "pagetotal": 812, "services": []}'
+    assert _parse_response(ok) == 812
+    assert _parse_response(b"HTTP/1.1 404 Not Found\r\n\r\n{}") is None
+    assert _parse_response(b"HTTP/1.1 200 OK\r\n\r\n<html></html>") is None
+    assert _parse_response(b'HTTP/1.1 200 OK\r\n\r\n{"services": []}') is None
+    assert _parse_response(b'HTTP/1.1 200 OK\r\n\r\n{"pagetotal": null, "services": []}') is None
+    assert _parse_response(b'HTTP/1.1 200 OK\r\n\r\n{"pagetotal": "n/a", "services": []}') is None
+    assert _parse_response(b"") is None
+
+
+def test_scan_finds_receivers_ranked_by_latency(lan):
+    port, fast, slow = lan
+    found = []
+    started = time.perf_counter()
+    receivers = discover("127.0.0.0/29", port=port, timeout=0.5, on_found=found.append)
+    elapsed = time.perf_counter() - started
+    assert [(r.ip_address, r.services) for r in receivers] == [("127.0.0.2", 120), ("127.0.0.3", 30)]
+    assert receivers[0].latency < receivers[1].latency
+    assert sorted(r.ip_address for r in found) == ["127.0.0.2", "127.0.0.3"]
+    # Hosts are probed concurrently: the silent one costs one timeout, not one per host
+    assert elapsed < 1.5
+
+
+def test_probe_timeout_and_refused(lan):
+    import asyncio
+
+    port, _, _ = lan
+    assert asyncio.run(probe("127.0.0.5", port, timeout=0.2)) is None
+    assert asyncio.run(probe("127.0.0.6", port, timeout=0.2)) is None
+
+
+def test_single_address_network(mock_receiver):
+    receiver = mock_receiver(5)
+    assert [r.services for r in discover(f"{receiver.host}/32", port=receiver.port)] == [5]
+
+
+@pytest.mark.parametrize("content_length", [True, False])
+def test_probe_keeps_an_answer_from_a_host_that_holds_the_connection(content_length):
+    import asyncio
+
+    body = b'{"count": 1, "pagetotal": 7, "services": []}'
+    head = b"HTTP/1.0 200 OK\r\n" + (b"Content-Length: %d\r\n" % len(body) if content_length else b"")
+    server = socket.socket()
+    server.bind(("127.0.0.7", 0))
+    server.listen()
+    connections = []
+
+    def answer():
+        connection, _ = server.accept()
+        connections.append(connection)
+        connection.recv(4096)
+        connection.sendall(head + b"\r\n" + body)
+
+    threading.Thread(target=answer, daemon=True).start()
+    started = time.perf_counter()
+    receiver = asyncio.run(probe("127.0.0.7", server.getsockname()[1], timeout=0.5))
+    elapsed = time.perf_counter() - started
+    for connection in connections:
+        connection.close()
+    server.close()
+    assert receiver is not None and receiver.services == 7
+    # With a Content-Length the probe stops as soon as the body is in
+    assert elapsed < (0.4 if content_length else 1.0)
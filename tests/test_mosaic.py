@@ -0,0 +1,20 @@
+from mosaic import TunerScheduler, by_distance, transponder_of
+
+
+def test_transponder_of_normalizes_the_frequency():
+    assert transponder_of({"satname": "Astra", "FQ": "10700  h 27500"}) == ("Astra", "10700 H 27500")
+    # Some receivers send the frequency as a bare number
+    assert transponder_of({"satname": "Astra", "FQ": 10700}) == ("Astra", "10700")
+
+
+def test_scheduler_shares_a_tuner_within_a_transponder():
+    scheduler = TunerScheduler(tuners=2, busy=[("Astra", "10700 H 27500")])
+    assert scheduler.admit({"satname": "Astra", "FQ": "10700 h 27500"})
+    assert scheduler.admit({"satname": "Astra", "FQ": 11000})
+    assert scheduler.admit({"satname": "Astra", "FQ": "11000"})
+    assert not scheduler.admit({"satname": "Hotbird", "FQ": 11000})
+
+
+def test_by_distance():
+    assert by_distance(5, 5, 100) == [5, 6, 4, 7, 3]
+    assert by_distance(0, 4, 3) == [0, 1, 2]
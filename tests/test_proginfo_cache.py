@@ -0,0 +1,71 @@
+import threading
+
+from proginfo_cache import ProgInfoCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def info(service_id):
+    return {"servicename": f"Service {service_id}", "satname": "Astra", "FQ": 11494, "PID": "0/0",
+            "intensity": "80%", "quality": "70%", "rev_rate": "1Mbps", "send_rate": "1Mbps"}
+
+
+def test_static_lookups_outlive_stale_signal_readings():
+    clock = Clock()
+    fetched = []
+    cache = ProgInfoCache(lambda service_id: fetched.append(service_id) or info(service_id), clock=clock)
+    cache.get(1)
+    clock.now = 5.0
+    # The readings are stale but the tuning data is not
+    cache.get(1, volatile=False)
+    assert fetched == [1]
+    cache.get(1)
+    assert fetched == [1, 1]
+    clock.now = 6.0
+    cache.get(1)
+    assert fetched == [1, 1]
+    clock.now = 700.0
+    cache.get(1, volatile=False)
+    assert fetched == [1, 1, 1]
+
+
+def test_put_only_refreshes_the_groups_it_carries():
+    clock = Clock()
+    cache = ProgInfoCache(info, clock=clock)
+    cache.put(1, {"intensity": "90%", "quality": "60%", "rev_rate": "2Mbps", "send_rate": "2Mbps"})
+    # Signal readings alone are not enough to answer a lookup
+    assert cache.peek(1) is None
+    cache.get(1, volatile=False)
+    clock.now = 700.0
+    cache.put(1, {"intensity": "10%", "quality": "5%", "rev_rate": "0", "send_rate": "0"})
+    assert cache.peek(1)["intensity"] == "10%"
+    assert cache.peek(1, max_age=cache.static_ttl) is None
+
+
+def test_concurrent_lookups_share_one_request():
+    release = threading.Event()
+    fetched = []
+
+    def fetch(service_id):
+        fetched.append(service_id)
+        release.wait(5)
+        return info(service_id)
+
+    cache = ProgInfoCache(fetch)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(3))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while cache.coalesced < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert fetched == [3]
+    assert len(results) == 4 and all(result == info(3) for result in results)
@@ -0,0 +1,71 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from recorder import TS_PACKET, Recording
+
+
+def packets(count):
+    return b"".join(b"\x47\x01\x00" + bytes([0x10 | n % 16]) + bytes([n % 256]) * (TS_PACKET - 4)
+                    for n in range(count))
+
+
+@pytest.fixture
+def source():
+    """ A one-shot HTTP stream: `serve(payload, hold)` sends `payload`, then keeps the connection
+    open until `hold` is set, if given. Returns the URL. """
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+
+    def serve(payload, hold=None):
+        def run():
+            conn, _ = listener.accept()
+            with conn:
+                conn.recv(4096)
+                conn.sendall(b"HTTP/1.0 200 OK\r\nContent-Type: video/mp2t\r\n\r\n" + payload)
+                if hold:
+                    hold.wait(10)
+
+        threading.Thread(target=run, daemon=True).start()
+        return f"http://127.0.0.1:{listener.getsockname()[1]}/stream"
+
+    yield serve
+    listener.close()
+
+
+def test_segments_never_exceed_their_size(source, tmp_path):
+    payload = packets(1000)
+    # 100 bytes short of a packet are left at the end of each segment
+    segment_size = TS_PACKET * 50 + 100
+    recording = Recording("test", source(payload), str(tmp_path), buffer_size=TS_PACKET * 200,
+                          segment_size=segment_size).start()
+    recording.thread.join(10)
+    assert recording.error is None
+    sizes = [os.path.getsize(path) for path in recording.stats.segments]
+    assert sizes == [TS_PACKET * 50] * 20
+    assert b"".join(open(path, "rb").read() for path in recording.stats.segments) == payload
+
+
+def test_low_bitrate_reaches_disk_within_a_second(source, tmp_path):
+    hold = threading.Event()
+    payload = packets(10)
+    # A stray partial packet stays in the buffer
+    recording = Recording("test", source(payload + b"\x47\x01", hold), str(tmp_path),
+                          segment_size=64 * 1024 * 1024, flush_interval=0.2).start()
+    try:
+        deadline = time.monotonic() + 3
+        while time.monotonic() < deadline and not recording.stats.bytes_written:
+            time.sleep(0.05)
+        path = recording.stats.segments[0]
+        with open(path, "rb") as segment:
+            assert segment.read(len(payload)) == payload
+        # Preallocated a step ahead only, not the whole segment
+        assert os.path.getsize(path) < 64 * 1024 * 1024
+    finally:
+        hold.set()
+        recording.stop()
+    assert os.path.getsize(path) == len(payload)
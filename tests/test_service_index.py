@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from catalog_cache import diff_catalogs
+from service_index import ServiceIndex, rows_matching
+from service_store import ServiceStore
+
+WORDS = ["news", "sport", "movie", "kids", "hd", "bbc", "cnn", "vtv", "world", "24"]
+
+
+def catalog(count, seed=0):
+    rng = random.Random(seed)
+    return [{"id": n, "servicename": ("$" if rng.random() < 0.3 else "")
+             + " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))).title() + f" {n}",
+             "url": f"http://h/{n}"} for n in range(count)]
+
+
+def proginfo(service_id):
+    return {"satname": ["Astra 19.2E", "Hotbird 13E", "Eutelsat 7E"][service_id % 3],
+            "FQ": f"{10700 + service_id % 7 * 100} {'HV'[service_id % 2]} 27500"}
+
+
+def brute_force(services, infos, text):
+    """ What `query` should return, by checking every service. """
+    terms = text.lower().split()
+    if not terms:
+        return None
+    found = set()
+    for s in services:
+        name, info = s["servicename"].lower(), infos.get(s["id"])
+        if all((name.startswith("$") if term == "$" else
+                not name.startswith("$") if term == "-$" else
+                info is not None and info["satname"].lower().startswith(term[4:]) if term.startswith("sat:") else
+                info is not None and info["FQ"].lower().startswith(term[3:]) if term.startswith("fq:") else
+                term in name) for term in terms):
+            found.add(s["id"])
+    return found
+
+
+@pytest.fixture
+def indexed():
+    services = catalog(2000)
+    index = ServiceIndex()
+    index.extend(services)
+    infos = {s["id"]: proginfo(s["id"]) for s in services[::2]}
+    for service_id, info in infos.items():
+        index.set_proginfo(service_id, info)
+    return index, services, infos
+
+
+QUERIES = ["", "bbc", "BBC news", "ne", "s", "$", "-$", "$ sport", "-$ hd 1", "sat:astra", "sat:hot kids",
+           "fq:107", "fq:10800 v", "sat:eutelsat fq:11", "world 24", "zzz", "news 1999"]
+
+
+@pytest.mark.parametrize("text", QUERIES)
+def test_query_matches_brute_force(indexed, text):
+    index, services, infos = indexed
+    assert index.query(text) == brute_force(services, infos, text)
+
+
+def test_typing_narrows_from_the_previous_result(indexed):
+    index, services, infos = indexed
+    for text in ("s", "sp", "spo", "sport", "sport ", "sport h", "sport hd", "sport h", "sport", "sat:a", "sat:as"):
+        assert index.query(text) == brute_force(services, infos, text), text
+
+
+def test_index_follows_catalog_changes(indexed):
+    index, services, infos = indexed
+    index.query("news")
+    new = [dict(s, servicename=s["servicename"] + " News") if s["id"] % 5 == 0 else s
+           for s in services if s["id"] % 7]
+    index.apply_diff(diff_catalogs(services, new))
+    infos = {service_id: info for service_id, info in infos.items() if service_id % 7}
+    assert len(index) == len(new)
+    for text in ("news", "sat:astra", "$ news", "hd"):
+        assert index.query(text) == brute_force(new, infos, text), text
+
+
+def test_rows_matching_keeps_catalog_order(indexed):
+    index, services, _ = indexed
+    store = ServiceStore(services)
+    assert rows_matching(index.query(""), store) is None
+    rows = rows_matching(index.query("bbc"), store)
+    assert rows == sorted(rows) and [store.ids[row] for row in rows] == sorted(index.query("bbc"))
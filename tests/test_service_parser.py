@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from service_parser import ServicePageParser, parse
+
+
+def body(services, **fields):
+    return json.dumps(dict(fields, services=services), ensure_ascii=False).encode()
+
+
+SERVICES = [{"id": n, "servicename": name, "url": f"http://192.168.1.10:81/stream/{n}"}
+            for n, name in enumerate(["ARD", "Ünïcödé}", 'quote " and }', "$Pay TV", "日本語", "a\\b"] * 5, 1)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1000, 1 << 20])
+def test_any_chunking_gives_the_same_catalog(chunk_size):
+    store, fields = parse(body(SERVICES, count=30, pagetotal=1), chunk_size)
+    assert store.to_list() == SERVICES
+    assert fields == {"count": 30, "pagetotal": 1, "services": store}
+
+
+def test_fields_after_the_services_and_whitespace():
+    data = b' {\n "services" : [ ' + b" , ".join(json.dumps(s).encode() for s in SERVICES[:3]) + b' ] ,\n"count": 3 }\n'
+    for chunk_size in (1, 5, len(data)):
+        store, fields = parse(data, chunk_size)
+        assert store.to_list() == SERVICES[:3]
+        assert fields == {"count": 3, "services": store}
+
+
+def test_string_ids_are_accepted():
+    services = [dict(service, id=str(service["id"])) for service in SERVICES[:4]]
+    store, _ = parse(body(services), 16)
+    assert list(store.ids) == [1, 2, 3, 4]
+
+
+def test_pages_share_one_store():
+    parser = ServicePageParser()
+    for page in (SERVICES[:10], SERVICES[10:]):
+        ServicePageParser(parser.store).feed(body(page))
+    assert parser.store.to_list() == SERVICES
+
+
+@pytest.mark.parametrize("data", [
+    b'{"services": [{"id": 1, "servicename": "A", "url": "http://h/1"}',
+    b'{"services": [{"id": 1, "servicename": "A"}]}',
+    b'[1, 2]',
+    b'{"services": []} trailing',
+])
+def test_malformed_bodies_raise_value_error(data):
+    with pytest.raises(ValueError):
+        parse(data, 7)
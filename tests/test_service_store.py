@@ -0,0 +1,64 @@
+from array import array
+
+from service_store import ServiceStore, numeric_id, split_url
+
+
+def service(service_id, name=None, url=None):
+    return {"id": service_id, "servicename": name or f"Service {service_id}",
+            "url": url or f"http://192.168.1.10:81/stream/{service_id}"}
+
+
+def test_split_url_gives_the_url_back():
+    for url in ("http://h:81/stream/12", "http://h/?id=5", "http://h/watch?v", "plain"):
+        prefix, tail = split_url(url)
+        assert prefix + tail == url
+
+
+def test_rows_come_back_as_they_went_in():
+    services = [service(n) for n in range(1, 6)] + [service(9, "$Scrambled", "rtsp://other/9")]
+    store = ServiceStore(services)
+    assert store.to_list() == services
+    assert list(store.scrambled) == [0] * 5 + [1]
+    assert store.by_id(9) == services[-1]
+    assert store.rows_of({2, 9, 42}) == [1, 5]
+
+
+def test_numeric_string_ids_are_stored_as_ints():
+    assert [numeric_id(value) for value in ("12", "-3", "012", " 12", "abc", 7)] == [12, -3, "012", " 12", "abc", 7]
+    store = ServiceStore([service("12"), service(13)])
+    assert isinstance(store.ids, array)
+    assert list(store.ids) == [12, 13]
+    assert store.row_of("12") == store.row_of(12) == 0
+
+
+def test_other_ids_fall_back_to_a_list():
+    store = ServiceStore([service(1), service(2)])
+    store.row_of(1)
+    store.extend([service(3), service("a-b"), service(2 ** 70)])
+    assert store.ids == [1, 2, 3, "a-b", 2 ** 70]
+    assert store.by_id("a-b") == service("a-b")
+    store.insert(0, service("7"))
+    store.append("x", "X", "http://192.168.1.10:81/stream/x")
+    assert store.ids == [7, 1, 2, 3, "a-b", 2 ** 70, "x"]
+    copy = ServiceStore()
+    copy.extend(store)
+    assert copy.to_list() == store.to_list()
+    assert copy.row_of("x") == 6
+
+
+def test_rows_of_matches_both_strategies():
+    store = ServiceStore([service(n) for n in range(100)])
+    # A few ids go through the index, many through a scan
+    assert store.rows_of({5, 50, 500}) == [5, 50]
+    assert store.rows_of(set(range(0, 100, 2))) == list(range(0, 100, 2))
+
+
+def test_apply_diff():
+    from catalog_cache import diff_catalogs
+
+    old = ServiceStore([service(n) for n in range(10)])
+    new = [service(n) for n in (0, 1, 3, 2, 4, 5, 11, 6, 7, 9)]
+    new[5] = service(5, "Renamed")
+    old.apply_diff(diff_catalogs(old, new))
+    assert old.to_list() == new
+    assert old.row_of(11) == 6
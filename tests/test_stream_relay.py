@@ -0,0 +1,113 @@
+import asyncio
+import socket
+import struct
+from urllib.parse import quote, urlsplit
+
+from stream_relay import TS_PACKET, RingBuffer, StreamRelay
+
+
+def numbered_packets(first, count):
+    """ TS packets on PID 0x100 carrying their own sequence number. """
+    return b"".join(b"\x47\x01\x00\x10" + struct.pack(">Q", n) + b"\xff" * (TS_PACKET - 12)
+                    for n in range(first, first + count))
+
+
+async def numbered_source(reader, writer):
+    await reader.readuntil(b"\r\n\r\n")
+    writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: video/mp2t\r\n\r\n")
+    sent = 0
+    try:
+        while True:
+            writer.write(numbered_packets(sent, 512))
+            sent += 512
+            await writer.drain()
+            await asyncio.sleep(0.005)
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+def test_ring_buffer_wraps():
+    ring = RingBuffer(10)
+    ring.write(b"abcdefgh")
+    ring.write(b"ijkl")
+    assert ring.oldest() == 2
+    assert b"".join(ring.read(2, 100)) == b"cdefghijkl"
+    assert [bytes(view) for view in ring.read(6, 4)] == [b"ghij"]
+
+
+async def stall_then_read(relay, upstream, stall):
+    sock = socket.socket()
+    # Small buffers, so a stalled client backs up into the relay's transport
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, (relay.host, relay.port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    relayed = urlsplit(relay.url_for(upstream))
+    writer.write(f"GET {relayed.path}?{relayed.query} HTTP/1.0\r\n\r\n".encode())
+    await reader.readuntil(b"\r\n\r\n")
+    received = bytearray(await reader.readexactly(TS_PACKET * 10))
+    await asyncio.sleep(stall)
+    try:
+        while True:
+            data = await asyncio.wait_for(reader.read(1 << 20), 5)
+            if not data:
+                break
+            received += data
+    except ConnectionError:
+        pass
+    writer.close()
+    return received
+
+
+def test_slow_client_never_receives_overwritten_bytes():
+    async def run():
+        source = await asyncio.start_server(numbered_source, "127.0.0.1", 0)
+        upstream = f"http://127.0.0.1:{source.sockets[0].getsockname()[1]}/stream"
+        relay = StreamRelay(buffer_size=TS_PACKET * 2048, backlog=TS_PACKET * 64, timeout=2.0)
+        await relay.serve()
+        try:
+            received = await stall_then_read(relay, upstream, stall=0.5)
+        finally:
+            relay.server.close()
+            for channel in list(relay.channels.values()):
+                channel.close()
+            await asyncio.sleep(0.05)
+            source.close()
+        return relay, received
+
+    relay, received = asyncio.run(run())
+    assert relay.dropped == 1
+    usable = len(received) - len(received) % TS_PACKET
+    numbers = [struct.unpack_from(">Q", received, offset + 4)[0] for offset in range(0, usable, TS_PACKET)]
+    assert all(received[offset] == 0x47 for offset in range(0, usable, TS_PACKET))
+    # Everything up to the drop is the source's stream, in order and without gaps
+    assert numbers == list(range(numbers[0], numbers[0] + len(numbers)))
+
+
+def test_only_registered_sources_are_relayed():
+    async def request(relay, upstream):
+        reader, writer = await asyncio.open_connection(relay.host, relay.port)
+        writer.write(f"GET /relay?src={quote(upstream, safe='')} HTTP/1.0\r\n\r\n".encode())
+        status = await reader.readline()
+        writer.close()
+        return status.split()[1]
+
+    async def run():
+        relay = StreamRelay(timeout=2.0, allowed_hosts=["192.0.2.10:8080"])
+        await relay.serve()
+        try:
+            refused = await request(relay, "http://203.0.113.5/secret")
+            channels_after_refusal = len(relay.channels)
+            relay.url_for("http://127.0.0.1:9/stream")
+            assert relay.allows("http://127.0.0.1:9/stream")
+            assert relay.allows("http://192.0.2.10:8080/?id_1_2_3")
+            assert not relay.allows("http://192.0.2.10:81/getallservices")
+        finally:
+            relay.server.close()
+        return refused, channels_after_refusal
+
+    refused, channels = asyncio.run(run())
+    assert refused == b"404"
+    assert channels == 0
@@ -0,0 +1,69 @@
+import numpy as np
+
+from ts_analyzer import TS_PACKET, TsAnalyzer, diagnosis
+
+
+def packet(pid, cc, tei=False, discontinuity=False):
+    header = bytes([0x47, (0x80 if tei else 0) | pid >> 8, pid & 0xFF])
+    if discontinuity:
+        # Adaptation field with just the flags byte, then payload
+        return header + bytes([0x30 | cc, 1, 0x80]) + b"\xff" * (TS_PACKET - 6)
+    return header + bytes([0x10 | cc]) + b"\xff" * (TS_PACKET - 4)
+
+
+def stream(count, pid=0x100, dropped=(), tei=(), discontinuity=()):
+    """ `count` packets with consecutive counters, minus `dropped`, with TEI set on `tei`. """
+    return b"".join(packet(pid, n % 16, n in tei, n in discontinuity) for n in range(count) if n not in dropped)
+
+
+def analyze(data, chunk=None):
+    analyzer = TsAnalyzer()
+    chunk = chunk or len(data)
+    for start in range(0, len(data), chunk):
+        analyzer.feed(data[start:start + chunk])
+    return analyzer.report()
+
+
+def test_dropped_packets_are_network_loss():
+    report = analyze(stream(200, dropped=(10, 50, 90, 130, 170)))
+    assert (report["cc_errors"], report["tei"]) == (5, 0)
+    assert diagnosis(report).startswith("Network")
+
+
+def test_tei_packets_are_not_counted_as_gaps():
+    report = analyze(stream(200, tei=(20, 21, 100)))
+    assert (report["cc_errors"], report["tei"]) == (0, 3)
+    assert diagnosis(report).startswith("Signal")
+
+
+def test_dropped_and_tei_packets_are_told_apart():
+    data = stream(200, dropped=(10, 50, 90, 130, 170), tei=(30, 31, 199))
+    for chunk in (None, TS_PACKET * 7, TS_PACKET * 31 + 5, 1000):
+        report = analyze(data, chunk)
+        assert (report["cc_errors"], report["tei"]) == (5, 3), chunk
+
+
+def test_tei_at_the_end_of_a_chunk_resyncs_the_next_one():
+    analyzer = TsAnalyzer()
+    analyzer.feed(stream(10, tei=(9,)))
+    # Carries on with a counter the TEI packet would have made look like a gap
+    analyzer.feed(b"".join(packet(0x100, cc) for cc in (5, 6, 7, 8, 9)))
+    assert analyzer.report()["cc_errors"] == 0
+
+
+def test_duplicates_and_discontinuities_are_legal():
+    counters = [0, 1, 2, 2, 3, 4]
+    data = b"".join(packet(0x100, cc) for cc in counters)
+    # The counter jumps where the discontinuity indicator says it may
+    data += packet(0x100, 11, discontinuity=True) + packet(0x100, 12)
+    report = analyze(data)
+    assert report["cc_errors"] == 0
+
+
+def test_pids_are_checked_independently():
+    a, b = stream(64, pid=0x100), stream(64, pid=0x200, dropped=(7,))
+    data = np.frombuffer(a, np.uint8).reshape(-1, TS_PACKET)
+    other = np.frombuffer(b, np.uint8).reshape(-1, TS_PACKET)
+    mixed = np.concatenate([data[:len(other)], other], axis=1).reshape(-1, TS_PACKET).tobytes() + data[len(other):].tobytes()
+    report = analyze(mixed, TS_PACKET * 10)
+    assert {entry["pid"]: entry["cc_errors"] for entry in report["pids"]} == {0x100: 0, 0x200: 1}
@@ -0,0 +1,378 @@
+""" Preview pictures for the service list, grabbed in background processes.
+
+Each free-to-air service gets a small PNG of its first key frame. Scrambled
+services ("$" names) are skipped, since they would only show a black
+picture. The grabbing happens in worker processes, each with its own
+headless libvlc instance (no window, no audio). libvlc's scene filter writes
+the picture there, and only key frames are decoded. Decoding therefore
+never competes with the GUI thread for the GIL, and a stream that hangs
+libvlc only hangs a worker.
+
+The receiver limits what can run at the same time:
+
+- At most `PREVIEW_STREAMS` previews stream at once (GTMEDIA_PREVIEW_STREAMS,
+  default 1).
+- A preview must fit on the tuners next to the service being watched, the
+  recordings and the mosaic, see `mosaic.TunerScheduler`. With one tuner, that means
+  only services on the watched transponder get a preview while something
+  plays.
+
+Pictures are stored in `ThumbnailCache`, which is bounded in bytes and
+evicts the oldest file first. A picture older than `max_age` is still
+shown, and a new one is grabbed to replace it. The lists ask for a picture
+only when they paint its row, and the queue keeps only the most recently
+asked-for services, so scrolling past rows costs nothing.
+
+Run as a script to grab previews from a receiver and report the rate:
+
+    GTMEDIA_PREVIEW_STREAMS=2 python thumbnails.py 192.168.1.10 --count 20
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from catalog_cache import default_cache_dir
+from mosaic import DEFAULT_TUNERS, TunerScheduler, transponder_of
+from stb_client import STBError
+from telemetry import metrics
+
+PREVIEW_STREAMS = int(os.environ.get("GTMEDIA_PREVIEW_STREAMS", 1))
+THUMBNAIL_WIDTH = 160
+SNAPSHOT_TIMEOUT = 10.0
+# Services still waiting for a preview; older requests are dropped first
+MAX_QUEUED = 64
+# A service whose preview failed is not tried again for this long, in seconds
+RETRY_AFTER = 300
+# At most this many uncached /proginfo lookups while picking the next preview
+MAX_LOOKUPS = 4
+# One worker streams one service at a time; the scene filter writes every
+# decoded picture to the same file, and only key frames are decoded
+WORKER_ARGS = ("--intf=dummy", "--vout=dummy", "--aout=dummy", "--no-audio", "--verbose=0",
+               "--video-filter=scene", "--scene-format=png", "--scene-ratio=1", "--scene-replace",
+               "--scene-prefix=preview", f"--scene-width={THUMBNAIL_WIDTH}")
+MEDIA_OPTIONS = (":no-audio", ":avcodec-skip-frame=3", ":avcodec-lowres=1", ":network-caching=500")
+
+_worker = None
+
+
+def _start_worker():
+    global _worker
+    import vlc
+
+    directory = tempfile.mkdtemp(prefix="gtmedia-preview-")
+    instance = vlc.Instance(*WORKER_ARGS, f"--scene-path={directory}")
+    if instance is None:
+        raise RuntimeError("libvlc failed to initialize")
+    _worker = (instance, os.path.join(directory, "preview.png"))
+
+
+def grab(url, timeout=SNAPSHOT_TIMEOUT):
+    """ In a worker process: PNG bytes of the first key frame of `url`, None if none came in time. """
+    instance, path = _worker
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+    player = instance.media_player_new()
+    media = instance.media_new(url, *MEDIA_OPTIONS)
+    player.set_media(media)
+    player.play()
+    try:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            if os.path.exists(path):
+                # Give the filter time to finish writing the file
+                time.sleep(0.2)
+                with open(path, "rb") as f:
+                    return f.read()
+        return None
+    finally:
+        player.stop()
+        player.release()
+        media.release()
+
+
+class ThumbnailCache:
+    """ PNG files under `directory`, at most `max_bytes` in total, refreshed after `max_age` seconds. """
+
+    def __init__(self, directory=None, max_bytes=32 * 2 ** 20, max_age=30 * 60):
+        self.directory = directory or os.path.join(default_cache_dir(), "thumbnails")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        # key -> (size, modification time), oldest first
+        self.entries = OrderedDict()
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".png") and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for mtime, key, size in sorted(files):
+            self.entries[key] = (size, mtime)
+        self.total = sum(size for size, _ in self.entries.values())
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def lookup(self, key):
+        """ (path or None, whether a new picture should be grabbed). """
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None, True
+        return self.path(key), time.time() - entry[1] >= self.max_age
+
+    def put(self, key, data):
+        path = self.path(key)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            self.total += len(data) - (previous[0] if previous else 0)
+            self.entries[key] = (len(data), time.time())
+            evicted = []
+            while self.total > self.max_bytes and len(self.entries) > 1:
+                old_key, (size, _) = self.entries.popitem(last=False)
+                self.total -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            with contextlib.suppress(OSError):
+                os.remove(self.path(old_key))
+        return path
+
+    def __str__(self):
+        return f"{len(self.entries)} thumbnails, {self.total / 2 ** 20:.1f} of {self.max_bytes / 2 ** 20:.1f} MiB"
+
+
+class PreviewStats:
+    """ Snapshot rate and cache hit rate of a `PreviewPipeline`. """
+
+    def __init__(self):
+        self.grabbed = deque()
+        self.total = 0
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.failed = 0
+        self.deferred = 0
+
+    def record_grab(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.grabbed.append(now)
+        self.total += 1
+        while self.grabbed and now - self.grabbed[0] > 60:
+            self.grabbed.popleft()
+
+    def per_minute(self, now=None):
+        now = time.monotonic() if now is None else now
+        return sum(1 for at in self.grabbed if now - at <= 60)
+
+    def hit_rate(self):
+        lookups = self.hits + self.stale + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self):
+        lookups = self.hits + self.stale + self.misses
+        return (f"{self.per_minute()} snapshots/min, cache hit rate {self.hit_rate() * 100:.0f}% "
+                f"({self.hits} of {lookups}, {self.stale} refreshed), {self.failed} failed, "
+                f"{self.deferred} waiting for a tuner")
+
+
+class PreviewPipeline:
+    """ Grabs previews of the services the lists ask for, a few at a time.
+
+    `on_ready(service_id)` is called from a background thread once a new
+    picture is in `cache`. `busy()` returns the transponders in use by
+    playback, recordings and the mosaic.
+    """
+
+    def __init__(self, client, cache, on_ready, busy=lambda: (), streams=PREVIEW_STREAMS, tuners=DEFAULT_TUNERS):
+        self.client = client
+        self.cache = cache
+        self.on_ready = on_ready
+        self.busy = busy
+        self.streams = streams
+        self.tuners = tuners
+        self.stats = PreviewStats()
+        self.queue = OrderedDict()
+        self.seen = set()
+        self.failed = {}
+        self.running = {}
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.pool = ProcessPoolExecutor(streams, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_start_worker)
+        self.thread = threading.Thread(target=self._dispatch, name="preview-dispatch", daemon=True)
+        self.thread.start()
+
+    def set_client(self, client):
+        """ Preview services of another receiver from now on. """
+        with self.condition:
+            self.client = client
+            self.queue.clear()
+            self.seen.clear()
+            self.failed.clear()
+
+    def key(self, service_id):
+        return f"{self.client.ip_address}_{service_id}"
+
+    def request(self, service_id, url):
+        """ The cached picture of a service, if any; queues a new one if it has none or it is old. """
+        path, refresh = self.cache.lookup(self.key(service_id))
+        with self.condition:
+            if service_id not in self.seen:
+                self.seen.add(service_id)
+                if path is None:
+                    self.stats.misses += 1
+                elif refresh:
+                    self.stats.stale += 1
+                else:
+                    self.stats.hits += 1
+            failed_at = self.failed.get(service_id)
+            if failed_at is not None and time.monotonic() - failed_at < RETRY_AFTER:
+                refresh = False
+            if refresh and service_id not in self.running:
+                self.queue[service_id] = url
+                self.queue.move_to_end(service_id)
+                while len(self.queue) > MAX_QUEUED:
+                    self.queue.popitem(last=False)
+                self.condition.notify()
+        return path
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.queue.clear()
+            self.condition.notify()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _next(self):
+        """ The most recently asked-for service that fits on the tuners, as (id, url, transponder). """
+        with self.condition:
+            waiting = list(reversed(self.queue.items()))
+            running = set(self.running.values())
+        scheduler = TunerScheduler(self.tuners, busy=set(self.busy()) | running)
+        proginfo_cache = self.client.proginfo_cache
+        lookups = 0
+        for service_id, url in waiting:
+            # Services whose tuning data is cached cost no request; the rest
+            # wait for a later pass once a few lookups have been spent
+            info = proginfo_cache.peek(service_id, max_age=proginfo_cache.static_ttl)
+            if info is None:
+                if lookups >= MAX_LOOKUPS:
+                    continue
+                lookups += 1
+                try:
+                    info = self.client.cached_proginfo(service_id, volatile=False)
+                except STBError as e:
+                    print(f"Preview: no program info for service {service_id}: {e}")
+                    with self.condition:
+                        self.queue.pop(service_id, None)
+                    continue
+            if scheduler.admit(info):
+                with self.condition:
+                    if self.queue.pop(service_id, None) is None:
+                        continue
+                return service_id, url, transponder_of(info)
+        return None
+
+    def _dispatch(self):
+        while True:
+            with self.condition:
+                while not self.stopping and (not self.queue or len(self.running) >= self.streams):
+                    self.condition.wait()
+                if self.stopping:
+                    return
+            chosen = self._next()
+            if chosen is None:
+                # Nothing fits on the tuners now; try again once something changes
+                with self.condition:
+                    self.stats.deferred = len(self.queue)
+                    self.condition.wait(timeout=5)
+                continue
+            service_id, url, transponder = chosen
+            with self.condition:
+                if self.stopping:
+                    return
+                self.running[service_id] = transponder
+                self.stats.deferred = 0
+            started = time.perf_counter()
+            try:
+                future = self.pool.submit(grab, url)
+            except (BrokenProcessPool, RuntimeError) as e:
+                # RuntimeError: the pool was shut down by `stop` meanwhile
+                if not self.stopping:
+                    print(f"Previews stopped: {e}")
+                return
+            future.add_done_callback(lambda future, service_id=service_id: self._done(service_id, started, future))
+
+    def _done(self, service_id, started, future):
+        with self.condition:
+            self.running.pop(service_id, None)
+            self.condition.notify()
+        if future.cancelled():
+            # Dropped by `stop`, not a failed grab
+            return
+        elapsed = time.perf_counter() - started
+        try:
+            data = future.result()
+        except BrokenProcessPool as e:
+            print(f"Previews stopped, the worker process failed: {e}")
+            self.stop()
+            return
+        except Exception as e:
+            data = None
+            print(f"Preview of service {service_id} failed: {e}")
+        if not data:
+            with self.condition:
+                self.failed[service_id] = time.monotonic()
+            self.stats.failed += 1
+            metrics.observe("preview_seconds", elapsed, outcome="failed")
+            return
+        self.cache.put(self.key(service_id), data)
+        self.stats.record_grab()
+        metrics.observe("preview_seconds", elapsed, outcome="ok")
+        self.on_ready(service_id)
+
+
+def benchmark(ip_address, count=20, streams=PREVIEW_STREAMS, cache_dir=None):
+    """ Grab previews of the first `count` free-to-air services and report the rate. """
+    from catalog_loader import CatalogLoader
+    from stb_client import get_client
+
+    client = get_client(ip_address)
+    services = [service for service in CatalogLoader(client).load() if not service["servicename"].startswith("$")]
+    cache = ThumbnailCache(cache_dir)
+    pipeline = PreviewPipeline(client, cache, on_ready=lambda service_id: None, streams=streams)
+    started = time.perf_counter()
+    # Queued newest first, so request them in reverse to grab in catalog order
+    for service in reversed(services[:count]):
+        pipeline.request(service["id"], service["url"])
+    deadline = started + count * SNAPSHOT_TIMEOUT
+    while (pipeline.queue or pipeline.running) and time.perf_counter() < deadline:
+        time.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    pipeline.stop()
+    grabbed = pipeline.stats.total
+    print(f"{grabbed} previews in {elapsed:.1f} s ({grabbed / elapsed * 60:.0f}/min) with {streams} stream(s)")
+    print(f"{pipeline.stats}; {cache}")
+    return pipeline.stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grab service previews and report the rate.")
+    parser.add_argument("ip_address")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--streams", type=int, default=PREVIEW_STREAMS)
+    parser.add_argument("--cache-dir", help="default: the application's thumbnail cache")
+    args = parser.parse_args()
+    benchmark(args.ip_address, args.count, args.streams, args.cache_dir)
@@ -0,0 +1,289 @@
+""" Virtualized service list for the Tk front end.
+
+Only the rows that fit in the canvas exist as canvas items; scrolling just
+moves the window over the `ServiceStore` and re-labels that small pool of
+items. Same budget as the Qt list on 20k services: under 50 ms to fill and
+under 16 ms per scrolled page. Check it with:
+
+    python tk_service_list.py --services 20000
+
+With previews on, `PreviewImages` loads a row's picture from the thumbnail
+cache only when the row is drawn.
+"""
+import argparse
+import bisect
+import math
+import time
+import tkinter as tk
+import tkinter.font as tkfont
+from collections import OrderedDict
+
+from service_store import ServiceStore
+
+PREVIEW_WIDTH, PREVIEW_HEIGHT = 80, 45
+
+
+class VirtualServiceList(tk.Frame):
+    def __init__(self, master, on_select=None, on_activate=None, width=200,
+                 font=("TkDefaultFont", 12, "normal"), **kwargs):
+        super().__init__(master, **kwargs)
+        self.on_select = on_select
+        self.on_activate = on_activate
+        self.store = ServiceStore()
+        self.font = tkfont.Font(self, font=font)
+        self.selected_font = tkfont.Font(self, font=font)
+        self.selected_font.configure(weight="bold")
+        self.row_height = self.font.metrics("linespace") + 6
+        self.previews = None
+        self.offset = 0
+        self.selected = None
+        self.filter_rows = None
+        self.rows = []
+        self.redraw_pending = False
+
+        self.canvas = tk.Canvas(self, width=width, highlightthickness=0, bg=self.cget("bg"))
+        self.scrollbar_y = tk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar_y.pack(side="right", fill="y")
+
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Double-Button-1>", self._on_double_click)
+        self.canvas.bind("<MouseWheel>", self._on_mousewheel)
+        self.canvas.bind("<Button-4>", self._on_mousewheel)  # Linux specific
+        self.canvas.bind("<Button-5>", self._on_mousewheel)  # Linux specific
+
+    def __len__(self):
+        return len(self.store) if self.filter_rows is None else len(self.filter_rows)
+
+    def store_row(self, row):
+        return row if self.filter_rows is None else self.filter_rows[row]
+
+    def service(self, row):
+        return self.store.service(self.store_row(row))
+
+    def selected_service(self):
+        return None if self.selected is None else self.store.service(self.selected)
+
+    def neighbours(self, service_id, count=2):
+        """ Services up to `count` rows above and below `service_id`. """
+        row = self.store.row_of(service_id)
+        if row is not None and self.filter_rows is not None:
+            position = bisect.bisect_left(self.filter_rows, row)
+            row = position if position < len(self.filter_rows) and self.filter_rows[position] == row else None
+        if row is None:
+            return []
+        return [self.service(other) for other in range(max(0, row - count), min(len(self), row + count + 1)) if other != row]
+
+    def clear(self):
+        self.store.clear()
+        self.selected = None
+        self.filter_rows = None
+        self.offset = 0
+        self.redraw()
+
+    def set_filter(self, rows):
+        """ Show only the given store rows (ascending), or everything for None. """
+        self.filter_rows = rows
+        self.offset = 0
+        self.redraw()
+
+    def append_services(self, services):
+        self.store.extend(services)
+        # Pages arriving back to back are painted once
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after_idle(self.redraw)
+
+    def apply_diff(self, diff):
+        selected_id = self.store.ids[self.selected] if self.selected is not None else None
+        self.store.apply_diff(diff)
+        self.selected = None if selected_id is None else self.store.row_of(selected_id)
+        # Store rows have moved; the owner re-applies its filter
+        self.filter_rows = None
+        self.redraw()
+
+    def set_previews(self, previews):
+        """ Show pictures from a `PreviewImages`, or none for None. """
+        self.previews = previews
+        text_height = self.font.metrics("linespace") + 6
+        self.row_height = max(text_height, PREVIEW_HEIGHT + 4) if previews else text_height
+        self.offset = 0
+        self.redraw()
+
+    def select(self, row):
+        self.selected = self.store_row(row)
+        self.see(row)
+        self.redraw()
+
+    def see(self, row):
+        top = row * self.row_height
+        height = self.canvas.winfo_height()
+        if top < self.offset:
+            self._scroll_to(top)
+        elif top + self.row_height > self.offset + height:
+            self._scroll_to(top + self.row_height - height)
+
+    def yview(self, *args):
+        height = max(self.canvas.winfo_height(), 1)
+        if args[0] == "moveto":
+            self._scroll_to(float(args[1]) * len(self) * self.row_height)
+        elif args[0] == "scroll":
+            step = height if args[2] == "pages" else self.row_height
+            self._scroll_to(self.offset + int(args[1]) * step)
+
+    def _scroll_to(self, offset):
+        limit = max(0, len(self) * self.row_height - self.canvas.winfo_height())
+        self.offset = int(min(max(offset, 0), limit))
+        self.redraw()
+
+    def _row_at(self, y):
+        row = int((self.offset + y) // self.row_height)
+        return row if 0 <= row < len(self) else None
+
+    def redraw(self):
+        self.redraw_pending = False
+        height = self.canvas.winfo_height()
+        width = self.canvas.winfo_width()
+        visible = height // self.row_height + 2
+        while len(self.rows) < visible:
+            background = self.canvas.create_rectangle(0, 0, 0, 0, width=0)
+            text = self.canvas.create_text(10, 0, anchor="nw", font=self.font)
+            image = self.canvas.create_image(4, 0, anchor="nw", state="hidden")
+            self.rows.append((background, text, image))
+
+        first = self.offset // self.row_height
+        count = len(self)
+        text_x = PREVIEW_WIDTH + 12 if self.previews else 10
+        for slot, (background, text, image) in enumerate(self.rows):
+            row = first + slot
+            if slot >= visible or row >= count:
+                self.canvas.itemconfigure(background, state="hidden")
+                self.canvas.itemconfigure(text, state="hidden")
+                self.canvas.itemconfigure(image, state="hidden")
+                continue
+            y = row * self.row_height - self.offset
+            row = self.store_row(row)
+            selected = row == self.selected
+            self.canvas.coords(background, 0, y, width, y + self.row_height)
+            self.canvas.itemconfigure(background, state="normal", fill="lightblue" if selected else self.canvas.cget("bg"))
+            picture = self.previews.image(row) if self.previews else None
+            if picture is None:
+                self.canvas.itemconfigure(image, state="hidden")
+            else:
+                self.canvas.coords(image, 4, y + 2)
+                self.canvas.itemconfigure(image, state="normal", image=picture)
+            self.canvas.coords(text, text_x, y + 3)
+            self.canvas.itemconfigure(text, state="normal", text=self.store.names[row],
+                                      fill="red" if self.store.scrambled[row] else "black",
+                                      font=self.selected_font if selected else self.font)
+
+        total = count * self.row_height
+        if total <= height:
+            self.scrollbar_y.set(0, 1)
+        else:
+            self.scrollbar_y.set(self.offset / total, (self.offset + height) / total)
+
+    def _on_click(self, event):
+        row = self._row_at(event.y)
+        if row is None:
+            return
+        self.select(row)
+        if self.on_select:
+            self.on_select(self.service(row))
+
+    def _on_double_click(self, event):
+        row = self._row_at(event.y)
+        if row is not None and self.on_activate:
+            self.on_activate(self.service(row))
+
+    def _on_mousewheel(self, event):
+        if event.num == 4:
+            units = -1
+        elif event.num == 5:
+            units = 1
+        else:
+            units = -1 * (event.delta // 120)
+        self._scroll_to(self.offset + units * 3 * self.row_height)
+
+
+class PreviewImages:
+    """ Preview pictures for a `VirtualServiceList`, read from disk as their rows are drawn.
+
+    `pipeline` is a `thumbnails.PreviewPipeline`; call `on_ready` in the
+    mainloop when it has a new picture. The last `max_loaded` pictures are
+    kept in memory.
+    """
+
+    def __init__(self, service_list, max_loaded=256):
+        self.service_list = service_list
+        self.pipeline = None
+        self.max_loaded = max_loaded
+        self.loaded = OrderedDict()
+
+    def image(self, row):
+        store = self.service_list.store
+        service_id = store.ids[row]
+        image = self.loaded.get(service_id)
+        if image is not None:
+            self.loaded.move_to_end(service_id)
+            return image
+        if store.scrambled[row] or self.pipeline is None:
+            return None
+        path = self.pipeline.request(service_id, store.url(row))
+        if path is None:
+            return None
+        try:
+            image = tk.PhotoImage(master=self.service_list, file=path)
+        except tk.TclError:
+            return None
+        # Tk only scales by whole factors
+        factor = max(math.ceil(image.width() / PREVIEW_WIDTH), math.ceil(image.height() / PREVIEW_HEIGHT), 1)
+        if factor > 1:
+            image = image.subsample(factor)
+        self.loaded[service_id] = image
+        if len(self.loaded) > self.max_loaded:
+            self.loaded.popitem(last=False)
+        return image
+
+    def on_ready(self, service_id):
+        self.loaded.pop(service_id, None)
+        if self.service_list.previews is self:
+            self.service_list.redraw()
+
+
+def benchmark(count=20000, page_size=100):
+    root = tk.Tk()
+    root.geometry("240x600")
+    service_list = VirtualServiceList(root)
+    service_list.pack(fill=tk.BOTH, expand=True)
+    root.update()
+    services = [{"id": i, "servicename": ("$" if i % 5 == 0 else "") + f"Service {i}",
+                 "url": f"http://192.168.1.10:8080/?id_{i}_101_102_0_0_0"} for i in range(count)]
+
+    started = time.perf_counter()
+    for first in range(0, count, page_size):
+        service_list.append_services(services[first:first + page_size])
+    root.update_idletasks()
+    fill = time.perf_counter() - started
+
+    frames = []
+    for _ in range(count * service_list.row_height // max(1, root.winfo_height())):
+        started = time.perf_counter()
+        service_list.yview("scroll", 1, "pages")
+        root.update_idletasks()
+        frames.append(time.perf_counter() - started)
+    frames.sort()
+    root.destroy()
+
+    print(f"{count} services: fill {fill * 1000:.1f} ms (budget 50 ms), "
+          f"scroll p50 {frames[len(frames) // 2] * 1000:.2f} ms / max {frames[-1] * 1000:.2f} ms "
+          f"over {len(frames)} pages (budget 16 ms)")
+    return fill, frames
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time filling and scrolling the virtualized Tk service list.")
+    parser.add_argument("--services", type=int, default=20000)
+    args = parser.parse_args()
+    benchmark(args.services)
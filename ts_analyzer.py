@@ -0,0 +1,324 @@
+""" MPEG-TS analysis: per-PID bitrate, continuity errors, TEI and PCR jitter.
+
+Tells RF problems from network problems: transport error indicators (TEI)
+are set by the receiver's demodulator when it could not correct a packet,
+while continuity-counter gaps with clean TEI mean packets were lost on the
+way to us. PCR jitter shows how evenly the stream arrives.
+
+The data is viewed as an (N, 188) NumPy array and every statistic is computed
+over whole chunks at once, so a single core keeps up with far more than a
+satellite transponder delivers. Analyze a captured file, or a live stream:
+
+    python ts_analyzer.py capture.ts
+    python ts_analyzer.py --url http://192.168.1.10:8080/?id_... --seconds 10
+"""
+import argparse
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+from recorder import RecordingError, open_stream
+
+TS_PACKET = 188
+SYNC_BYTE = 0x47
+NULL_PID = 0x1FFF
+PCR_HZ = 27_000_000
+PCR_WRAP = (1 << 33) * 300
+MAX_PCR_SAMPLES = 20000
+
+
+class TsAnalyzer:
+    """ Accumulates statistics over the chunks passed to `feed`. """
+
+    def __init__(self):
+        self.pending = b""
+        self.packets = 0
+        self.sync_losses = 0
+        self.counts = np.zeros(8192, np.int64)
+        self.cc_errors = np.zeros(8192, np.int64)
+        self.tei = np.zeros(8192, np.int64)
+        self.last_cc = np.full(8192, -1, np.int16)
+        # PID -> lists of (clock, pcr) arrays; clock is arrival time or packet index
+        self.pcr_samples = {}
+        self.pcr_last = {}
+        self.pcr_span = {}
+        self.started = None
+        self.last_time = None
+
+    def feed(self, data, arrivals=None):
+        """ Analyze `data`, a chunk of the stream.
+
+        For live streams `arrivals` lists `(end_offset, seconds)` per received
+        piece of the chunk, which times the PCR packets; files are timed by
+        packet position instead.
+        """
+        now = arrivals[-1][1] if arrivals else time.monotonic()
+        if self.started is None:
+            self.started = arrivals[0][1] if arrivals else now
+        self.last_time = now
+        shift = len(self.pending)
+        buffer = self.pending + bytes(data) if shift else data
+        raw = np.frombuffer(buffer, np.uint8)
+        offset = self._sync_offset(raw)
+        if offset is None:
+            self.pending = bytes(buffer[-TS_PACKET:])
+            return
+        usable = (len(raw) - offset) // TS_PACKET * TS_PACKET
+        self.pending = bytes(buffer[offset + usable:])
+        packets = raw[offset:offset + usable].reshape(-1, TS_PACKET)
+        kept = np.flatnonzero(packets[:, 0] == SYNC_BYTE)
+        if len(kept) < len(packets):
+            self.sync_losses += len(packets) - len(kept)
+            packets = packets[kept]
+        times = None
+        if arrivals:
+            ends, seconds = np.array(arrivals).T
+            # Each packet arrived with the piece that completed it
+            packet_ends = offset + (kept + 1) * TS_PACKET - shift
+            times = seconds[np.minimum(np.searchsorted(ends, packet_ends), len(seconds) - 1)]
+        self._analyze(packets, times)
+
+    def _sync_offset(self, raw):
+        # The first offset where a few consecutive packets start with the sync byte
+        for offset in np.flatnonzero(raw[:TS_PACKET] == SYNC_BYTE):
+            probe = raw[offset:offset + 5 * TS_PACKET:TS_PACKET]
+            if len(probe) and (probe == SYNC_BYTE).all():
+                if offset:
+                    self.sync_losses += 1
+                return int(offset)
+        return None
+
+    def _analyze(self, packets, times):
+        first_index = self.packets
+        self.packets += len(packets)
+        header = packets[:, 1:4].astype(np.int32)
+        pid = ((header[:, 0] & 0x1F) << 8) | header[:, 1]
+        self.counts += np.bincount(pid, minlength=8192)
+        tei = (header[:, 0] & 0x80) != 0
+        if tei.any():
+            self.tei += np.bincount(pid[tei], minlength=8192)
+
+        adaptation = (header[:, 2] & 0x20) != 0
+        adaptation_length = np.where(adaptation, packets[:, 4], 0)
+        flags = np.where(adaptation & (adaptation_length > 0), packets[:, 5], 0)
+        self._continuity(pid, header[:, 2], flags, tei)
+        self._pcr(packets, pid, flags, first_index, times)
+
+    def _continuity(self, pid, byte3, flags, tei):
+        # Only packets with payload advance the counter
+        counted = ((byte3 & 0x10) != 0) & (pid != NULL_PID)
+        pid, cc, discontinuity = pid[counted], byte3[counted] & 0x0F, (flags[counted] & 0x80) != 0
+        tei = tei[counted]
+        if not len(pid):
+            return
+        order = np.argsort(pid, kind="stable")
+        pid, cc, discontinuity, tei = pid[order], cc[order], discontinuity[order], tei[order]
+        group_start = np.empty(len(pid), bool)
+        group_start[0] = True
+        group_start[1:] = pid[1:] != pid[:-1]
+        previous = np.empty(len(pid), np.int16)
+        previous[1:] = np.where(tei[:-1], -1, cc[:-1])
+        previous[group_start] = self.last_cc[pid[group_start]]
+        # A TEI packet's counter is unreliable: it is not checked, and the next
+        # packet on its PID starts over instead of counting it as a gap
+        step = (cc - previous) & 0x0F
+        # A repeated counter is a legal duplicate packet
+        errors = (previous >= 0) & (step > 1) & ~discontinuity & ~tei
+        if errors.any():
+            self.cc_errors += np.bincount(pid[errors], minlength=8192)
+        group_end = np.empty(len(pid), bool)
+        group_end[-1] = True
+        group_end[:-1] = group_start[1:]
+        self.last_cc[pid[group_end]] = np.where(tei[group_end], -1, cc[group_end])
+
+    def _pcr(self, packets, pid, flags, first_index, times):
+        has_pcr = np.flatnonzero((flags & 0x10) != 0)
+        if not len(has_pcr):
+            return
+        fields = packets[has_pcr, 6:12].astype(np.int64)
+        base = (fields[:, 0] << 25) | (fields[:, 1] << 17) | (fields[:, 2] << 9) | (fields[:, 3] << 1) | (fields[:, 4] >> 7)
+        pcr = base * 300 + (((fields[:, 4] & 1) << 8) | fields[:, 5])
+        clock = times[has_pcr] if times is not None else (first_index + has_pcr).astype(np.float64)
+        for value in np.unique(pid[has_pcr]):
+            mine = pid[has_pcr] == value
+            samples = self.pcr_samples.setdefault(int(value), [[], []])
+            samples[0].append(clock[mine])
+            samples[1].append(pcr[mine])
+            # Stream time covered so far, across the 26.5 hour wrap of the 33-bit PCR
+            values = pcr[mine]
+            previous = self.pcr_last.get(int(value), values[0])
+            steps = np.diff(values, prepend=previous) % PCR_WRAP
+            self.pcr_span[int(value)] = self.pcr_span.get(int(value), 0) + int(steps.sum())
+            self.pcr_last[int(value)] = values[-1]
+
+    def _pcr_jitter(self, pid):
+        clocks, pcrs = self.pcr_samples[pid]
+        clock = np.concatenate(clocks)[-MAX_PCR_SAMPLES:]
+        pcr = np.concatenate(pcrs)[-MAX_PCR_SAMPLES:]
+        self.pcr_samples[pid] = [[clock], [pcr]]
+        if len(pcr) < 3:
+            return None
+        seconds = np.concatenate(([0], np.cumsum(np.diff(pcr) % PCR_WRAP))) / PCR_HZ
+        if np.ptp(clock) == 0:
+            return None
+        # Whatever the PCR does not share with a straight line through the clock is jitter
+        fit = np.polyval(np.polyfit(clock, seconds, 1), clock)
+        residual = seconds - fit
+        return float(np.sqrt(np.mean(residual ** 2))), float(np.max(np.abs(residual)))
+
+    def duration(self):
+        """ Stream time covered: from the PCR when there is one, else wall clock. """
+        if self.pcr_span:
+            return max(self.pcr_span.values()) / PCR_HZ
+        return (self.last_time - self.started) if self.started is not None else 0.0
+
+    def report(self):
+        duration = self.duration()
+        pids = []
+        for pid in np.flatnonzero(self.counts):
+            bits = int(self.counts[pid]) * TS_PACKET * 8
+            pids.append({"pid": int(pid), "packets": int(self.counts[pid]),
+                         "bitrate": bits / duration if duration else 0.0,
+                         "cc_errors": int(self.cc_errors[pid]), "tei": int(self.tei[pid])})
+        pcr = {}
+        for pid in self.pcr_samples:
+            jitter = self._pcr_jitter(pid)
+            if jitter:
+                pcr[pid] = {"rms_ms": jitter[0] * 1000, "max_ms": jitter[1] * 1000}
+        return {"packets": self.packets, "sync_losses": self.sync_losses, "duration": duration,
+                "bitrate": self.packets * TS_PACKET * 8 / duration if duration else 0.0,
+                "cc_errors": int(self.cc_errors.sum()), "tei": int(self.tei.sum()), "pids": pids, "pcr": pcr}
+
+
+def diagnosis(report):
+    """ One line on where the trouble most likely is. """
+    if report["tei"]:
+        return "Signal: the receiver could not correct some packets (TEI set)"
+    if report["cc_errors"] or report["sync_losses"]:
+        return "Network: packets were lost between the receiver and this computer"
+    if not report["packets"]:
+        return "No data"
+    return "Clean stream"
+
+
+def format_report(report):
+    lines = [f"{report['packets']} packets over {report['duration']:.1f}s, {report['bitrate'] / 1e6:.2f} Mbit/s, "
+             f"{report['cc_errors']} CC errors, {report['tei']} TEI, {report['sync_losses']} sync losses",
+             f"{'PID':>6} {'Mbit/s':>8} {'CC err':>7} {'TEI':>6}"]
+    for entry in sorted(report["pids"], key=lambda entry: -entry["bitrate"]):
+        lines.append(f"{entry['pid']:>6} {entry['bitrate'] / 1e6:>8.3f} {entry['cc_errors']:>7} {entry['tei']:>6}")
+    for pid, jitter in report["pcr"].items():
+        lines.append(f"PCR on PID {pid}: jitter rms {jitter['rms_ms']:.2f} ms, max {jitter['max_ms']:.2f} ms")
+    lines.append(diagnosis(report))
+    return "\n".join(lines)
+
+
+class StreamAnalysis:
+    """ Analyze a live stream URL on a background thread.
+
+    `on_report(report)` is called from that thread about every `interval`
+    seconds and once more when the analysis stops, unless it failed.
+    """
+
+    def __init__(self, url, on_report, on_error=None, interval=1.0, chunk_size=TS_PACKET * 5580):
+        self.url = url
+        self.on_report = on_report
+        self.on_error = on_error
+        self.interval = interval
+        self.buffer = memoryview(bytearray(chunk_size))
+        self.analyzer = TsAnalyzer()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="ts-analysis", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+
+    def _run(self):
+        sock = None
+        try:
+            sock, body = open_stream(self.url)
+            sock.settimeout(self.interval)
+            self.analyzer.feed(body, [(len(body), time.monotonic())])
+            reported = time.monotonic()
+            filled = 0
+            arrivals = []
+            while not self.stopping.is_set():
+                try:
+                    count = sock.recv_into(self.buffer[filled:])
+                except socket.timeout:
+                    count = None
+                if count == 0:
+                    break
+                now = time.monotonic()
+                if count:
+                    filled += count
+                    arrivals.append((filled, now))
+                # Analyze in big chunks, but at least once per report
+                if filled == len(self.buffer) or (filled and now - reported >= self.interval):
+                    self.analyzer.feed(self.buffer[:filled], arrivals)
+                    filled = 0
+                    arrivals = []
+                if now - reported >= self.interval:
+                    reported = now
+                    self.on_report(self.analyzer.report())
+            if filled:
+                self.analyzer.feed(self.buffer[:filled], arrivals)
+            self.on_report(self.analyzer.report())
+        except (OSError, RecordingError) as e:
+            if self.on_error:
+                self.on_error(e)
+        finally:
+            if sock:
+                sock.close()
+
+
+def analyze_file(path, chunk_size=8 * 1024 * 1024):
+    analyzer = TsAnalyzer()
+    with open(path, "rb", buffering=0) as file:
+        buffer = memoryview(bytearray(chunk_size))
+        while True:
+            count = file.readinto(buffer)
+            if not count:
+                break
+            analyzer.feed(buffer[:count])
+    return analyzer.report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze an MPEG-TS capture or live stream.")
+    parser.add_argument("path", nargs="?", help="captured .ts file")
+    parser.add_argument("--url", help="live stream URL instead of a file")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--chunk-mib", type=int, default=8)
+    args = parser.parse_args()
+    if not args.path and not args.url:
+        parser.error("give a file or --url")
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    if args.url:
+        result = {}
+        errors = []
+        analysis = StreamAnalysis(args.url, on_report=lambda report: result.update(report),
+                                  on_error=errors.append).start()
+        analysis.thread.join(args.seconds)
+        analysis.stop()
+        analysis.thread.join()
+        if errors:
+            sys.exit(f"Analysis failed: {errors[0]}")
+        if not result:
+            sys.exit(f"No data from {args.url} within {args.seconds:g}s")
+        report = result
+    else:
+        report = analyze_file(args.path, args.chunk_mib * 1024 * 1024)
+    cpu = time.process_time() - cpu_started
+    print(format_report(report))
+    print(f"Analyzed {report['packets'] * TS_PACKET / 1048576:.1f} MiB in {time.perf_counter() - started:.2f}s "
+          f"({report['packets'] * TS_PACKET * 8 / max(cpu, 1e-9) / 1e6:.0f} Mbit/s per CPU second)")
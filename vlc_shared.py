@@ -0,0 +1,50 @@
+import sys
+import threading
+import time
+
+DEFAULT_ARGS = ("--verbose", "0")
+
+
+class VLCUnavailable(Exception):
+    pass
+
+
+_instance = None
+_lock = threading.Lock()
+init_time = None
+
+
+def get_instance(*args):
+    """ The process-wide libvlc instance, created on first use.
+
+    Initializing libvlc loads its whole plugin cache, so every player in this
+    process (main view, fullscreen, mosaic tiles) shares this one instance.
+    Preview thumbnails are the exception: they are grabbed in worker
+    processes, each with its own headless instance, see `thumbnails`.
+    The front ends call this on a worker thread after the window is shown.
+    """
+    global _instance, init_time
+    with _lock:
+        if _instance is None:
+            started = time.perf_counter()
+            try:
+                import vlc
+                instance = vlc.Instance(*(args or DEFAULT_ARGS))
+            except (ImportError, OSError, NameError) as e:
+                # python-vlc raises NameError when it finds no libvlc to bind to
+                raise VLCUnavailable(e) from e
+            if instance is None:
+                raise VLCUnavailable("libvlc failed to initialize")
+            _instance = instance
+            init_time = time.perf_counter() - started
+        return _instance
+
+
+def attach_to_widget(player, window_id):
+    """ Render `player`'s video into the native window `window_id`. """
+    if sys.platform.startswith('linux'):
+        player.set_xwindow(window_id)
+    elif sys.platform == "win32":
+        player.set_hwnd(window_id)
+    elif sys.platform == "darwin":
+        player.set_nsobject(window_id)
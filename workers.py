@@ -0,0 +1,100 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Task:
+    """ Handle passed to a background function.
+
+    The function may call `report(value)` to push partial results to the GUI
+    thread; once the task has been superseded `report` raises `Cancelled` so
+    long-running work stops early.
+    """
+
+    def __init__(self, report=None):
+        self._cancelled = threading.Event()
+        self._report = report
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled()
+
+    def report(self, value):
+        self.check()
+        if self._report:
+            self._report(value)
+
+
+class TkWorker:
+    """ Run functions on a thread pool and deliver their results in Tk's mainloop.
+
+    Tk widgets must only be touched from the GUI thread, so worker threads put
+    their results on a queue which is drained with `after()`. Every submission
+    belongs to a named slot; submitting again to the same slot cancels the
+    previous task, so at most one result per slot ever reaches the GUI.
+    """
+
+    def __init__(self, root, max_workers=4, poll_interval=30):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.results = queue.SimpleQueue()
+        self.slots = {}
+        self._always = Task()
+        self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, slot, fn, on_done, on_error=None, on_progress=None):
+        self.cancel(slot)
+        task = Task(report=lambda value: self.results.put((task, on_progress, value)))
+        future = self.pool.submit(self._run, task, fn, on_done, on_error)
+        self.slots[slot] = (task, future)
+        return task
+
+    def call_soon(self, callback, *args):
+        """ Run `callback(*args)` in the mainloop; safe to call from any thread. """
+        self.results.put((self._always, lambda values: callback(*values), args))
+
+    def cancel(self, slot):
+        previous = self.slots.pop(slot, None)
+        if previous:
+            task, future = previous
+            task.cancel()
+            future.cancel()
+
+    def shutdown(self):
+        for slot in list(self.slots):
+            self.cancel(slot)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, task, fn, on_done, on_error):
+        if task.cancelled:
+            return
+        try:
+            result = fn(task)
+        except Cancelled:
+            return
+        except Exception as e:
+            self.results.put((task, on_error, e))
+            return
+        self.results.put((task, on_done, result))
+
+    def _poll(self):
+        try:
+            while True:
+                task, callback, value = self.results.get_nowait()
+                if callback and not task.cancelled:
+                    callback(value)
+        except queue.Empty:
+            pass
+        self.root.after(self.poll_interval, self._poll)
@@ -0,0 +1,259 @@
+""" Channel zapping with zap-time measurement and neighbour prefetch.
+
+A zap is timed from the click to the first video output libvlc reports
+(`MediaPlayerVout`). Radio services never get one and are not counted.
+
+After every zap the services just above and below the selection, the recently
+watched ones and the most watched ones have their /proginfo fetched in the
+background. That gives the audio PID the stream URL needs, so the corrected
+URL and its `vlc.Media` are ready before the user gets there. Media are
+created but not pre-parsed: parsing a SAT>IP URL opens the stream, which
+would re-tune the receiver away from the channel being watched.
+
+The player can be attached after construction, so the window does not wait
+for libvlc to start: a service asked for before that plays on `attach`.
+
+Every zap is also recorded in `telemetry.metrics`: time to the stream opening
+(first buffering event), to the buffer filling, to playing, to the first
+frame and to the audio tracks being known, plus rebuffering after that.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from stb_client import STBError, audio_pid_of, corrected_stream_url
+from telemetry import metrics
+
+
+class ZapStats:
+    """ Zap times of the last `maxlen` zaps, in seconds. """
+
+    def __init__(self, maxlen=500):
+        self.samples = deque(maxlen=maxlen)
+        self.prepared = deque(maxlen=maxlen)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def record(self, seconds, prepared):
+        self.samples.append(seconds)
+        self.prepared.append(prepared)
+
+    def percentile(self, fraction):
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))] if samples else float("nan")
+
+    def __str__(self):
+        if not self.samples:
+            return "no zaps measured"
+        prepared = sum(self.prepared) / len(self.prepared) * 100
+        return (f"{len(self.samples)} zaps: p50 {self.percentile(0.5) * 1000:.0f} ms, "
+                f"p90 {self.percentile(0.9) * 1000:.0f} ms, p99 {self.percentile(0.99) * 1000:.0f} ms, "
+                f"max {max(self.samples) * 1000:.0f} ms ({prepared:.0f}% from prefetched media)")
+
+
+class Zapper:
+    """ Plays services on `player` and keeps the likely next ones ready.
+
+    Call `start` when the user asks for a service, `play` once its program
+    info is known and `prefetch` with the services around the selection.
+    """
+
+    def __init__(self, instance=None, player=None, recent=8, frequent=4, max_prepared=32, max_workers=2):
+        self.instance = None
+        self.player = None
+        self.recent = deque(maxlen=recent)
+        self.frequent = frequent
+        self.plays = Counter()
+        self.max_prepared = max_prepared
+        self.prepared = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="zap-prefetch")
+        self.generation = 0
+        self.stats = ZapStats()
+        self.current_url = None
+        self.pending = None
+        # Telemetry of the current zap: start time, buffering start, whether it
+        # has played yet and whether its audio tracks were reported
+        self.timeline = None
+        # Service id -> (audio PID, track name) the user picked, see CatalogCache
+        self.audio_choices = {}
+        self.relay = None
+        # Extra libvlc options for a stream URL, see playback_supervisor
+        self.media_options = lambda url: ()
+        self.events = None
+        if player is not None:
+            self.attach(instance, player)
+
+    def attach(self, instance, player):
+        """ Play on `player` from now on, starting with the service already asked for. """
+        import vlc
+
+        self.instance = instance
+        self.player = player
+        # python-vlc frees the callbacks along with this wrapper, so keep it
+        self.events = events = player.event_manager()
+        events.event_attach(vlc.EventType.MediaPlayerVout, self._on_video_output)
+        events.event_attach(vlc.EventType.MediaPlayerBuffering, self._on_buffering)
+        events.event_attach(vlc.EventType.MediaPlayerPlaying, self._on_playing)
+        events.event_attach(vlc.EventType.MediaPlayerEncounteredError, self._on_error)
+        self.restart()
+
+    def set_relay(self, relay):
+        """ Play through a `stream_relay.StreamRelay`, or directly for None. """
+        self.relay = relay
+        with self.lock:
+            self.prepared.clear()
+
+    def media_url(self, url):
+        return self.relay.url_for(url) if self.relay else url
+
+    def _media_key(self, url):
+        return self.media_url(url), tuple(self.media_options(url))
+
+    def _new_media(self, key):
+        media_url, options = key
+        return self.instance.media_new(media_url, *options)
+
+    def restart(self):
+        """ Reopen the current stream, e.g. after switching the relay on or off. """
+        if self.current_url and self.player:
+            self.player.set_media(self._new_media(self._media_key(self.current_url)))
+            self.player.play()
+
+    def start(self, service):
+        """ Start the zap clock for `service`. """
+        started = time.perf_counter()
+        self.pending = [service["id"], started, False]
+        self.timeline = [started, None, False, False]
+
+    def audio_pid(self, service_id, info=None):
+        """ The audio PID the user picked for the service, else the one in `info`. """
+        choice = self.audio_choices.get(service_id)
+        if choice:
+            return choice[0]
+        return audio_pid_of(info) if info else None
+
+    def can_play(self, service_id):
+        """ True if `play` needs no program info for this service. """
+        return service_id in self.audio_choices
+
+    def play(self, service, info=None):
+        """ Play `service` on its remembered or broadcast audio PID; returns the stream URL. """
+        if not self.pending or self.pending[0] != service["id"]:
+            self.start(service)
+        url = corrected_stream_url(service["url"], self.audio_pid(service["id"], info))
+        with self.lock:
+            prepared = self.prepared.pop(service["id"], None)
+        self.current_url = url
+        if service["id"] in self.recent:
+            self.recent.remove(service["id"])
+        self.recent.appendleft(service["id"])
+        self.plays[service["id"]] += 1
+        if self.player is None:
+            # libvlc is still starting; attach() plays it
+            return url
+        key = self._media_key(url)
+        if prepared and prepared[0] == key:
+            media = prepared[1]
+            self.pending[2] = True
+        else:
+            media = self._new_media(key)
+        self.player.set_media(media)
+        self.player.play()
+        return url
+
+    def prefetch_targets(self, nearby, services_by_id):
+        """ `nearby` services followed by the recent and most played ones. """
+        targets = OrderedDict((service["id"], service) for service in nearby)
+        for service_id in list(self.recent) + [service_id for service_id, _ in self.plays.most_common(self.frequent)]:
+            service = services_by_id(service_id)
+            if service is not None:
+                targets.setdefault(service_id, service)
+        if self.recent:
+            targets.pop(self.recent[0], None)
+        return list(targets.values())
+
+    def prefetch(self, client, services):
+        """ Prepare URLs and media for `services` in the background.
+
+        A newer call supersedes the services an older one has not reached yet.
+        """
+        self.generation += 1
+        self.executor.submit(self._prepare_all, client, services, self.generation)
+
+    def _prepare_all(self, client, services, generation):
+        for service in services:
+            if generation != self.generation:
+                return
+            info = None
+            if not self.can_play(service["id"]):
+                try:
+                    info = client.cached_proginfo(service["id"], volatile=False)
+                except STBError as e:
+                    print(f"Prefetch of {service['servicename']} failed: {e}")
+                    continue
+            if self.instance is None:
+                # The program info is cached now; media need libvlc
+                continue
+            key = self._media_key(corrected_stream_url(service["url"], self.audio_pid(service["id"], info)))
+            with self.lock:
+                prepared = self.prepared.get(service["id"])
+                if prepared and prepared[0] == key:
+                    self.prepared.move_to_end(service["id"])
+                    continue
+            media = self._new_media(key)
+            with self.lock:
+                self.prepared[service["id"]] = (key, media)
+                while len(self.prepared) > self.max_prepared:
+                    self.prepared.popitem(last=False)
+
+    def _on_video_output(self, event):
+        # Runs on a libvlc thread; the count drops back to 0 when playback stops
+        pending = self.pending
+        if pending and event.u.new_count > 0:
+            self.pending = None
+            service_id, started, prepared = pending
+            elapsed = time.perf_counter() - started
+            self.stats.record(elapsed, prepared)
+            metrics.observe("zap_seconds", elapsed, prefetched="yes" if prepared else "no")
+            print(f"Zap to service {service_id}: {elapsed * 1000:.0f} ms{' (prefetched)' if prepared else ''}")
+
+    def _on_buffering(self, event):
+        # libvlc reports the cache filling in steps up to 100%; a drop below
+        # that after playing has started is a stall
+        timeline = self.timeline
+        if timeline is None:
+            return
+        now = time.perf_counter()
+        if event.u.new_cache < 100:
+            if timeline[1] is None:
+                metrics.increment("vlc_events_total", event="buffering")
+                if not timeline[2]:
+                    metrics.observe("stream_open_seconds", now - timeline[0])
+                timeline[1] = now
+        elif timeline[1] is not None:
+            metrics.observe("buffering_seconds", now - timeline[1], phase="rebuffer" if timeline[2] else "start")
+            timeline[1] = None
+
+    def _on_playing(self, event):
+        timeline = self.timeline
+        metrics.increment("vlc_events_total", event="playing")
+        if timeline and not timeline[2]:
+            timeline[2] = True
+            metrics.observe("playback_start_seconds", time.perf_counter() - timeline[0])
+
+    def _on_error(self, event):
+        metrics.increment("vlc_events_total", event="error")
+
+    def audio_tracks_found(self):
+        """ Record the time from the click to the audio tracks being known, once per zap. """
+        timeline = self.timeline
+        if timeline and not timeline[3]:
+            timeline[3] = True
+            metrics.observe("audio_tracks_seconds", time.perf_counter() - timeline[0])
+
+    def shutdown(self):
+        self.generation += 1
+        self.executor.shutdown(wait=False, cancel_futures=True)